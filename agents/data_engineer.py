@@ -5,7 +5,7 @@ Data Engineer Agent - 数据工程师
 from crewai import Agent
 from tools.nl2sql import nl2sql, get_schema_info, refresh_schema
 from tools.sql_tool import sql_query_md, get_database_schema
-from tools.csv_tool import csv_query, get_csv_schema, csv_filter
+from tools.csv_tool import csv_query, get_csv_schema, csv_filter, csv_aggregate, csv_sql
 
 
 def create_data_engineer() -> Agent:
@@ -28,7 +28,9 @@ def create_data_engineer() -> Agent:
         2. CSV 文件（data/ 目录）
            - get_csv_schema() - 查看可用 CSV
            - csv_query() - 查询 CSV 数据
-           - csv_filter() - 过滤数据
+           - csv_filter() - 过滤数据（支持 >=、in、between、contains 和按月过滤日期）
+           - csv_aggregate() - 分组汇总（求和、均值、计数、分位数等）
+           - csv_sql() - 用 SQL 汇总/关联 CSV 数据（统计类问题优先使用）
         
         工作流程：
         1. 理解用户问题
@@ -51,7 +53,7 @@ def create_data_engineer() -> Agent:
             # SQL 工具
             nl2sql, sql_query_md, get_schema_info, get_database_schema, refresh_schema,
             # CSV 工具
-            csv_query, get_csv_schema, csv_filter
+            csv_query, get_csv_schema, csv_filter, csv_aggregate, csv_sql
         ],
         verbose=True,
         allow_delegation=False
@@ -17,6 +17,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from crew import DataAnalysisCrew
 from api.models import QueryRequest, QueryResponse, QueryHistory, HealthCheck
 from api.services import AnalysisService, StorageService
+from tools.db_pool import get_pool_stats, dispose_all
 
 # 创建 FastAPI 应用
 app = FastAPI(
@@ -59,7 +60,7 @@ async def root():
 @app.get("/health", response_model=HealthCheck)
 async def health_check():
     """健康检查"""
-    db_status = storage_service.check_connection()
+    db_status = await storage_service.check_connection_async()
     
     return HealthCheck(
         status="healthy" if db_status else "unhealthy",
@@ -116,10 +117,10 @@ async def analyze_question(
             timestamp=datetime.now()
         )
         
-        # 异步保存到数据库
+        # 后台异步保存到数据库（不占用请求线程）
         if request.save_result:
             background_tasks.add_task(
-                storage_service.save_query_result,
+                storage_service.save_query_result_async,
                 query_id=response.query_id,
                 question=request.question,
                 result=result,
@@ -154,7 +155,7 @@ async def get_query_history(
         获取数据 → Web → 输入: http://localhost:8000/api/v1/history?limit=100
     """
     try:
-        history = storage_service.get_query_history(
+        history = await storage_service.get_query_history_async(
             user_id=user_id,
             limit=limit,
             offset=skip
@@ -178,6 +179,25 @@ async def get_query_history(
         raise HTTPException(status_code=500, detail=f"获取历史失败: {str(e)}")
 
 
+@app.get("/api/v1/pool-stats")
+async def pool_stats():
+    """
+    数据库连接池状态 - 用于观察并发负载下的连接占用和等待
+    
+    返回每个共享连接池的常驻/溢出连接数、当前占用、饱和度，
+    以及取连接的平均/最长等待时间和超时次数
+    """
+    return get_pool_stats()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """服务退出时关闭共享连接池（异步连接只能在事件循环中关闭，先关闭存储服务的异步引擎）"""
+    if storage_service.async_engine is not None:
+        await storage_service.async_engine.dispose()
+    dispose_all()
+
+
 # ============================================
 # 启动服务
 # ============================================
@@ -189,6 +209,7 @@ if __name__ == "__main__":
     print("API Docs: http://localhost:8000/docs")
     print("Analyze API: POST http://localhost:8000/api/v1/analyze")
     print("History API: GET http://localhost:8000/api/v1/history")
+    print("Pool Stats: GET http://localhost:8000/api/v1/pool-stats")
     print("=" * 60)
     
     uvicorn.run(
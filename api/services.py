@@ -5,18 +5,20 @@ API 业务服务层 - 精简版
 import os
 import sys
 import uuid
+import asyncio
 import time
 import json
 import pandas as pd
 from typing import Dict, List, Optional, Any
 from datetime import datetime
-from sqlalchemy import create_engine, text, Table, Column, Integer, String, Float, DateTime, MetaData, Text
+from sqlalchemy import text, Table, Column, Integer, String, Float, DateTime, MetaData, Text
 from sqlalchemy.exc import SQLAlchemyError
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from crew import DataAnalysisCrew
 from api.models import QueryHistory, QueryStatus
+from tools.db_pool import get_engine, get_async_engine, build_mysql_url
 
 
 # ============================================
@@ -81,9 +83,9 @@ class AnalysisService:
             if conversation_history:
                 print(f"[AnalysisService] 对话历史: {len(conversation_history)} 条")
             
-            # 执行 CrewAI 分析
+            # 执行 CrewAI 分析（同步阻塞，放到线程池中执行，避免阻塞事件循环上的其他请求）
             crew = self._get_crew()
-            result = crew.kickoff(full_question)
+            result = await asyncio.to_thread(crew.kickoff, full_question)
             
             # 解析结果
             parsed_result = self._parse_crew_result(result, question)
@@ -210,6 +212,7 @@ class StorageService:
     
     def __init__(self):
         self.engine = None
+        self.async_engine = None
         self.metadata = MetaData()
         self._init_engine()
         self._create_tables()
@@ -218,11 +221,9 @@ class StorageService:
         """初始化数据库"""
         try:
             from config import DB_CONFIG
-            connection_string = (
-                f"mysql+mysqlconnector://{DB_CONFIG['user']}:{DB_CONFIG['password']}"
-                f"@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
-            )
-            self.engine = create_engine(connection_string, pool_pre_ping=True)
+            self.engine = get_engine(build_mysql_url(DB_CONFIG))  # 与 SQL 工具共用连接池
+            # 异步驱动未安装时为 None，异步接口改在线程池中调用同步方法
+            self.async_engine = get_async_engine(build_mysql_url(DB_CONFIG))
             print("[StorageService] 数据库连接成功")
         except Exception as e:
             print(f"[StorageService] 数据库连接失败: {e}")
@@ -230,7 +231,7 @@ class StorageService:
     def _create_tables(self):
         """创建数据表"""
         # 查询历史表
-        Table(
+        self.history_table = Table(
             'api_query_history', self.metadata,
             Column('id', Integer, primary_key=True, autoincrement=True),
             Column('query_id', String(100), unique=True, nullable=False),
@@ -262,6 +263,45 @@ class StorageService:
         except:
             return False
     
+    async def check_connection_async(self) -> bool:
+        """检查数据库连接（异步版本）"""
+        if self.async_engine is None:
+            return await asyncio.to_thread(self.check_connection)
+        
+        try:
+            async with self.async_engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+            return True
+        except:
+            return False
+    
+    def _history_record(self, query_id: str, question: str, result: Dict[str, Any],
+                        user_id: Optional[str]) -> Dict[str, Any]:
+        """构建一条查询历史记录"""
+        return {
+            'query_id': query_id,
+            'question': question,
+            'user_id': user_id,
+            'status': result.get('status', 'unknown'),
+            'executed_sql': result.get('sql', ''),
+            'result_rows': len(result.get('data', [])),
+            'execution_time': result.get('execution_time', 0)
+        }
+    
+    def _history_query(self, user_id: Optional[str], limit: int, offset: int):
+        """构建查询历史的 SQL 和参数"""
+        query = "SELECT * FROM api_query_history"
+        params = {}
+        
+        if user_id:
+            query += " WHERE user_id = :user_id"
+            params['user_id'] = user_id
+        
+        query += " ORDER BY created_at DESC LIMIT :limit OFFSET :offset"
+        params['limit'] = limit
+        params['offset'] = offset
+        return text(query), params
+    
     def save_query_result(
         self,
         query_id: str,
@@ -271,15 +311,7 @@ class StorageService:
     ):
         """保存查询结果"""
         try:
-            query_history = {
-                'query_id': query_id,
-                'question': question,
-                'user_id': user_id,
-                'status': result.get('status', 'unknown'),
-                'executed_sql': result.get('sql', ''),
-                'result_rows': len(result.get('data', [])),
-                'execution_time': result.get('execution_time', 0)
-            }
+            query_history = self._history_record(query_id, question, result, user_id)
             
             df_history = pd.DataFrame([query_history])
             df_history.to_sql('api_query_history', self.engine, if_exists='append', index=False)
@@ -297,20 +329,52 @@ class StorageService:
     ) -> List[QueryHistory]:
         """获取查询历史"""
         try:
-            query = "SELECT * FROM api_query_history"
-            params = {}
+            query, params = self._history_query(user_id, limit, offset)
+            df = pd.read_sql(query, self.engine, params=params)
             
-            if user_id:
-                query += " WHERE user_id = :user_id"
-                params['user_id'] = user_id
+            return [QueryHistory(**row.to_dict()) for _, row in df.iterrows()]
             
-            query += " ORDER BY created_at DESC LIMIT :limit OFFSET :offset"
-            params['limit'] = limit
-            params['offset'] = offset
+        except Exception as e:
+            print(f"[StorageService] 获取历史失败: {e}")
+            return []
+    
+    async def save_query_result_async(
+        self,
+        query_id: str,
+        question: str,
+        result: Dict[str, Any],
+        user_id: Optional[str] = None
+    ):
+        """保存查询结果（异步版本）"""
+        if self.async_engine is None:
+            return await asyncio.to_thread(self.save_query_result, query_id, question, result, user_id)
+        
+        try:
+            query_history = self._history_record(query_id, question, result, user_id)
+            async with self.async_engine.begin() as conn:
+                await conn.execute(self.history_table.insert().values(**query_history))
             
-            df = pd.read_sql(text(query), self.engine, params=params)
+            print(f"[StorageService] 查询结果已保存: {query_id}")
             
-            return [QueryHistory(**row.to_dict()) for _, row in df.iterrows()]
+        except Exception as e:
+            print(f"[StorageService] 保存失败: {e}")
+    
+    async def get_query_history_async(
+        self,
+        user_id: Optional[str] = None,
+        limit: int = 50,
+        offset: int = 0
+    ) -> List[QueryHistory]:
+        """获取查询历史（异步版本）"""
+        if self.async_engine is None:
+            return await asyncio.to_thread(self.get_query_history, user_id, limit, offset)
+        
+        try:
+            query, params = self._history_query(user_id, limit, offset)
+            async with self.async_engine.connect() as conn:
+                rows = (await conn.execute(query, params)).mappings().all()
+            
+            return [QueryHistory(**row) for row in rows]
             
         except Exception as e:
             print(f"[StorageService] 获取历史失败: {e}")
@@ -26,6 +26,67 @@ DB_CONFIG = {
     "database": "chinook",       # 数据库名称
 }
 
+# 连接池配置（可选，未配置时使用默认值；SQL 工具、Schema 读取和 API 存储服务共用）
+DB_POOL_CONFIG = {
+    "pool_size": 5,                      # 常驻连接数
+    "max_overflow": 10,                  # 高峰时允许额外创建的连接数
+    "pool_timeout": 30,                  # 连接全部占用时等待空闲连接的秒数
+    "pool_recycle": 1800,                # 连接使用超过该秒数后重建，避免被 MySQL wait_timeout 断开
+    "pool_pre_ping": True,               # 取出连接前先探活
+    "slow_checkout_ms": 100,             # 取连接等待超过该毫秒数记为一次慢等待（见 /api/v1/pool-stats）
+}
+
+# Schema 缓存配置（可选，未配置时使用默认值）
+SCHEMA_CONFIG = {
+    "cache_enabled": True,               # 把生成的 Schema 缓存到磁盘，重启后直接加载
+    "cache_dir": "data/.cache/schema",   # 缓存目录（按数据库 host:port/库名 分文件保存）
+    "verify_interval": 300,              # 后台检查表结构指纹的间隔（秒），变化时重建缓存；None 表示只在启动时检查一次
+    "data_ttl": 3600,                    # 行数、示例值等随数据变化的缓存项的有效期（秒），None 表示只在表结构变化时重建
+    "relevant_tables": 5,                # NL2SQL 提示词中按问题检索选取的表数（另加外键路径上的中间表）
+    "full_schema_max_tables": 15,        # 表数不超过该值时直接使用完整 Schema
+    "index_sample_values": False,        # 检索索引是否包含各表的示例值：读取每张表前几行的文本值，
+                                         # 可能含姓名、邮箱等个人信息，并随 Schema 缓存写入 cache_dir
+    "glossary": {},                      # 额外的中文术语 -> 英文表名/列名单词，例如 {"会员": "customer member"}
+}
+
+# ====================================
+# CSV 数据源配置（可选，未配置时使用默认值）
+# ====================================
+CSV_CONFIG = {
+    "cache_enabled": True,               # 首次解析后写入 Feather 列式缓存（需要 pyarrow）
+    "cache_dir": None,                   # 缓存目录，默认为 data/.cache
+    "cache_compression": "uncompressed", # 不压缩时可零拷贝内存映射，也可设为 "lz4" / "zstd"
+    "stream_threshold_mb": 512,          # 超过该大小的 CSV 按块流式查询，不整表载入内存（首次完整扫描时写入分块列式缓存）
+    "stream_chunk_rows": 100000,         # 流式查询每块读取的行数
+    "mask_block_rows": 1000000,          # 内存查询时分块计算过滤掩码，命中 limit 即停止
+    "index_min_rows": 10000,             # 行数达到该值的表才为常用过滤列建立索引
+    "optimize_dtypes": True,             # 加载时压缩列类型（类别化、数值降位、解析日期）
+    "category_max_ratio": 0.5,           # 去重值占比不超过该值的字符串列转为 category
+    "column_stats": True,                # 加载时计算列统计信息，丰富 Schema 并跳过不可能满足的条件
+    "preload": False,                    # 启动时用进程池并行预加载所有表（也可以是表名列表）
+    "ingest_workers": None,              # 预加载进程数，默认为 CPU 核数
+    "watch_interval": 60,                # 轮询数据目录变化的间隔（秒），0 表示不监听
+    "memory_budget_mb": 1024,            # 已加载表的内存上限，超出时换出最久未查询的表（None 表示不限制）
+}
+
+# ====================================
+# SQL 查询配置（可选，未配置时使用默认值）
+# ====================================
+SQL_CONFIG = {
+    "result_cache": True,                # 缓存 SELECT 查询结果（按规范化后的 SQL 文本，忽略注释、空白和关键字大小写；标识符、别名和 SELECT 输出列表区分大小写）
+    "result_cache_ttl": 300,             # 缓存结果的有效期（秒），None 表示不过期
+    "result_cache_entries": 256,         # 最多缓存的查询数，超出时淘汰最久未使用的结果
+    "result_cache_mb": 64,               # 缓存结果的总内存上限
+    "max_rows": 1000,                    # 单次查询最多取回的行数，超出部分只计数（结果中提示已截断）
+    "max_result_mb": 16,                 # 单次查询取回数据的估算内存上限
+    "fetch_size": 500,                   # 每批从结果集读取的行数
+    "auto_limit": True,                  # 最外层没有 LIMIT 时自动补上
+    "statement_timeout_ms": 30000,       # 单条查询的执行超时（MySQL MAX_EXECUTION_TIME），None 表示不限制
+    "cost_guard": True,                  # 执行前用 EXPLAIN 估算代价，超过上限的查询直接拒绝并提示 Agent 修改
+    "max_explain_rows": 10_000_000,      # 允许的估算扫描行数（连接中各表估算行数之积）
+    "max_query_cost": None,              # 允许的优化器代价（EXPLAIN FORMAT=JSON 的 query_cost），None 表示不检查
+}
+
 # ====================================
 # 其他配置
 # ====================================
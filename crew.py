@@ -2,31 +2,37 @@
 Crew 编排层 - 定义多 Agent 任务流程
 协调 DataEngineer、BizAnalyst 和 Reporter 完成数据分析任务
 """
-from crewai import Crew, Task, Process
+from crewai import Agent, Crew, Task, Process
 from agents.data_engineer import create_data_engineer
 from agents.biz_analyst import create_biz_analyst
 from agents.reporter import create_reporter
 
 
 class DataAnalysisCrew:
-    """数据分析 Crew - 协调多个 Agent 完成分析任务"""
+    """
+    数据分析 Crew - 协调多个 Agent 完成分析任务
     
-    def __init__(self):
-        """初始化 Agents"""
-        self.data_engineer = create_data_engineer()
-        self.biz_analyst = create_biz_analyst()
-        self.reporter = create_reporter()
+    Agent 会记录执行过程中的状态，每次 kickoff 都新建一组，
+    API 服务在线程池中并发执行多个请求时互不干扰
+    """
     
-    def create_tasks(self, question: str) -> list[Task]:
+    def create_agents(self) -> tuple[Agent, Agent, Agent]:
+        """创建本次分析使用的 Agents：(数据工程师, 业务分析师, 报告撰写)"""
+        return create_data_engineer(), create_biz_analyst(), create_reporter()
+    
+    def create_tasks(self, question: str, agents: tuple[Agent, Agent, Agent]) -> list[Task]:
         """
         创建任务流程
         
         参数:
             question: 用户的业务问题
+            agents: create_agents 创建的 Agents
         
         返回:
             任务列表
         """
+        data_engineer, biz_analyst, reporter = agents
+        
         # 任务 1：数据提取（DataEngineer）
         task_extract_data = Task(
             description=f"""
@@ -51,7 +57,7 @@ class DataAnalysisCrew:
             
             输出要求：包含实际查询结果的 Markdown 表格
             """,
-            agent=self.data_engineer,
+            agent=data_engineer,
             expected_output="包含真实数据的 Markdown 格式查询结果表格（不能是空表格或编造的数据）"
         )
         
@@ -79,7 +85,7 @@ class DataAnalysisCrew:
             - 示例："USA 客户消费 $1,234，占比 22%"
             - 不要泛泛而谈
             """,
-            agent=self.biz_analyst,
+            agent=biz_analyst,
             expected_output="2-3 条基于真实数据的关键业务洞察（必须包含具体数字）",
             context=[task_extract_data]  # 依赖第一个任务的输出
         )
@@ -118,7 +124,7 @@ class DataAnalysisCrew:
             - 语言简洁专业
             - 建议必须基于数据
             """,
-            agent=self.reporter,
+            agent=reporter,
             expected_output="基于真实数据的完整 Markdown 格式管理层报告（必须包含完整的数据表格和洞察）",
             context=[task_extract_data, task_analyze_insights]  # 依赖前两个任务
         )
@@ -140,12 +146,13 @@ class DataAnalysisCrew:
         print(f"问题: {question}")
         print(f"{'='*60}\n")
         
-        # 创建任务
-        tasks = self.create_tasks(question)
+        # 创建 Agents 和任务
+        agents = self.create_agents()
+        tasks = self.create_tasks(question, agents)
         
         # 创建 Crew
         crew = Crew(
-            agents=[self.data_engineer, self.biz_analyst, self.reporter],
+            agents=list(agents),
             tasks=tasks,
             process=Process.sequential,  # 顺序执行
             verbose=True
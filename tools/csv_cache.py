@@ -0,0 +1,284 @@
+"""
+CSV Cache - CSV 文件的列式磁盘缓存
+首次解析 CSV 后写入 Feather 旁路文件，源文件未变化时直接内存映射读取；
+超过流式阈值的大文件在首次流式扫描时按块写入，之后按记录批逐块读取
+"""
+import os
+import json
+import hashlib
+import pandas as pd
+from typing import Optional
+
+# 列式缓存依赖 pyarrow（可选）
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    USE_COLUMNAR_CACHE = True
+except ImportError:
+    USE_COLUMNAR_CACHE = False
+
+
+FINGERPRINT_BYTES = 64 * 1024  # 前缀指纹取文件开头和截止位置前各 64KB
+
+
+def prefix_fingerprint(filepath: str, size: int) -> Optional[dict]:
+    """
+    计算文件前 size 字节的指纹（开头和末尾各一段的哈希）
+    
+    用于判断文件是否只在末尾追加了数据：追加后旧长度范围内的指纹不变。
+    前 size 字节不是以换行结尾时返回 None（最后一行可能不完整，不能按追加处理）；
+    压缩文件无法按字节追加，同样返回 None
+    """
+    if not filepath.lower().endswith(".csv"):
+        return None
+    
+    with open(filepath, "rb") as f:
+        head = f.read(min(size, FINGERPRINT_BYTES))
+        f.seek(max(size - FINGERPRINT_BYTES, 0))
+        tail = f.read(size - max(size - FINGERPRINT_BYTES, 0))
+    
+    if not tail.endswith(b"\n"):
+        return None
+    
+    return {
+        "size": size,
+        "head": hashlib.md5(head).hexdigest(),
+        "tail": hashlib.md5(tail).hexdigest()
+    }
+
+
+class ColumnarCache:
+    """CSV 列式缓存管理类"""
+    
+    CACHE_VERSION = 3  # 2: 缓存中保存压缩后的列类型；3: 记录前缀指纹以支持追加
+    
+    def __init__(self, cache_dir: str, compression: str = "uncompressed"):
+        """
+        初始化列式缓存
+        
+        参数:
+            cache_dir: 缓存文件目录
+            compression: Feather 压缩方式（uncompressed 时可零拷贝内存映射）
+        """
+        self.cache_dir = cache_dir
+        self.compression = compression
+        os.makedirs(cache_dir, exist_ok=True)
+    
+    def _paths(self, filepath: str) -> tuple[str, str]:
+        """根据源文件路径计算缓存文件和元数据文件路径"""
+        abspath = os.path.abspath(filepath)
+        digest = hashlib.md5(abspath.encode("utf-8")).hexdigest()[:12]
+        base = f"{os.path.basename(filepath)}.{digest}"
+        return (
+            os.path.join(self.cache_dir, f"{base}.feather"),
+            os.path.join(self.cache_dir, f"{base}.meta.json")
+        )
+    
+    @staticmethod
+    def _signature(filepath: str) -> dict:
+        """源文件签名：大小 + 修改时间"""
+        stat = os.stat(filepath)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    
+    def current_path(self, filepath: str) -> Optional[str]:
+        """
+        返回与源文件一致的缓存文件路径（源文件大小和修改时间均未变化），没有有效缓存时返回 None
+        """
+        data_path, meta_path = self._paths(filepath)
+        if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+            return None
+        
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        
+        if meta.get("version") != self.CACHE_VERSION:
+            return None
+        if meta.get("source") != self._signature(filepath):
+            return None
+        return data_path
+    
+    def load(self, filepath: str) -> Optional[pd.DataFrame]:
+        """
+        读取缓存（源文件大小和修改时间均未变化时才命中）
+        
+        参数:
+            filepath: CSV 源文件路径
+        
+        返回:
+            缓存的 DataFrame，未命中时返回 None
+        """
+        data_path = self.current_path(filepath)
+        if data_path is None:
+            return None
+        
+        try:
+            return feather.read_feather(data_path, memory_map=True)
+        except Exception as e:
+            print(f"⚠️  读取列式缓存失败 {os.path.basename(filepath)}: {e}")
+            return None
+    
+    def load_prefix(self, filepath: str) -> tuple[Optional[pd.DataFrame], int]:
+        """
+        读取缓存，源文件只在末尾追加过数据时也算命中
+        
+        参数:
+            filepath: CSV 源文件路径
+        
+        返回:
+            (缓存的 DataFrame, 缓存覆盖的源文件字节数)；未命中时返回 (None, 0)
+        """
+        df = self.load(filepath)
+        if df is not None:
+            return df, os.path.getsize(filepath)
+        
+        data_path, meta_path = self._paths(filepath)
+        if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+            return None, 0
+        
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            
+            fingerprint = meta.get("fingerprint")
+            if meta.get("version") != self.CACHE_VERSION or not fingerprint:
+                return None, 0
+            if os.path.getsize(filepath) <= fingerprint["size"]:
+                return None, 0
+            if prefix_fingerprint(filepath, fingerprint["size"]) != fingerprint:
+                return None, 0
+            
+            return feather.read_feather(data_path, memory_map=True), fingerprint["size"]
+        except Exception as e:
+            print(f"⚠️  读取列式缓存失败 {os.path.basename(filepath)}: {e}")
+            return None, 0
+    
+    def save(self, filepath: str, df: pd.DataFrame, covered: Optional[int] = None):
+        """
+        写入缓存（先写临时文件再原子替换）
+        
+        参数:
+            filepath: CSV 源文件路径
+            df: 解析后的 DataFrame
+            covered: df 对应的源文件字节数，默认整个文件；小于文件大小时（末尾有未写完的半行）
+                只记录前缀指纹，下次读取时按追加处理，从该位置继续解析
+        """
+        data_path, _ = self._paths(filepath)
+        source = self._signature(filepath)
+        try:
+            feather.write_feather(df, data_path + ".tmp", compression=self.compression)
+            self._commit(filepath, source, covered)
+        except Exception as e:
+            print(f"⚠️  写入列式缓存失败 {os.path.basename(filepath)}: {e}")
+    
+    def _commit(self, filepath: str, source: dict, covered: Optional[int] = None):
+        """把写好的临时缓存文件替换到位，并写入元数据（source 为写入前的源文件签名）"""
+        data_path, meta_path = self._paths(filepath)
+        size = source["size"] if covered is None else covered
+        meta = {
+            "version": self.CACHE_VERSION,
+            "source": source if size == source["size"] else None,
+            "fingerprint": prefix_fingerprint(filepath, size),
+            "filepath": os.path.abspath(filepath)
+        }
+        os.replace(data_path + ".tmp", data_path)
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(meta_path + ".tmp", meta_path)
+    
+    def iter_chunks(self, filepath: str, columns: Optional[list] = None):
+        """
+        按记录批逐块读取缓存（内存映射，不整表载入内存）
+        
+        参数:
+            filepath: CSV 源文件路径
+            columns: 只读取这些列，默认全部列
+        
+        返回:
+            产出 DataFrame 的生成器；没有与源文件一致的缓存时返回 None
+        """
+        data_path = self.current_path(filepath)
+        if data_path is None:
+            return None
+        return self._read_batches(data_path, columns)
+    
+    @staticmethod
+    def _read_batches(data_path: str, columns: Optional[list]):
+        """逐个记录批转换为 DataFrame"""
+        with pa.memory_map(data_path) as source:
+            reader = pa.ipc.open_file(source)
+            names = [name for name in reader.schema.names if not columns or name in columns]
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i).select(names).to_pandas()
+    
+    def chunk_writer(self, filepath: str) -> "ChunkedCacheWriter":
+        """创建分块写入器：流式扫描源文件时逐块写入缓存"""
+        return ChunkedCacheWriter(self, filepath)
+    
+    def invalidate(self, filepath: str):
+        """删除源文件对应的缓存"""
+        for path in self._paths(filepath):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class ChunkedCacheWriter:
+    """
+    分块缓存写入器（上下文管理器）
+    
+    每个数据块写成一个 Arrow 记录批；调用 finish() 标记扫描完整结束、且期间源文件未变化时
+    才替换到位，扫描中途停止（如达到 limit）、出错或后续数据块的列类型与第一块不兼容时丢弃
+    """
+    
+    def __init__(self, cache: ColumnarCache, filepath: str):
+        self.cache = cache
+        self.filepath = filepath
+        self.tmp_path = cache._paths(filepath)[0] + ".tmp"
+        self.source = cache._signature(filepath)
+        self.writer = None
+        self.schema = None
+        self.failed = False
+        self.finished = False
+    
+    def __enter__(self):
+        return self
+    
+    def write(self, chunk: pd.DataFrame):
+        """写入一个数据块（写入失败后不再写入，扫描照常进行）"""
+        if self.failed:
+            return
+        try:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if self.writer is None:
+                self.schema = table.schema
+                compression = None if self.cache.compression == "uncompressed" else self.cache.compression
+                self.writer = pa.ipc.new_file(self.tmp_path, self.schema,
+                                              options=pa.ipc.IpcWriteOptions(compression=compression))
+            self.writer.write_table(table.cast(self.schema))
+        except Exception as e:
+            print(f"⚠️  写入分块列式缓存失败 {os.path.basename(self.filepath)}: {e}")
+            self.failed = True
+    
+    def finish(self):
+        """标记已写入源文件的全部数据"""
+        self.finished = True
+    
+    def __exit__(self, exc_type, exc, tb):
+        if self.writer is not None:
+            self.writer.close()
+        complete = (exc_type is None and self.finished and not self.failed and self.writer is not None
+                    and self.cache._signature(self.filepath) == self.source)
+        try:
+            if complete:
+                self.cache._commit(self.filepath, self.source)
+                print(f"✓ 已写入分块列式缓存: {os.path.basename(self.filepath)}")
+            elif os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+        except OSError as e:
+            print(f"⚠️  写入分块列式缓存失败 {os.path.basename(self.filepath)}: {e}")
+        return False
+
+
+__all__ = ['ColumnarCache', 'ChunkedCacheWriter', 'USE_COLUMNAR_CACHE', 'prefix_fingerprint']
@@ -0,0 +1,166 @@
+"""
+CSV Index - CSV 表的列索引
+为频繁过滤的列按需建立哈希索引（类别/低基数字符串）或排序索引（数值/日期/高基数字符串）
+"""
+import datetime
+import numbers
+import numpy as np
+import pandas as pd
+from typing import Optional
+
+_EMPTY_POSITIONS = np.array([], dtype=np.intp)
+
+# 不重复值占行数的比例超过该值时不建哈希索引：每个值一个行号数组，开销远大于数据本身
+HASH_INDEX_MAX_RATIO = 0.1
+
+
+class HashIndex:
+    """哈希索引：值 -> 行号数组，适用于类别、字符串、布尔列"""
+    
+    def __init__(self, series: pd.Series):
+        self.positions = {
+            key: np.asarray(rows, dtype=np.intp)
+            for key, rows in series.groupby(series, sort=False, observed=True).indices.items()
+        }
+    
+    def lookup(self, value) -> Optional[np.ndarray]:
+        """等值查找，返回按原始顺序排列的行号"""
+        return self.positions.get(value, _EMPTY_POSITIONS)
+    
+    @property
+    def nbytes(self) -> int:
+        """索引占用的内存（行号数组加上每个键约 100 字节的字典开销）"""
+        return sum(rows.nbytes for rows in self.positions.values()) + 100 * len(self.positions)
+    
+    def append(self, series: pd.Series, offset: int):
+        """
+        增量追加新行
+        
+        参数:
+            series: 新追加的行在该列上的数据
+            offset: 新行在整表中的起始行号
+        """
+        for key, rows in series.groupby(series, sort=False, observed=True).indices.items():
+            rows = np.asarray(rows, dtype=np.intp) + offset
+            existing = self.positions.get(key)
+            self.positions[key] = rows if existing is None else np.concatenate([existing, rows])
+
+
+class SortedIndex:
+    """排序索引：适用于数值、日期列（支持等值和范围查找）和高基数字符串列（等值查找）"""
+    
+    def __init__(self, series: pd.Series):
+        self.is_datetime = pd.api.types.is_datetime64_any_dtype(series)
+        self.is_string = not self.is_datetime and not pd.api.types.is_numeric_dtype(series)
+        valid = series.notna().to_numpy()
+        values = series.to_numpy()[valid]
+        order = np.argsort(values, kind="stable")
+        self.values = values[order]
+        self.positions = np.flatnonzero(valid)[order]
+    
+    def append(self, series: pd.Series, offset: int):
+        """
+        增量追加新行：新值排序后与已有有序数组线性归并，不重新整体排序
+        
+        参数:
+            series: 新追加的行在该列上的数据
+            offset: 新行在整表中的起始行号
+        """
+        valid = series.notna().to_numpy()
+        values = series.to_numpy()[valid]
+        order = np.argsort(values, kind="stable")
+        new_values = values[order]
+        new_positions = np.flatnonzero(valid)[order] + offset
+        
+        slots = np.searchsorted(self.values, new_values, side="right") + np.arange(len(new_values))
+        total = len(self.values) + len(new_values)
+        old_slots = np.ones(total, dtype=bool)
+        old_slots[slots] = False
+        
+        merged_values = np.empty(total, dtype=np.result_type(self.values, new_values))
+        merged_values[slots] = new_values
+        merged_values[old_slots] = self.values
+        merged_positions = np.empty(total, dtype=np.intp)
+        merged_positions[slots] = new_positions
+        merged_positions[old_slots] = self.positions
+        
+        self.values = merged_values
+        self.positions = merged_positions
+    
+    @property
+    def nbytes(self) -> int:
+        """索引占用的内存（字符串列的值数组只保存引用，不复制字符串）"""
+        return self.values.nbytes + self.positions.nbytes
+    
+    def _coerce(self, value):
+        """把查找值转换为可与索引比较的类型，类型不兼容时返回 None"""
+        if self.is_string:
+            return value if isinstance(value, str) else None
+        if self.is_datetime:
+            if isinstance(value, (str, datetime.date, pd.Timestamp, np.datetime64)):
+                try:
+                    return np.datetime64(pd.Timestamp(value), "ns").astype(self.values.dtype)
+                except (ValueError, TypeError):
+                    return None
+            return None
+        if isinstance(value, numbers.Number) and not isinstance(value, bool):
+            return value
+        return None
+    
+    def lookup(self, value) -> Optional[np.ndarray]:
+        """等值查找，值类型与列不兼容时返回 None（交给全表扫描处理）"""
+        return self.range(value, value)
+    
+    def range(self, low=None, high=None, include_low: bool = True,
+              include_high: bool = True) -> Optional[np.ndarray]:
+        """
+        范围查找
+        
+        参数:
+            low: 下界（None 表示不限）
+            high: 上界（None 表示不限）
+            include_low: 是否包含下界
+            include_high: 是否包含上界
+        
+        返回:
+            按原始顺序排列的行号，类型不兼容时返回 None
+        """
+        start, end = 0, len(self.values)
+        if low is not None:
+            low = self._coerce(low)
+            if low is None:
+                return None
+            start = np.searchsorted(self.values, low, side="left" if include_low else "right")
+        if high is not None:
+            high = self._coerce(high)
+            if high is None:
+                return None
+            end = np.searchsorted(self.values, high, side="right" if include_high else "left")
+        
+        if start >= end:
+            return _EMPTY_POSITIONS
+        return np.sort(self.positions[start:end])
+
+
+def build_index(series: pd.Series):
+    """
+    根据列类型选择索引：数值/日期用排序索引，类别、布尔和低基数字符串列用哈希索引，
+    高基数字符串列用排序索引（每行 16 字节，而哈希索引每个值一个数组）
+    
+    返回:
+        列索引；混合类型等无法排序的列返回 None
+    """
+    is_numeric = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+    if is_numeric or pd.api.types.is_datetime64_any_dtype(series):
+        return SortedIndex(series)
+    if isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(series):
+        return HashIndex(series)
+    if series.nunique() > len(series) * HASH_INDEX_MAX_RATIO:
+        try:
+            return SortedIndex(series)
+        except TypeError:
+            return None
+    return HashIndex(series)
+
+
+__all__ = ['HashIndex', 'SortedIndex', 'build_index', 'HASH_INDEX_MAX_RATIO']
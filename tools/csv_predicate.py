@@ -0,0 +1,397 @@
+"""
+CSV Predicate - CSV 查询的过滤条件
+支持比较、IN 列表、BETWEEN、前缀/包含/LIKE 匹配和日期窗口，
+条件按列的实际类型转换取值后向量化计算布尔掩码
+"""
+import datetime
+import re
+import numpy as np
+import pandas as pd
+from typing import Optional
+
+from tools.csv_index import HashIndex, SortedIndex
+from tools.csv_stats import can_match, can_match_range
+
+OPERATORS = ("==", "!=", ">", ">=", "<", "<=", "in", "not in", "between",
+             "prefix", "contains", "like")
+
+# 年或年月形式的日期（作为等值条件时表示整年、整月的日期窗口）
+_PARTIAL_DATE = re.compile(r"^(\d{4})(?:[-/](\d{1,2}))?$")
+_FULL_DATE = re.compile(r"^\d{4}[-/]\d{1,2}[-/]\d{1,2}")
+
+# 条件文本："列名 运算符 值"；符号运算符前后可以不留空格
+_SYMBOL_CONDITION = re.compile(r"^\s*(.+?)\s*(>=|<=|!=|<>|==|=|>|<)\s*(.*)$", re.DOTALL)
+_WORD_CONDITION = re.compile(
+    r"^\s*(.+?)\s+(not\s+in|in|between|like|prefix|contains|startswith)\s+(.*)$",
+    re.IGNORECASE | re.DOTALL
+)
+_VALUE_PATTERN = re.compile(
+    r"^\s*(?P<op>>=|<=|!=|<>|==|=|>|<|not\s+in\s|in\s|between\s|like\s|prefix\s|contains\s|startswith\s)?\s*(?P<value>.*)$",
+    re.IGNORECASE | re.DOTALL
+)
+_OP_ALIASES = {"=": "==", "<>": "!=", "startswith": "prefix"}
+
+
+class Predicate:
+    """单列过滤条件：运算符 + 取值（in 为列表，between 为 (下界, 上界)）"""
+    
+    def __init__(self, op: str, value=None):
+        op = _OP_ALIASES.get(op, op)
+        if op not in OPERATORS:
+            raise ValueError(f"不支持的运算符: {op}")
+        if op in ("in", "not in"):
+            value = list(value)
+        elif op == "between":
+            low, high = value
+            value = (low, high)
+        self.op = op
+        self.value = value
+    
+    def __repr__(self) -> str:
+        return f"Predicate({self.op!r}, {self.value!r})"
+    
+    def __str__(self) -> str:
+        if self.op in ("in", "not in"):
+            return f"{self.op} ({', '.join(map(str, self.value))})"
+        if self.op == "between":
+            return f"between {self.value[0]} and {self.value[1]}"
+        return f"{'=' if self.op == '==' else self.op} {self.value}"
+    
+    def date_window(self) -> Optional[tuple]:
+        """年或年月形式的等值条件对应的日期窗口 [起, 止)，其余条件返回 None"""
+        if self.op != "==" or not isinstance(self.value, str):
+            return None
+        match = _PARTIAL_DATE.match(self.value.strip())
+        if not match:
+            return None
+        year, month = int(match.group(1)), match.group(2)
+        if month is None:
+            return pd.Timestamp(year, 1, 1), pd.Timestamp(year + 1, 1, 1)
+        start = pd.Timestamp(year, int(month), 1)
+        return start, start + pd.offsets.MonthBegin(1)
+    
+    def mask(self, series: pd.Series) -> np.ndarray:
+        """计算布尔掩码（空值不满足除 == None 以外的任何条件）"""
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # 只在类别取值上计算一次，再按类别编码展开
+            categories = self.mask(pd.Series(series.cat.categories))
+            return np.append(categories, False)[series.cat.codes.to_numpy()]
+        
+        op, value = self.op, self.value
+        if op == "==" and value is None:
+            return series.isna().to_numpy(dtype=bool)
+        
+        if op in ("prefix", "contains", "like"):
+            text = series if pd.api.types.is_string_dtype(series) else series.astype("string")
+            if op == "prefix":
+                result = text.str.startswith(str(value), na=False)
+            elif op == "contains":
+                result = text.str.contains(str(value), regex=False, na=False)
+            else:
+                result = text.str.fullmatch(_like_to_regex(str(value)), na=False)
+            return result.to_numpy(dtype=bool)
+        
+        window = self.date_window()
+        if window is not None:
+            if pd.api.types.is_datetime64_any_dtype(series):
+                return (series.ge(window[0]) & series.lt(window[1])).to_numpy(dtype=bool)
+            if _looks_like_dates(series):
+                # 流式模式下日期列尚未解析，仍是 YYYY-MM-DD 字符串
+                prefix = window[0].strftime("%Y" if len(value.strip()) == 4 else "%Y-%m")
+                return series.str.startswith(prefix, na=False).to_numpy(dtype=bool)
+        
+        if op in ("in", "not in"):
+            values = [_coerce(item, series, strict=False) for item in value]
+            result = series.isin(values)
+            if op == "not in":
+                result = ~result & series.notna()
+        elif op == "between":
+            low, high = (_coerce(item, series) for item in value)
+            result = series.ge(low) & series.le(high)
+        else:
+            value = _coerce(value, series, strict=op not in ("==", "!="))
+            result = {
+                "==": series.eq, "!=": series.ne, ">": series.gt,
+                ">=": series.ge, "<": series.lt, "<=": series.le
+            }[op](value)
+            if op == "!=":
+                result &= series.notna()
+        return result.fillna(False).to_numpy(dtype=bool) if result.dtype != bool else result.to_numpy()
+
+
+def _like_to_regex(pattern: str) -> str:
+    """SQL LIKE 模式（% 任意串，_ 单个字符）转为正则"""
+    return "".join(
+        ".*" if char == "%" else "." if char == "_" else re.escape(char)
+        for char in pattern
+    )
+
+
+def _looks_like_dates(series: pd.Series) -> bool:
+    """判断字符串列是否为日期文本（按第一个非空值判断）"""
+    if not pd.api.types.is_string_dtype(series):
+        return False
+    first = series.dropna()
+    return not first.empty and isinstance(first.iloc[0], str) and bool(_FULL_DATE.match(first.iloc[0]))
+
+
+def _coerce(value, series: pd.Series, strict: bool = True):
+    """
+    把条件值转换为与列类型一致的取值
+    
+    参数:
+        value: 条件值（来自工具调用时通常是字符串）
+        series: 被过滤的列
+        strict: 无法转换时是否报错；等值比较时保留原值（结果自然为空）
+    """
+    if value is None:
+        return None
+    try:
+        if pd.api.types.is_bool_dtype(series):
+            if isinstance(value, str):
+                return value.strip().lower() in ("true", "1", "yes", "是")
+            return bool(value)
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return pd.Timestamp(value)
+        if pd.api.types.is_numeric_dtype(series):
+            return pd.to_numeric(value.strip()) if isinstance(value, str) else value
+    except (ValueError, TypeError):
+        if strict:
+            raise ValueError(f"列 {series.name} 的类型为 {series.dtype}，无法与 '{value}' 比较")
+        return value
+    
+    # 字符串列：日期值转换为 ISO 文本，数值转换为文本
+    if isinstance(value, (pd.Timestamp, datetime.datetime)):
+        return value.strftime("%Y-%m-%d") if value == value.normalize() else value.isoformat(sep=" ")
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, str) or not _values_are_text(series):
+        return value
+    return str(value)
+
+
+def _values_are_text(series: pd.Series) -> bool:
+    """判断 object 列的取值是否为字符串"""
+    first = series.dropna()
+    return first.empty or isinstance(first.iloc[0], str)
+
+
+def _predicates(condition) -> list:
+    """把条件统一为 Predicate 列表（普通值表示等值条件，列表表示多个条件同时满足）"""
+    if isinstance(condition, Predicate):
+        return [condition]
+    if isinstance(condition, list) and all(isinstance(item, Predicate) for item in condition):
+        return condition
+    return [Predicate("==", condition)]
+
+
+def column_mask(series: pd.Series, condition) -> np.ndarray:
+    """
+    计算单列条件的布尔掩码
+    
+    参数:
+        series: 被过滤的列
+        condition: 普通值（等值）、Predicate 或 Predicate 列表（同时满足）
+    """
+    mask = np.ones(len(series), dtype=bool)
+    for predicate in _predicates(condition):
+        mask &= predicate.mask(series)
+    return mask
+
+
+def match_value(value, condition) -> bool:
+    """判断单个取值（如分区键）是否满足条件"""
+    return bool(column_mask(pd.Series([value], dtype=object), condition)[0])
+
+
+def index_supports(series: pd.Series, condition) -> bool:
+    """
+    判断条件能否用列索引求解，避免为 contains / like / != 等只能全表扫描的条件建立索引
+    
+    等值和 IN 可用于任何索引；范围条件只用于数值、日期列的排序索引
+    """
+    predicates = _predicates(condition)
+    if len(predicates) != 1:
+        return False
+    op, value = predicates[0].op, predicates[0].value
+    if op == "in":
+        return True
+    if op == "==":
+        return value is not None
+    is_numeric = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+    sortable = is_numeric or pd.api.types.is_datetime64_any_dtype(series)
+    return sortable and op in (">", ">=", "<", "<=", "between")
+
+
+def index_positions(index, series: pd.Series, condition) -> Optional[np.ndarray]:
+    """
+    用列索引求出满足条件的行号（升序）
+    
+    返回:
+        行号数组；条件无法走索引时返回 None（交给全表扫描处理）
+    """
+    predicates = _predicates(condition)
+    if len(predicates) != 1:
+        return None
+    predicate = predicates[0]
+    op, value = predicate.op, predicate.value
+    sample = series.cat.categories.to_series() if isinstance(series.dtype, pd.CategoricalDtype) else series
+    
+    try:
+        if isinstance(index, HashIndex):
+            if op == "==" and value is not None:
+                return index.lookup(_coerce(value, sample, strict=False))
+            if op == "in":
+                found = [index.lookup(_coerce(item, sample, strict=False)) for item in value]
+                return np.unique(np.concatenate(found)) if found else np.array([], dtype=np.intp)
+            return None
+        
+        if isinstance(index, SortedIndex):
+            window = predicate.date_window() if index.is_datetime else None
+            if window is not None:
+                positions = index.range(window[0], window[1], include_high=False)
+            elif op == "==" and value is not None:
+                positions = index.lookup(_coerce(value, sample))
+            elif op in (">", ">="):
+                positions = index.range(low=_coerce(value, sample), include_low=op == ">=")
+            elif op in ("<", "<="):
+                positions = index.range(high=_coerce(value, sample), include_high=op == "<=")
+            elif op == "between":
+                positions = index.range(_coerce(value[0], sample), _coerce(value[1], sample))
+            elif op == "in":
+                found = [index.lookup(_coerce(item, sample)) for item in value]
+                if any(positions is None for positions in found):
+                    return None
+                return np.unique(np.concatenate(found)) if found else np.array([], dtype=np.intp)
+            else:
+                return None
+            return np.sort(positions) if positions is not None else None
+    except ValueError:
+        return None
+    return None
+
+
+def may_match(stats: Optional[dict], condition) -> bool:
+    """
+    用列统计信息判断条件是否可能命中（False 表示一定无结果，可跳过扫描）
+    """
+    if not stats:
+        return True
+    
+    for predicate in _predicates(condition):
+        op, value = predicate.op, predicate.value
+        window = predicate.date_window()
+        if window is not None and isinstance(stats.get("min"), pd.Timestamp):
+            matched = can_match_range(stats, window[0], window[1], include_high=False)
+        elif window is not None and isinstance(stats.get("min"), str):
+            # 文本日期列（含无法解析的取值）的字符串最值与日期窗口不可比，不做剪枝
+            matched = True
+        elif op == "==":
+            matched = can_match(stats, value)
+        elif op == "in":
+            matched = any(can_match(stats, item) for item in value)
+        elif op in (">", ">="):
+            matched = can_match_range(stats, low=value, include_low=op == ">=")
+        elif op in ("<", "<="):
+            matched = can_match_range(stats, high=value, include_high=op == "<=")
+        elif op == "between":
+            matched = can_match_range(stats, value[0], value[1])
+        else:
+            matched = True
+        if not matched:
+            return False
+    return True
+
+
+def parse_predicate(text: str):
+    """
+    解析单列条件文本（列名之后的部分）
+    
+    支持:
+        华东                         等值
+        >=100 / <2024-02-01 / != 0   比较
+        in (华东, 华北)              IN 列表（not in 取反）
+        between 100 and 500          闭区间
+        prefix 笔记本 / contains 电脑 / like 笔记本%
+        2024-01                      日期列按整月（2024 为整年）匹配
+    
+    返回:
+        Predicate
+    """
+    match = _VALUE_PATTERN.match(text)
+    op = (match.group("op") or "==").strip().lower()
+    return _build_predicate(re.sub(r"\s+", " ", op), match.group("value").strip())
+
+
+def _build_predicate(op: str, value: str) -> Predicate:
+    """由运算符和取值文本构造 Predicate"""
+    op = _OP_ALIASES.get(op, op)
+    if op in ("in", "not in"):
+        items = value.strip()
+        if items.startswith("(") and items.endswith(")"):
+            items = items[1:-1]
+        return Predicate(op, [_unquote(item) for item in items.split(",") if item.strip()])
+    if op == "between":
+        parts = re.split(r"\s+and\s+", value, maxsplit=1, flags=re.IGNORECASE)
+        if len(parts) != 2:
+            raise ValueError(f"BETWEEN 条件格式错误: '{value}'，应为 \"between 下界 and 上界\"")
+        return Predicate("between", (_unquote(parts[0]), _unquote(parts[1])))
+    return Predicate(op, _unquote(value))
+
+
+def _unquote(value: str) -> str:
+    """去掉取值两侧的空白和引号"""
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in ("'", '"'):
+        return value[1:-1]
+    return value
+
+
+def _split_conditions(text: str) -> list:
+    """按逗号拆分多个条件（括号内的逗号属于 IN 列表，不拆分）"""
+    parts, depth, current = [], 0, []
+    for char in text:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth = max(depth - 1, 0)
+        if char == "," and depth == 0:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    parts.append("".join(current))
+    return [part.strip() for part in parts if part.strip()]
+
+
+def parse_filters(text: str) -> dict:
+    """
+    解析多列过滤条件，多个条件用逗号分隔（同一列的多个条件同时满足）
+    
+    示例:
+        "region=华东, price>=1000, order_date between 2024-01-01 and 2024-01-31"
+        "product in (手机, 耳机), customer_name prefix 张"
+    
+    返回:
+        {列名: Predicate 或 Predicate 列表}
+    """
+    conditions = {}
+    for item in _split_conditions(text):
+        # 符号运算符和单词运算符都能匹配时，取在前面出现的那个
+        candidates = [match.groups() for match in (_SYMBOL_CONDITION.match(item), _WORD_CONDITION.match(item)) if match]
+        if not candidates:
+            raise ValueError(f"过滤条件格式错误: '{item}'，应为 \"列名 运算符 值\"，例如 price>=100")
+        column, op, value = min(candidates, key=lambda groups: len(groups[0]))
+        predicate = _build_predicate(re.sub(r"\s+", " ", op.lower()), value)
+        
+        column = column.strip()
+        if column in conditions:
+            existing = conditions[column]
+            conditions[column] = (existing if isinstance(existing, list) else [existing]) + [predicate]
+        else:
+            conditions[column] = predicate
+    return conditions
+
+
+__all__ = ['Predicate', 'OPERATORS', 'column_mask', 'match_value', 'index_positions', 'index_supports',
+           'may_match', 'parse_predicate', 'parse_filters']
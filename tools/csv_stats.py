@@ -0,0 +1,269 @@
+"""
+CSV Stats - CSV 表的列统计信息（Zone Map）
+加载时为每列计算最值、空值数、近似去重数、常见值和等深直方图，
+供 Schema 展示和查询时跳过不可能满足的条件
+"""
+import numpy as np
+import pandas as pd
+from typing import Optional
+
+SKETCH_SIZE = 1024  # KMV 去重草图保留的最小哈希个数
+_HASH_SPACE = float(2 ** 64)
+
+
+def _to_python(value):
+    """numpy 标量转为 Python 原生类型，便于展示和比较"""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _hash_values(values: pd.Series) -> np.ndarray:
+    """计算去重用的 64 位哈希"""
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+
+def distinct_sketch(values: pd.Series) -> tuple[int, np.ndarray]:
+    """
+    计算去重数和 KMV 草图
+    
+    返回:
+        (去重数, 最小的 SKETCH_SIZE 个不同哈希值，已排序)
+    """
+    hashes = pd.unique(_hash_values(values))
+    if len(hashes) > SKETCH_SIZE:
+        sketch = np.sort(np.partition(hashes, SKETCH_SIZE - 1)[:SKETCH_SIZE])
+    else:
+        sketch = np.sort(hashes)
+    return len(hashes), sketch
+
+
+def estimate_distinct(sketch: np.ndarray) -> int:
+    """根据 KMV 草图估算去重数"""
+    if len(sketch) < SKETCH_SIZE:
+        return len(sketch)
+    return int((SKETCH_SIZE - 1) * _HASH_SPACE / (float(sketch[-1]) + 1))
+
+
+def compute_column_stats(series: pd.Series, top_n: int = 5, bins: int = 10) -> dict:
+    """
+    计算单列统计信息
+    
+    参数:
+        series: 列数据
+        top_n: 记录的常见值个数
+        bins: 数值列等深直方图的分桶数
+    
+    返回:
+        统计信息字典
+    """
+    non_null = series.dropna()
+    distinct, sketch = distinct_sketch(non_null)
+    stats = {
+        "nulls": int(len(series) - len(non_null)),
+        "distinct": distinct,
+        "distinct_exact": True,
+        "sketch": sketch,
+    }
+    # 布尔列的过滤值（"true" / "1" 等）由过滤时再转换，按字符串最值或原始常见值比较会误判为不可能命中
+    if non_null.empty or pd.api.types.is_bool_dtype(series):
+        return stats
+    
+    is_numeric = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+    is_datetime = pd.api.types.is_datetime64_any_dtype(series)
+    
+    if is_numeric or is_datetime:
+        stats["min"] = _to_python(non_null.min())
+        stats["max"] = _to_python(non_null.max())
+    elif not isinstance(series.dtype, pd.CategoricalDtype):
+        as_text = non_null.astype(str)
+        stats["min"] = as_text.min()
+        stats["max"] = as_text.max()
+    
+    if is_numeric:
+        edges = np.unique(np.quantile(non_null.to_numpy(dtype=np.float64), np.linspace(0, 1, bins + 1)))
+        counts, _ = np.histogram(non_null.to_numpy(dtype=np.float64), bins=edges) if len(edges) > 1 else ([len(non_null)], None)
+        stats["histogram"] = {"edges": edges.tolist(), "counts": [int(c) for c in counts]}
+    
+    top = non_null.value_counts().head(top_n)
+    top = top[top > 0]
+    if len(top) and (top.iloc[0] > 1 or distinct <= top_n):
+        stats["top_values"] = [(_to_python(value), int(count)) for value, count in top.items()]
+    
+    return stats
+
+
+def compute_table_stats(df: pd.DataFrame) -> dict:
+    """计算整张表所有列的统计信息"""
+    return {col: compute_column_stats(df[col]) for col in df.columns}
+
+
+def merge_column_stats(stats: dict, appended: pd.Series, top_n: int = 5) -> dict:
+    """
+    把新追加的行合并进已有的列统计信息（不重新扫描旧数据）
+    
+    - 空值数、最值直接合并
+    - 去重数通过合并 KMV 草图估算
+    - 常见值按已有计数加上新行计数近似
+    - 直方图沿用已有分位点，新值计入对应的桶（超出范围时扩展首尾边界）
+    
+    参数:
+        stats: 已有统计信息
+        appended: 新追加的行在该列上的数据
+        top_n: 记录的常见值个数
+    
+    返回:
+        合并后的统计信息
+    """
+    fresh = compute_column_stats(appended, top_n=top_n)
+    merged = dict(stats)
+    merged["nulls"] = stats["nulls"] + fresh["nulls"]
+    
+    sketch = np.union1d(stats["sketch"], fresh["sketch"])[:SKETCH_SIZE]
+    merged["sketch"] = sketch
+    merged["distinct_exact"] = bool(stats.get("distinct_exact")) and len(sketch) < SKETCH_SIZE
+    merged["distinct"] = len(sketch) if merged["distinct_exact"] else estimate_distinct(sketch)
+    
+    if "min" in fresh:
+        try:
+            merged["min"] = min(stats["min"], fresh["min"]) if "min" in stats else fresh["min"]
+            merged["max"] = max(stats["max"], fresh["max"]) if "max" in stats else fresh["max"]
+        except TypeError:
+            merged.pop("min", None)
+            merged.pop("max", None)
+    
+    if stats.get("top_values"):
+        counts = dict(stats.get("top_values") or [])
+        for value, count in appended.dropna().value_counts().items():
+            if count > 0:
+                value = _to_python(value)
+                counts[value] = counts.get(value, 0) + int(count)
+        ranked = sorted(counts.items(), key=lambda item: item[1], reverse=True)[:top_n]
+        merged["top_values"] = ranked
+    
+    if stats.get("histogram") and "min" in merged:
+        edges = list(stats["histogram"]["edges"])
+        edges[0] = min(edges[0], float(merged["min"]))
+        edges[-1] = max(edges[-1], float(merged["max"]))
+        values = appended.dropna().to_numpy(dtype=np.float64)
+        added, _ = np.histogram(values, bins=edges) if len(edges) > 1 else ([len(values)], None)
+        merged["histogram"] = {
+            "edges": edges,
+            "counts": [int(a) + int(b) for a, b in zip(stats["histogram"]["counts"], added)]
+        }
+    
+    return merged
+
+
+def _comparable(stats: dict, value):
+    """把条件值转换为可与列最值比较的类型，无法比较时返回 None"""
+    sample = stats.get("min")
+    try:
+        if isinstance(sample, pd.Timestamp):
+            return pd.Timestamp(value)
+        if isinstance(sample, (int, float)) and not isinstance(sample, bool):
+            if isinstance(value, str):
+                return float(value)
+            if isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+                return value
+            return None
+        if isinstance(sample, str) and isinstance(value, str):
+            return value
+    except (ValueError, TypeError):
+        return None
+    return None
+
+
+def can_match(stats: Optional[dict], value) -> bool:
+    """
+    判断等值条件是否可能命中（False 表示一定无结果，可跳过扫描）
+    
+    参数:
+        stats: 列统计信息
+        value: 等值条件的值
+    """
+    if not stats:
+        return True
+    
+    if value is None:
+        return stats["nulls"] > 0
+    
+    if "min" not in stats and stats.get("distinct", 1) == 0:
+        return False  # 整列为空
+    
+    comparable = _comparable(stats, value)
+    if comparable is not None:
+        if comparable < stats["min"] or comparable > stats["max"]:
+            return False
+        value = comparable
+    
+    # 去重数不超过常见值个数时，常见值就是全部取值
+    top_values = stats.get("top_values")
+    if top_values is not None and stats.get("distinct_exact") and stats["distinct"] <= len(top_values):
+        try:
+            return any(value == candidate for candidate, _ in top_values)
+        except TypeError:
+            return True
+    
+    return True
+
+
+def can_match_range(stats: Optional[dict], low=None, high=None,
+                    include_low: bool = True, include_high: bool = True) -> bool:
+    """
+    判断范围条件是否可能命中（False 表示一定无结果，可跳过扫描）
+    
+    参数:
+        stats: 列统计信息
+        low: 下界（None 表示不限）
+        high: 上界（None 表示不限）
+        include_low: 是否包含下界
+        include_high: 是否包含上界
+    """
+    if not stats or "min" not in stats:
+        return True
+    
+    if low is not None:
+        low = _comparable(stats, low)
+        if low is not None and (low > stats["max"] or (low == stats["max"] and not include_low)):
+            return False
+    if high is not None:
+        high = _comparable(stats, high)
+        if high is not None and (high < stats["min"] or (high == stats["min"] and not include_high)):
+            return False
+    return True
+
+
+def describe_column_stats(stats: Optional[dict]) -> str:
+    """把列统计信息格式化为一行简短描述"""
+    if not stats:
+        return ""
+    
+    def fmt(value):
+        if isinstance(value, pd.Timestamp):
+            return value.strftime("%Y-%m-%d") if value == value.normalize() else str(value)
+        if isinstance(value, float):
+            return f"{value:.6g}"
+        return str(value)
+    
+    prefix = "" if stats.get("distinct_exact") else "约 "
+    parts = []
+    if "min" in stats:
+        parts.append(f"范围 [{fmt(stats['min'])}, {fmt(stats['max'])}]")
+    parts.append(f"空值 {stats['nulls']}")
+    parts.append(f"{prefix}{stats['distinct']} 个不同值")
+    if stats.get("top_values") and "histogram" not in stats:
+        parts.append("常见值: " + ", ".join(f"{fmt(v)}({c})" for v, c in stats["top_values"]))
+    if stats.get("histogram"):
+        parts.append("分位点: " + " / ".join(fmt(edge) for edge in stats["histogram"]["edges"]))
+    
+    return "，".join(parts)
+
+
+__all__ = [
+    'compute_column_stats',
+    'compute_table_stats',
+    'merge_column_stats',
+    'can_match', 'can_match_range',
+    'describe_column_stats',
+    'distinct_sketch',
+    'estimate_distinct'
+]
@@ -2,10 +2,299 @@
 CSV Tool - CSV 文件数据查询和分析工具
 支持读取本地 CSV 文件，执行类似 SQL 的查询操作
 """
+import functools
+import io
 import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
 import pandas as pd
 from crewai.tools import tool
 from typing import Optional
+from tools.csv_cache import ColumnarCache, USE_COLUMNAR_CACHE, prefix_fingerprint
+from tools.csv_index import build_index
+from tools.csv_predicate import column_mask, match_value, index_positions, index_supports, may_match, parse_predicate, parse_filters
+from tools.csv_stats import compute_table_stats, merge_column_stats, describe_column_stats
+from tools.sql_tool import is_safe_query
+
+# 嵌入式 SQL 引擎：优先使用 DuckDB（可选依赖），未安装时退回标准库 sqlite3
+try:
+    import duckdb
+    USE_DUCKDB = True
+except ImportError:
+    import sqlite3
+    USE_DUCKDB = False
+
+# 尝试从 config.py 导入 CSV 配置，如果失败则使用默认值
+try:
+    from config import CSV_CONFIG
+except ImportError:
+    CSV_CONFIG = {}
+
+DEFAULT_CSV_CONFIG = {
+    "cache_enabled": True,               # 是否启用列式磁盘缓存（需要 pyarrow）
+    "cache_dir": None,                   # 缓存目录，默认为 <data_dir>/.cache
+    "cache_compression": "uncompressed", # Feather 压缩方式，uncompressed 可零拷贝内存映射
+    "stream_threshold_mb": 512,          # 超过该大小的 CSV 按块流式查询，不整表载入内存（None 表示关闭）
+    "stream_chunk_rows": 100_000,        # 流式查询每块读取的行数
+    "mask_block_rows": 1_000_000,        # 内存查询时分块计算过滤掩码的行数，命中 limit 即停止
+    "index_min_rows": 10_000,            # 行数达到该值的表才为过滤列建立索引
+    "optimize_dtypes": True,             # 加载时压缩列类型（类别化、数值降位、解析日期）
+    "category_max_ratio": 0.5,           # 去重值占比不超过该值的字符串列转为 category
+    "column_stats": True,                # 加载时计算列统计信息（最值、去重数、常见值、直方图）
+    "preload": False,                    # 启动时并行预加载所有表（也可以是表名列表）
+    "ingest_workers": None,              # 预加载进程数，默认为 CPU 核数
+    "watch_interval": 60,                # 轮询数据目录变化的间隔（秒），0 表示不监听
+    "memory_budget_mb": 1024,            # 已加载表的内存上限，超出时换出最久未查询的表（None 表示不限制）
+}
+
+
+def _get_setting(key: str):
+    """读取 CSV 配置项，未配置时使用默认值"""
+    return CSV_CONFIG.get(key, DEFAULT_CSV_CONFIG[key])
+
+
+# 形如 2024-01-15 / 2024/1/5 / 2024-01-15 08:30:00 的日期值
+_DATE_PATTERN = re.compile(r"^\d{4}[-/]\d{1,2}[-/]\d{1,2}([ T]\d{1,2}:\d{2}(:\d{2}(\.\d+)?)?)?$")
+
+
+def _optimize_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    压缩 DataFrame 的内存占用
+    
+    - 形似日期的字符串列解析为 datetime64
+    - 低基数字符串列转为 category
+    - 整数列降为能容纳取值的最小整数类型
+    - 浮点列在不损失精度时降为 float32
+    """
+    max_ratio = _get_setting("category_max_ratio")
+    
+    for col in df.columns:
+        series = df[col]
+        
+        if pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            non_null = series.dropna()
+            if non_null.empty:
+                continue
+            
+            sample = non_null.head(100).astype(str)
+            if sample.str.match(_DATE_PATTERN).all():
+                parsed = pd.to_datetime(series, errors="coerce")
+                if parsed.isna().sum() == series.isna().sum():
+                    df[col] = parsed
+                    continue
+            
+            if non_null.nunique() <= max_ratio * len(series):
+                df[col] = series.astype("category")
+        
+        elif pd.api.types.is_bool_dtype(series):
+            continue
+        
+        elif pd.api.types.is_integer_dtype(series):
+            df[col] = pd.to_numeric(series, downcast="integer")
+        
+        elif pd.api.types.is_float_dtype(series):
+            downcast = series.astype(np.float32)
+            if ((downcast.astype(series.dtype) == series) | series.isna()).all():
+                df[col] = downcast
+    
+    return df
+
+
+# 可识别的 CSV 文件扩展名；压缩文件由 pandas / Arrow 边读边解压（zst 需要 zstandard）
+CSV_EXTENSIONS = ('.csv', '.csv.gz', '.csv.bz2', '.csv.zst')
+
+# 分区目录中形如 2024-01.csv / 2024-01-15.csv 的日期文件名，对应的分区列名
+_DATE_FILE_PATTERN = re.compile(r"^\d{4}(-\d{2}){0,2}$")
+DATE_PARTITION_KEY = "file_date"
+
+# csv_aggregate 支持的聚合函数
+_AGG_FUNCS = {
+    "sum": "sum", "mean": "mean", "avg": "mean", "count": "count",
+    "min": "min", "max": "max", "median": "median", "nunique": "nunique"
+}
+_QUANTILE_PATTERN = re.compile(r"^p(\d{1,2}(\.\d+)?)$")  # p50 / p90 / p99.9
+_DATE_PARTS = {"year": "Y", "quarter": "Q", "month": "M", "week": "W", "day": "D"}
+
+
+def _widen_numeric(series: pd.Series) -> pd.Series:
+    """把降位后的数值列还原为 64 位，避免聚合和表达式计算溢出"""
+    if pd.api.types.is_bool_dtype(series):
+        return series
+    if pd.api.types.is_integer_dtype(series):
+        return series.astype(np.int64)
+    if pd.api.types.is_float_dtype(series):
+        return series.astype(np.float64)
+    return series
+
+
+def _csv_stem(filename: str) -> Optional[str]:
+    """去掉 CSV 扩展名（含压缩后缀），不是 CSV 文件时返回 None"""
+    lower = filename.lower()
+    for ext in CSV_EXTENSIONS:
+        if lower.endswith(ext):
+            return filename[:-len(ext)]
+    return None
+
+
+def _data_size(filepath: str, size: int) -> int:
+    """
+    估算文件解压后的大小（用于判断是否流式查询）
+    
+    gzip 文件末尾 4 字节记录了原始大小（对 4GB 取模）；其余格式无法廉价得知，按文件大小计
+    """
+    if not filepath.lower().endswith('.gz') or size < 18:
+        return size
+    with open(filepath, "rb") as f:
+        f.seek(-4, os.SEEK_END)
+        isize = int.from_bytes(f.read(4), "little")
+    return isize if isize >= size else size
+
+
+def _parse_csv(filepath: str) -> pd.DataFrame:
+    """解析 CSV 文件并按配置压缩列类型"""
+    df = pd.read_csv(filepath)
+    if _get_setting("optimize_dtypes"):
+        df = _optimize_dtypes(df)
+    return df
+
+
+def _parse_tail(filepath: str, offset: int, columns: list) -> tuple[pd.DataFrame, int]:
+    """
+    只解析文件中从 offset 字节开始新追加的完整行
+    
+    写入方可能还没写完最后一行，因此只解析到最后一个换行符为止，
+    剩下的半行留到下次检查时再读
+    
+    返回:
+        (新增行, 已解析到的文件位置)
+    """
+    with open(filepath, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    if end == 0:
+        return pd.DataFrame(columns=columns), offset
+    return pd.read_csv(io.BytesIO(data[:end]), header=None, names=columns), offset + end
+
+
+def _append_rows(df: pd.DataFrame, new_rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    把新追加的行合并到已加载的表，并保持压缩后的列类型
+    
+    category 列合并取值集合，日期列按日期解析，数值列合并后重新降位
+    """
+    new_rows = new_rows[list(df.columns)]
+    for col in df.columns:
+        dtype = df[col].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            combined = pd.api.types.union_categoricals(
+                [df[col].array, pd.Categorical(new_rows[col])], ignore_order=True)
+            dtype = combined.dtype
+            new_rows[col] = pd.Categorical(new_rows[col], dtype=dtype)
+            df = df.assign(**{col: pd.Categorical(df[col], dtype=dtype)})
+        elif pd.api.types.is_datetime64_any_dtype(dtype):
+            new_rows[col] = pd.to_datetime(new_rows[col], errors="coerce")
+    
+    merged = pd.concat([df, new_rows], ignore_index=True)
+    for col in merged.columns:
+        if pd.api.types.is_integer_dtype(merged[col]) and not pd.api.types.is_bool_dtype(merged[col]):
+            merged[col] = pd.to_numeric(merged[col], downcast="integer")
+    return merged
+
+
+def _ingest_worker(filepath: str, cache_dir: Optional[str], compression: str) -> Optional[pd.DataFrame]:
+    """
+    预加载子进程：解析 CSV
+    
+    启用列式缓存时把结果写入缓存并返回 None，由父进程内存映射读取，
+    避免通过进程间管道序列化整个 DataFrame
+    """
+    df = _parse_csv(filepath)
+    if cache_dir:
+        ColumnarCache(cache_dir, compression).save(filepath, df)
+        return None
+    return df
+
+
+def _partition_values(root: str, filepath: str) -> dict:
+    """
+    从分区文件路径中解析分区键值
+    
+    支持 hive 风格目录（region=华东/）和日期命名文件（2024-01.csv）
+    """
+    relpath = os.path.relpath(filepath, root)
+    parts = relpath.split(os.sep)
+    values = {}
+    for segment in parts[:-1]:
+        if "=" in segment:
+            key, value = segment.split("=", 1)
+            values[key] = value
+    
+    stem = _csv_stem(parts[-1])
+    if "=" in stem:
+        key, value = stem.split("=", 1)
+        values[key] = value
+    elif _DATE_FILE_PATTERN.match(stem):
+        values[DATE_PARTITION_KEY] = stem
+    return values
+
+
+def _scan_partitions(dirpath: str) -> list:
+    """递归列出分区目录下的所有 CSV 文件及其分区键值、大小和修改时间"""
+    partitions = []
+    for root, dirs, files in os.walk(dirpath):
+        dirs[:] = sorted(d for d in dirs if not d.startswith(('.', '_')))
+        for filename in sorted(files):
+            if _csv_stem(filename) is not None:
+                filepath = os.path.join(root, filename)
+                stat = os.stat(filepath)
+                partitions.append({
+                    'filepath': filepath,
+                    'values': _partition_values(dirpath, filepath),
+                    'size': stat.st_size,
+                    'data_size': _data_size(filepath, stat.st_size),
+                    'mtime': stat.st_mtime
+                })
+    return partitions
+
+
+def _partition_signature(partitions: list) -> list:
+    """分区文件签名，用于检测文件的增删改"""
+    return [(p['filepath'], p['size'], p['mtime']) for p in partitions]
+
+
+def _frame_to_markdown(df: pd.DataFrame) -> str:
+    """DataFrame 转 Markdown，纯日期列按 YYYY-MM-DD 显示"""
+    date_cols = [
+        col for col in df.columns
+        if pd.api.types.is_datetime64_any_dtype(df[col])
+        and (df[col].dropna().dt.normalize() == df[col].dropna()).all()
+    ]
+    if date_cols:
+        df = df.assign(**{col: df[col].dt.strftime("%Y-%m-%d") for col in date_cols})
+    return df.to_markdown(index=False)
+
+
+def _synchronized(method):
+    """用实例锁串行化方法调用，避免与后台刷新线程同时修改表数据"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _format_size(size: int) -> str:
+    """将字节数格式化为易读的大小"""
+    if size < 1024:
+        return f"{size} B"
+    for unit in ("KB", "MB", "GB"):
+        size /= 1024
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}"
 
 
 class CSVDatabase:
@@ -19,54 +308,541 @@ class CSVDatabase:
             data_dir: CSV 文件所在目录
         """
         self.data_dir = data_dir
-        self.dataframes = {}  # 缓存加载的 DataFrame
+        self.dataframes = OrderedDict()  # 已加载的 DataFrame，按最近查询时间排序（首次查询时加载）
         self.file_schemas = {}  # 存储文件结构信息
+        self.indexes = {}  # 按需建立的列索引 {表名: {列名: 索引}}
+        self._lock = threading.RLock()  # 保护查询与后台刷新之间的并发访问
+        self._watcher = None
+        self._stop_watching = threading.Event()
+        self.cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
         
         # 创建数据目录
         os.makedirs(data_dir, exist_ok=True)
         
-        # 自动发现并加载 CSV 文件
+        # 列式磁盘缓存（pyarrow 不可用或被禁用时为 None）
+        self.cache = None
+        if _get_setting("cache_enabled") and USE_COLUMNAR_CACHE:
+            cache_dir = _get_setting("cache_dir") or os.path.join(data_dir, ".cache")
+            self.cache = ColumnarCache(cache_dir, _get_setting("cache_compression"))
+        
+        # 自动发现 CSV 文件（只登记元数据，不解析数据）
         self._discover_csv_files()
+        
+        # 可选：启动时并行预加载
+        preload = _get_setting("preload")
+        if preload:
+            self.preload_tables(preload if isinstance(preload, (list, tuple)) else None)
     
-    def _discover_csv_files(self):
-        """自动发现数据目录中的所有 CSV 文件"""
+    def _scan_data_dir(self) -> dict:
+        """列出数据目录中的表：{表名: 文件或分区目录路径}"""
+        found = {}
         if not os.path.exists(self.data_dir):
+            return found
+        
+        for filename in sorted(os.listdir(self.data_dir)):
+            path = os.path.join(self.data_dir, filename)
+            if os.path.isdir(path) and not filename.startswith(('.', '_')):
+                found[filename] = path
+            elif _csv_stem(filename) is not None:
+                # 同名的未压缩文件和压缩文件只登记先出现的一个
+                found.setdefault(_csv_stem(filename), path)
+        return found
+    
+    def _discover_csv_files(self):
+        """自动发现数据目录中的所有 CSV 文件（子目录作为分区表）"""
+        for table_name, path in self._scan_data_dir().items():
+            self._register_path(table_name, path)
+    
+    def _register_path(self, table_name: str, path: str):
+        """登记单个 CSV 文件或分区目录，失败时只打印错误"""
+        filename = os.path.basename(path)
+        try:
+            if os.path.isdir(path):
+                if self.register_partitioned(table_name, path):
+                    count = len(self.file_schemas[table_name]['partitions'])
+                    print(f"✓ 已发现分区目录: {filename}/ ({count} 个文件) -> 表名: {table_name}")
+            else:
+                self.register_csv(table_name, path)
+                print(f"✓ 已发现 CSV 文件: {filename} -> 表名: {table_name}")
+        except Exception as e:
+            print(f"✗ 读取失败 {filename}: {e}")
+    
+    def refresh(self):
+        """
+        重新扫描数据目录
+        
+        登记新文件、移除已删除的表；只在末尾追加了数据的文件只解析新增部分，
+        被改写的文件重新登记
+        """
+        with self._lock:
+            found = self._scan_data_dir()
+            
+            for table_name in list(self.file_schemas):
+                if table_name not in found:
+                    self.file_schemas.pop(table_name)
+                    self.dataframes.pop(table_name, None)
+                    self.indexes.pop(table_name, None)
+                    print(f"✗ 文件已删除，移除表: {table_name}")
+            
+            for table_name, path in found.items():
+                if table_name not in self.file_schemas:
+                    self._register_path(table_name, path)
+                    continue
+                try:
+                    self._refresh_if_changed(table_name)
+                except Exception as e:
+                    print(f"✗ 刷新失败 {table_name}: {e}")
+    
+    def start_watching(self, interval: float):
+        """
+        启动后台线程，定期调用 refresh() 监听数据目录变化
+        
+        参数:
+            interval: 轮询间隔（秒）
+        """
+        if self._watcher is not None:
             return
         
-        for filename in os.listdir(self.data_dir):
-            if filename.endswith('.csv'):
-                filepath = os.path.join(self.data_dir, filename)
-                table_name = filename[:-4]  # 移除 .csv 扩展名
+        def watch():
+            while not self._stop_watching.wait(interval):
                 try:
-                    self.load_csv(table_name, filepath)
-                    print(f"✓ 已加载 CSV 文件: {filename} -> 表名: {table_name}")
+                    self.refresh()
                 except Exception as e:
-                    print(f"✗ 加载失败 {filename}: {e}")
+                    print(f"⚠️  刷新 CSV 数据目录失败: {e}")
+        
+        self._stop_watching.clear()
+        self._watcher = threading.Thread(target=watch, name="csv-watcher", daemon=True)
+        self._watcher.start()
+    
+    def stop_watching(self):
+        """停止后台监听线程"""
+        if self._watcher is not None:
+            self._stop_watching.set()
+            self._watcher.join()
+            self._watcher = None
+    
+    def register_csv(self, table_name: str, filepath: str):
+        """
+        登记 CSV 文件元数据，数据在首次查询时才加载
+        
+        只读取文件大小、修改时间和表头，不解析数据行
+        
+        参数:
+            table_name: 表名（用于引用）
+            filepath: CSV 文件路径
+        """
+        stat = os.stat(filepath)
+        header = pd.read_csv(filepath, nrows=0)
+        
+        self.dataframes.pop(table_name, None)
+        self.indexes.pop(table_name, None)
+        self.file_schemas[table_name] = {
+            'columns': list(header.columns),
+            'dtypes': {},
+            'rows': None,  # 加载前未知
+            'filepath': filepath,
+            'size': stat.st_size,
+            'data_size': _data_size(filepath, stat.st_size),
+            'mtime': stat.st_mtime
+        }
+    
+    def register_partitioned(self, table_name: str, dirpath: str) -> bool:
+        """
+        把分区目录登记为一张逻辑表
+        
+        目录下的所有 CSV 文件共享同一表头，分区键取自路径
+        （如 sales/region=华东/2024-01.csv -> region=华东, file_date=2024-01）
+        
+        参数:
+            table_name: 表名
+            dirpath: 分区目录路径
+        
+        返回:
+            目录中是否找到 CSV 文件
+        """
+        partitions = _scan_partitions(dirpath)
+        if not partitions:
+            return False
+        
+        header = pd.read_csv(partitions[0]['filepath'], nrows=0)
+        partition_keys = list(dict.fromkeys(
+            key for partition in partitions for key in partition['values']
+            if key not in header.columns
+        ))
+        
+        self.dataframes.pop(table_name, None)
+        self.indexes.pop(table_name, None)
+        self.file_schemas[table_name] = {
+            'columns': list(header.columns) + partition_keys,
+            'dtypes': {},
+            'rows': None,
+            'filepath': dirpath,
+            'size': sum(p['size'] for p in partitions),
+            'data_size': sum(p['data_size'] for p in partitions),
+            'mtime': max(p['mtime'] for p in partitions),
+            'partitions': partitions,
+            'partition_keys': partition_keys
+        }
+        return True
     
     def load_csv(self, table_name: str, filepath: str):
         """
         加载 CSV 文件到内存
         
+        优先读取列式缓存；缓存缺失或源文件已变化时解析 CSV 并写入缓存
+        
         参数:
             table_name: 表名（用于引用）
             filepath: CSV 文件路径
         """
-        df = pd.read_csv(filepath)
+        df, covered = self._read_file(filepath)
+        self._set_table(table_name, filepath, df, covered)
+    
+    def _read_file(self, filepath: str) -> tuple[pd.DataFrame, int]:
+        """
+        读取单个 CSV 文件：优先列式缓存，未命中时解析并写入缓存
+        
+        源文件在缓存之后只追加了数据时，读取缓存并只解析新增的完整行
+        
+        返回:
+            (DataFrame, 已读入的源文件字节数)
+        """
+        before = os.stat(filepath)
+        if self.cache:
+            df, covered = self.cache.load_prefix(filepath)
+            if df is not None:
+                if covered < before.st_size:
+                    new_rows, covered = _parse_tail(filepath, covered, list(df.columns))
+                    if len(new_rows):
+                        df = _append_rows(df, new_rows)
+                        self._save_cache(filepath, df, before, covered)
+                return df, covered
+        
+        df = _parse_csv(filepath)
+        if self.cache:
+            self._save_cache(filepath, df, before)
+        return df, before.st_size
+    
+    def _save_cache(self, filepath: str, df: pd.DataFrame, before: os.stat_result,
+                    covered: Optional[int] = None):
+        """写入列式缓存；解析期间源文件又被写入时跳过，避免缓存与文件内容不一致"""
+        after = os.stat(filepath)
+        if (after.st_size, after.st_mtime_ns) == (before.st_size, before.st_mtime_ns):
+            self.cache.save(filepath, df, covered)
+    
+    def _read_partitions(self, partitions: list) -> pd.DataFrame:
+        """读取若干分区文件，补上分区列后合并"""
+        frames = []
+        for partition in partitions:
+            df, _ = self._read_file(partition['filepath'])
+            for key, value in partition['values'].items():
+                if key not in df.columns:
+                    df[key] = value
+            frames.append(df)
+        
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        if _get_setting("optimize_dtypes"):
+            # 合并后各分区的 category 取值不同会退化为 object，需要重新压缩
+            df = _optimize_dtypes(df)
+        return df
+    
+    def _set_table(self, table_name: str, filepath: str, df: pd.DataFrame,
+                   covered: Optional[int] = None):
+        """
+        登记已加载的 DataFrame 并记录表结构
+        
+        参数:
+            covered: DataFrame 对应的源文件字节数（末尾还有未写完的半行时小于文件大小），默认整个文件
+        """
         self.dataframes[table_name] = df
+        self.dataframes.move_to_end(table_name)
+        self.indexes.pop(table_name, None)  # 旧索引的行号已失效
         
-        # 记录表结构
-        schema_info = {
+        # 记录表结构（分区表保留分区信息和目录级的大小、修改时间）
+        schema_info = self.file_schemas.get(table_name, {}).copy()
+        if not schema_info.get('partitions'):
+            stat = os.stat(filepath)
+            size = stat.st_size if covered is None else covered
+            schema_info.update(size=size, mtime=stat.st_mtime,
+                               fingerprint=prefix_fingerprint(filepath, size))
+        schema_info.update({
             'columns': list(df.columns),
             'dtypes': {col: str(dtype) for col, dtype in df.dtypes.items()},
             'rows': len(df),
+            'memory_bytes': int(df.memory_usage(deep=True).sum()),
+            'stats': compute_table_stats(df) if _get_setting("column_stats") else {},
             'filepath': filepath
-        }
+        })
         self.file_schemas[table_name] = schema_info
+        self._enforce_memory_budget(keep=table_name)
+    
+    def _table_memory(self, table_name: str) -> int:
+        """已加载表的内存占用：DataFrame 加上已建立的列索引"""
+        indexes = self.indexes.get(table_name, {}).values()
+        return self.file_schemas[table_name]['memory_bytes'] + sum(
+            index.nbytes for index in indexes if index is not None)
+    
+    def _enforce_memory_budget(self, keep: Optional[str] = None):
+        """
+        已加载表的内存占用超过 memory_budget_mb 时，按最近最少查询的顺序换出表
+        
+        换出只丢弃 DataFrame 和索引，表结构与列统计信息保留；再次查询时从列式缓存
+        （或 CSV）重新加载
+        
+        参数:
+            keep: 不参与换出的表（刚加载的表，即使单表超出预算也保留）
+        """
+        budget_mb = _get_setting("memory_budget_mb")
+        if budget_mb is None:
+            return
+        
+        budget = budget_mb * 1024 * 1024
+        used = sum(self._table_memory(name) for name in self.dataframes)
+        for table_name in list(self.dataframes):
+            if used <= budget:
+                break
+            if table_name == keep:
+                continue
+            used -= self._table_memory(table_name)
+            self.dataframes.pop(table_name)
+            self.indexes.pop(table_name, None)
+            self.cache_stats["evictions"] += 1
+            print(f"⇣ 内存超出预算，换出表: {table_name}")
+    
+    @_synchronized
+    def get_cache_stats(self) -> dict:
+        """返回内存表缓存的命中、未命中、换出次数和当前内存占用"""
+        budget_mb = _get_setting("memory_budget_mb")
+        return {
+            **self.cache_stats,
+            "loaded_tables": list(self.dataframes),
+            "memory_bytes": sum(self._table_memory(name) for name in self.dataframes),
+            "budget_bytes": budget_mb * 1024 * 1024 if budget_mb is not None else None
+        }
+    
+    def preload_tables(self, table_names: Optional[list] = None, workers: Optional[int] = None):
+        """
+        并行预加载多个表
+        
+        已有有效列式缓存的表直接内存映射读取；其余表交给进程池解析，
+        单个文件失败不影响其他文件
+        
+        参数:
+            table_names: 要预加载的表名，默认为全部表
+            workers: 进程数，默认读取 ingest_workers 配置或 CPU 核数
+        """
+        pending = []
+        partitioned = []
+        for table_name in table_names or self.get_tables():
+            if table_name in self.dataframes or self._should_stream(table_name):
+                continue
+            if self.file_schemas[table_name].get('partitions'):
+                partitioned.append(table_name)
+                continue
+            
+            filepath = self.file_schemas[table_name]['filepath']
+            df = self.cache.load(filepath) if self.cache else None
+            if df is not None:
+                self._set_table(table_name, filepath, df)
+                print(f"✓ 已加载 CSV 文件: {os.path.basename(filepath)} -> 表名: {table_name}")
+            else:
+                pending.append((table_name, filepath))
+        
+        # 分区表逐个加载（各分区文件同样走列式缓存）
+        for table_name in partitioned:
+            try:
+                self._ensure_loaded(table_name)
+            except Exception as e:
+                print(f"✗ 加载失败 {table_name}/: {e}")
+        
+        if not pending:
+            return
+        
+        workers = min(workers or _get_setting("ingest_workers") or os.cpu_count() or 1, len(pending))
+        if workers <= 1:
+            for table_name, filepath in pending:
+                try:
+                    self.load_csv(table_name, filepath)
+                    print(f"✓ 已加载 CSV 文件: {os.path.basename(filepath)} -> 表名: {table_name}")
+                except Exception as e:
+                    print(f"✗ 加载失败 {os.path.basename(filepath)}: {e}")
+            return
+        
+        cache_dir = self.cache.cache_dir if self.cache else None
+        compression = self.cache.compression if self.cache else None
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(_ingest_worker, filepath, cache_dir, compression): (table_name, filepath)
+                for table_name, filepath in pending
+            }
+            for future in as_completed(futures):
+                table_name, filepath = futures[future]
+                try:
+                    df = future.result()
+                    if df is None:
+                        # 子进程已写入列式缓存；缓存写入失败时退回本进程解析
+                        df = self.cache.load(filepath)
+                    if df is None:
+                        self.load_csv(table_name, filepath)
+                    else:
+                        self._set_table(table_name, filepath, df)
+                    print(f"✓ 已加载 CSV 文件: {os.path.basename(filepath)} -> 表名: {table_name}")
+                except Exception as e:
+                    print(f"✗ 加载失败 {os.path.basename(filepath)}: {e}")
+    
+    def _ensure_loaded(self, table_name: str) -> pd.DataFrame:
+        """
+        确保表已加载到内存（按需加载）
+        
+        参数:
+            table_name: 表名
+        
+        返回:
+            表对应的 DataFrame
+        """
+        if table_name in self.dataframes:
+            self.cache_stats["hits"] += 1
+            self.dataframes.move_to_end(table_name)
+            return self.dataframes[table_name]
+        
+        if table_name not in self.file_schemas:
+            raise ValueError(f"表 '{table_name}' 不存在")
+        
+        self.cache_stats["misses"] += 1
+        
+        schema = self.file_schemas[table_name]
+        if schema.get('partitions'):
+            self._set_table(table_name, schema['filepath'], self._read_partitions(schema['partitions']))
+            print(f"✓ 已加载分区表: {table_name} ({len(schema['partitions'])} 个文件)")
+        else:
+            self.load_csv(table_name, schema['filepath'])
+            print(f"✓ 已加载 CSV 文件: {os.path.basename(schema['filepath'])} -> 表名: {table_name}")
+        return self.dataframes[table_name]
+    
+    def _refresh_if_changed(self, table_name: str):
+        """
+        源文件变化时更新已登记的表
+        
+        已加载的文件只在末尾追加了数据时（原有内容的指纹不变），只解析新增行并
+        增量更新索引和列统计；其余变化丢弃已加载数据和索引，重新登记元数据
+        """
+        schema = self.file_schemas[table_name]
+        if schema.get('partitions'):
+            current = _scan_partitions(schema['filepath'])
+            if _partition_signature(current) != _partition_signature(schema['partitions']):
+                print(f"↻ 检测到分区变化，重新登记: {table_name}/")
+                self.dataframes.pop(table_name, None)
+                self.indexes.pop(table_name, None)
+                self.register_partitioned(table_name, schema['filepath'])
+            return
+        
+        filepath = schema['filepath']
+        stat = os.stat(filepath)
+        if stat.st_size == schema['size'] and stat.st_mtime == schema['mtime']:
+            return
+        
+        if (table_name in self.dataframes and schema.get('fingerprint')
+                and stat.st_size > schema['size']
+                and prefix_fingerprint(filepath, schema['size']) == schema['fingerprint']):
+            self._append_tail(table_name, stat)
+            return
+        
+        print(f"↻ 检测到文件变化，重新登记: {os.path.basename(filepath)}")
+        self.register_csv(table_name, filepath)
+    
+    def _append_tail(self, table_name: str, stat: os.stat_result):
+        """把源文件新追加的行并入已加载的表，增量更新索引、列统计和列式缓存"""
+        schema = self.file_schemas[table_name]
+        filepath = schema['filepath']
+        df = self.dataframes[table_name]
+        offset = len(df)
+        
+        new_rows, covered = _parse_tail(filepath, schema['size'], list(df.columns))
+        if not len(new_rows):
+            return  # 只有未写完的半行，下次检查时再读
+        df = _append_rows(df, new_rows)
+        self.dataframes[table_name] = df
+        
+        # 追加行的行号接在原有行之后，已有索引直接扩展；新值无法与原有值排序时丢弃该列索引
+        table_indexes = self.indexes.get(table_name, {})
+        for column, index in list(table_indexes.items()):
+            if index is not None:
+                try:
+                    index.append(df[column].iloc[offset:], offset)
+                except TypeError:
+                    table_indexes[column] = None
+        
+        if schema.get('stats'):
+            schema['stats'] = {
+                column: merge_column_stats(stats, df[column].iloc[offset:])
+                for column, stats in schema['stats'].items()
+            }
+        
+        schema.update({
+            'dtypes': {col: str(dtype) for col, dtype in df.dtypes.items()},
+            'rows': len(df),
+            'memory_bytes': int(df.memory_usage(deep=True).sum()),
+            'size': covered,
+            'mtime': stat.st_mtime,
+            'fingerprint': prefix_fingerprint(filepath, covered)
+        })
+        if self.cache:
+            self._save_cache(filepath, df, stat, covered)
+        self._enforce_memory_budget(keep=table_name)
+        print(f"↻ 检测到追加数据: {os.path.basename(filepath)} (+{len(new_rows)} 行)")
+    
+    def _get_index(self, table_name: str, column: str):
+        """
+        获取列索引，首次使用时建立
+        
+        索引计入表的内存占用，建立后重新检查内存预算
+        
+        返回:
+            列索引；表行数低于 index_min_rows 或列无法建立索引时返回 None
+        """
+        table_indexes = self.indexes.setdefault(table_name, {})
+        if column not in table_indexes:
+            df = self.dataframes[table_name]
+            if len(df) < _get_setting("index_min_rows"):
+                return None
+            table_indexes[column] = build_index(df[column])
+            self._enforce_memory_budget(keep=table_name)
+        return table_indexes[column]
+    
+    def _index_candidates(self, table_name: str, conditions: dict) -> tuple:
+        """
+        用列索引求出满足条件的候选行（哈希索引支持等值和 IN，排序索引还支持范围）
+        
+        只为能走索引的条件建立索引，contains / like / != 等条件直接留给全表扫描
+        
+        返回:
+            (候选行号数组或 None, 未能走索引的剩余条件)
+        """
+        df = self.dataframes[table_name]
+        candidates = None
+        remaining = {}
+        
+        for col, value in conditions.items():
+            usable = col in df.columns and index_supports(df[col], value)
+            index = self._get_index(table_name, col) if usable else None
+            positions = index_positions(index, df[col], value) if index is not None else None
+            if positions is None:
+                remaining[col] = value
+                continue
+            candidates = positions if candidates is None else np.intersect1d(
+                candidates, positions, assume_unique=True)
+        
+        return candidates, remaining
+    
+    def has_table(self, table_name: str) -> bool:
+        """判断表是否存在（无论是否已加载）"""
+        return table_name in self.file_schemas
     
     def get_tables(self) -> list:
-        """获取所有已加载的表名"""
-        return list(self.dataframes.keys())
+        """获取所有可用的表名（包括尚未加载的表）"""
+        return list(self.file_schemas.keys())
     
+    @_synchronized
     def get_table_schema(self, table_name: str) -> str:
         """
         获取表结构信息
@@ -81,75 +857,482 @@ class CSVDatabase:
             return f"表 '{table_name}' 不存在"
         
         schema = self.file_schemas[table_name]
+        if schema['rows'] is not None:
+            rows = schema['rows']
+        elif self._should_stream(table_name):
+            rows = "未知（大文件，按流式模式查询）"
+        else:
+            rows = "未加载（首次查询时加载）"
         lines = [
             f"表名: {table_name}",
             f"文件: {schema['filepath']}",
-            f"行数: {schema['rows']}",
-            f"\n列信息:"
+            f"大小: {_format_size(schema['size'])}" + (
+                f"（解压后约 {_format_size(schema['data_size'])}）"
+                if schema.get('data_size', schema['size']) != schema['size'] else ""),
+            f"行数: {rows}",
         ]
+        if schema.get('partitions'):
+            keys = ", ".join(schema['partition_keys']) or "无"
+            lines.append(f"分区: {len(schema['partitions'])} 个文件（分区列: {keys}）")
+        if schema.get('memory_bytes') is not None:
+            memory = _format_size(schema['memory_bytes'])
+            if table_name not in self.dataframes:
+                memory += "（已换出内存，查询时重新加载）"
+            lines.append(f"内存占用: {memory}")
+        lines.append(f"\n列信息:")
         
         for col in schema['columns']:
-            dtype = schema['dtypes'][col]
-            lines.append(f"  - {col} ({dtype})")
+            dtype = schema['dtypes'].get(col)
+            line = f"  - {col} ({dtype})" if dtype else f"  - {col}"
+            description = describe_column_stats(schema.get('stats', {}).get(col))
+            if description:
+                line += f": {description}"
+            lines.append(line)
         
         return "\n".join(lines)
     
+    @_synchronized
     def get_all_schemas(self) -> str:
         """获取所有表的结构信息"""
-        if not self.dataframes:
+        if not self.file_schemas:
             return "未找到任何 CSV 文件。请将 CSV 文件放在 'data/' 目录中。"
         
         schemas = []
-        for table_name in self.dataframes.keys():
+        for table_name in self.file_schemas.keys():
             schemas.append(self.get_table_schema(table_name))
             schemas.append("-" * 50)
         
+        stats = self.get_cache_stats()
+        budget = _format_size(stats['budget_bytes']) if stats['budget_bytes'] else "不限"
+        schemas.append(
+            f"内存缓存: 已加载 {len(stats['loaded_tables'])} 个表，"
+            f"占用 {_format_size(stats['memory_bytes'])} / 预算 {budget}；"
+            f"命中 {stats['hits']} 次，未命中 {stats['misses']} 次，换出 {stats['evictions']} 次"
+        )
         return "\n".join(schemas)
     
+    def _should_stream(self, table_name: str) -> bool:
+        """判断是否应使用流式模式查询（未载入内存且文件解压后的大小超过阈值）"""
+        if table_name in self.dataframes:
+            return False
+        
+        threshold_mb = _get_setting("stream_threshold_mb")
+        if threshold_mb is None:
+            return False
+        
+        schema = self.file_schemas[table_name]
+        return schema.get('data_size', schema['size']) >= threshold_mb * 1024 * 1024
+    
+    @_synchronized
     def query(self, table_name: str, conditions: Optional[dict] = None, 
               columns: Optional[list] = None, limit: Optional[int] = None) -> pd.DataFrame:
         """
         简单查询 CSV 数据
         
+        超过 stream_threshold_mb 的文件自动切换为流式模式，逐块扫描
+        
         参数:
             table_name: 表名
-            conditions: 过滤条件 (字典格式)
+            conditions: 过滤条件 {列名: 条件}，条件为普通值（等值）、Predicate
+                        （比较、IN、BETWEEN、前缀/包含、日期窗口）或 Predicate 列表
             columns: 要选择的列
             limit: 限制返回行数
         
         返回:
             查询结果 DataFrame
         """
-        if table_name not in self.dataframes:
+        if table_name not in self.file_schemas:
             raise ValueError(f"表 '{table_name}' 不存在")
         
-        df = self.dataframes[table_name].copy()
+        self._refresh_if_changed(table_name)
         
-        # 应用过滤条件
+        # 列统计信息表明条件不可能满足时，直接返回空结果
+        if conditions and not self._may_match(table_name, conditions):
+            return self._empty_result(table_name, columns)
+        
+        if self._should_stream(table_name):
+            return self._query_streaming(table_name, conditions, columns, limit)
+        
+        # 未载入内存的分区表：只读取分区键命中的文件
+        schema = self.file_schemas[table_name]
+        if schema.get('partitions') and table_name not in self.dataframes and conditions:
+            partitions, remaining = self._prune_partitions(table_name, conditions)
+            if len(partitions) < len(schema['partitions']):
+                if not partitions:
+                    return self._empty_result(table_name, columns)
+                df = self._read_partitions(partitions)
+                return self._apply_query(df, remaining, columns, limit)
+        
+        df = self._ensure_loaded(table_name)
+        
+        # 等值条件优先走列索引，其余条件在候选行上继续判断
+        candidates = None
         if conditions:
-            for col, value in conditions.items():
-                df = df[df[col] == value]
+            candidates, conditions = self._index_candidates(table_name, conditions)
+        
+        return self._apply_query(df, conditions, columns, limit, candidates)
+    
+    def _prune_partitions(self, table_name: str, conditions: Optional[dict]) -> tuple:
+        """
+        按分区键条件裁剪分区文件
+        
+        返回:
+            (命中的分区列表, 非分区键的剩余条件)
+        """
+        schema = self.file_schemas[table_name]
+        partitions = schema.get('partitions')
+        if not partitions:
+            return [], conditions
         
-        # 选择列
+        keys = set(schema['partition_keys'])
+        key_conditions = {col: value for col, value in (conditions or {}).items() if col in keys}
+        remaining = {col: value for col, value in (conditions or {}).items() if col not in keys}
+        matched = [
+            p for p in partitions
+            if all(match_value(p['values'].get(col), value) for col, value in key_conditions.items())
+        ]
+        return matched, remaining
+    
+    def _iter_chunks(self, table_name: str, conditions: Optional[dict] = None,
+                     usecols: Optional[list] = None):
+        """
+        逐块读取表数据（分区表按分区键裁剪后依次读取各文件，并补上分区列）
+        
+        返回:
+            生成器，产出 (数据块, 剩余条件)
+        """
+        schema = self.file_schemas[table_name]
+        if schema.get('partitions'):
+            partitions, conditions = self._prune_partitions(table_name, conditions)
+            keys = schema['partition_keys']
+        else:
+            partitions = [{'filepath': schema['filepath'], 'values': {}}]
+            keys = []
+        
+        file_cols = [col for col in usecols if col not in keys] if usecols else None
+        for partition in partitions:
+            for chunk in self._read_chunks(partition['filepath'], file_cols):
+                for key in keys:
+                    if usecols is None or key in usecols:
+                        chunk[key] = partition['values'].get(key)
+                yield chunk, conditions
+    
+    def _read_chunks(self, filepath: str, usecols: Optional[list] = None):
+        """
+        逐块读取单个文件
+        
+        有与源文件一致的列式缓存时按记录批读取缓存，不再解压和解析 CSV；
+        没有缓存时解析 CSV，首次扫描读取全部列并同时写入分块缓存（扫描完整结束才生效）
+        """
+        chunk_rows = _get_setting("stream_chunk_rows")
+        if not self.cache:
+            with pd.read_csv(filepath, usecols=usecols, chunksize=chunk_rows) as reader:
+                yield from reader
+            return
+        
+        cached = self.cache.iter_chunks(filepath, usecols)
+        if cached is not None:
+            yield from cached
+            return
+        
+        with pd.read_csv(filepath, chunksize=chunk_rows) as reader, self.cache.chunk_writer(filepath) as writer:
+            for chunk in reader:
+                writer.write(chunk)
+                yield chunk[[col for col in chunk.columns if col in usecols]] if usecols else chunk
+            writer.finish()
+    
+    def _may_match(self, table_name: str, conditions: dict) -> bool:
+        """用列统计信息判断条件是否可能命中"""
+        stats = self.file_schemas[table_name].get('stats') or {}
+        return all(may_match(stats.get(col), value) for col, value in conditions.items())
+    
+    def _empty_result(self, table_name: str, columns: Optional[list] = None) -> pd.DataFrame:
+        """构造与查询结果列一致的空 DataFrame"""
+        if table_name in self.dataframes:
+            df = self.dataframes[table_name]
+            return df.iloc[0:0, df.columns.get_indexer(columns)] if columns else df.iloc[0:0]
+        return pd.DataFrame(columns=columns or self.file_schemas[table_name]['columns'])
+    
+    def _query_streaming(self, table_name: str, conditions: Optional[dict] = None,
+                         columns: Optional[list] = None, limit: Optional[int] = None) -> pd.DataFrame:
+        """
+        流式查询：逐块读取 CSV 并过滤，匹配行数达到 limit 后立即停止
+        
+        参数:
+            table_name: 表名
+            conditions: 过滤条件 (字典格式)
+            columns: 要选择的列
+            limit: 限制返回行数
+        
+        返回:
+            查询结果 DataFrame
+        """
+        # 只解析需要的列（输出列 + 过滤列）
+        usecols = None
         if columns:
-            df = df[columns]
+            usecols = list(dict.fromkeys(list(columns) + list(conditions or {})))
+        
+        results = []
+        matched = 0
+        for chunk, chunk_conditions in self._iter_chunks(table_name, conditions, usecols):
+            remaining = limit - matched if limit else None
+            part = self._apply_query(chunk, chunk_conditions, columns, remaining)
+            if not part.empty:
+                results.append(part)
+                matched += len(part)
+            if limit and matched >= limit:
+                break
+        
+        if not results:
+            return self._empty_result(table_name, columns)
+        
+        return pd.concat(results, ignore_index=True)
+    
+    @_synchronized
+    def sql(self, query: str) -> pd.DataFrame:
+        """
+        在进程内嵌入式引擎中执行只读 SQL（支持 GROUP BY、JOIN、ORDER BY、窗口函数）
+        
+        只注册查询中引用到的表；DuckDB 下大文件以 Arrow 数据集方式按需扫描，
+        不整表载入内存，并禁止 SQL 直接访问文件系统
+        
+        参数:
+            query: SQL SELECT 查询语句
+        
+        返回:
+            查询结果 DataFrame
+        """
+        tokens = set(re.findall(r"[\w\u4e00-\u9fff]+", query))
+        tables = [name for name in self.get_tables() if name in tokens]
+        for table_name in tables:
+            self._refresh_if_changed(table_name)
+        
+        if USE_DUCKDB:
+            con = duckdb.connect(config={"enable_external_access": False})
+            try:
+                for table_name in tables:
+                    if self._should_stream(table_name):
+                        self._register_duckdb_dataset(con, table_name)
+                    else:
+                        con.register(table_name, self._ensure_loaded(table_name))
+                return con.execute(query).df()
+            finally:
+                con.close()
+        
+        con = sqlite3.connect(":memory:")
+        try:
+            for table_name in tables:
+                if self._should_stream(table_name):
+                    for chunk, _ in self._iter_chunks(table_name):
+                        chunk.to_sql(table_name, con, index=False, if_exists="append")
+                else:
+                    self._ensure_loaded(table_name).to_sql(table_name, con, index=False)
+            return pd.read_sql_query(query, con)
+        finally:
+            con.close()
+    
+    @_synchronized
+    def aggregate(self, table_name: str, metrics: list, group_by: Optional[list] = None,
+                  conditions: Optional[dict] = None, top_k: Optional[int] = None) -> pd.DataFrame:
+        """
+        向量化分组聚合
+        
+        先按条件过滤并只取用到的列，再用 pandas groupby 一次算出所有指标
+        
+        参数:
+            table_name: 表名
+            metrics: 指标列表 [(函数, 列名或表达式), ...]；
+                     函数支持 sum/mean/avg/count/min/max/median/nunique 以及 pNN 分位数，
+                     ("count", "*") 表示计行数
+            group_by: 分组列；日期列可写 "列名:month"（支持 year/quarter/month/week/day）
+            conditions: 过滤条件 (字典格式)
+            top_k: 按第一个指标降序保留前 K 组，None 表示不截断
+        
+        返回:
+            聚合结果 DataFrame（按第一个指标降序；按日期粒度分组时按时间先后排列），
+            attrs['total_groups'] 为截断前的组数
+        """
+        if table_name not in self.file_schemas:
+            raise ValueError(f"表 '{table_name}' 不存在")
+        
+        group_specs = [spec.split(":", 1) if ":" in spec else [spec, None] for spec in group_by or []]
+        for _, part in group_specs:
+            if part is not None and part not in _DATE_PARTS:
+                raise ValueError(f"不支持的日期粒度: {part}（可选 {', '.join(_DATE_PARTS)}）")
+        
+        # 只取分组列和指标表达式中用到的列
+        all_columns = self.file_schemas[table_name]['columns']
+        needed = [col for col, _ in group_specs]
+        for _, expr in metrics:
+            if expr != "*":
+                needed += [col for col in all_columns
+                           if re.search(rf"(?<!\w){re.escape(str(col))}(?!\w)", expr)]
+        needed = list(dict.fromkeys(needed)) or all_columns[:1]
+        data = self.query(table_name, conditions=conditions, columns=needed)
+        
+        # 计算分组键和指标值列
+        keys = {}
+        for col, part in group_specs:
+            label = f"{col}:{part}" if part else col
+            if part:
+                # 流式模式下日期列未经类型压缩，仍是字符串
+                dates = pd.to_datetime(data[col], errors="coerce")
+                keys[label] = dates.dt.to_period(_DATE_PARTS[part]).astype(str)
+            else:
+                keys[label] = data[col]
+        
+        values = {}
+        labels = []
+        widened = None
+        for func, expr in metrics:
+            quantile = _QUANTILE_PATTERN.match(func)
+            if func not in _AGG_FUNCS and not quantile:
+                raise ValueError(f"不支持的聚合函数: {func}")
+            if expr == "*" and func != "count":
+                raise ValueError("只有 count 可以使用 *")
+            
+            label = f"{func}({expr})"
+            labels.append(label)
+            if expr == "*":
+                continue
+            if expr in data.columns:
+                values[label] = _widen_numeric(data[expr])
+            else:
+                if widened is None:
+                    widened = data.apply(_widen_numeric)
+                values[label] = widened.eval(expr)
+        
+        work = pd.DataFrame({**keys, **values}, index=data.index)
+        grouped = work.groupby(list(keys), observed=True, sort=False) if keys else None
+        
+        results = {}
+        for (func, expr), label in zip(metrics, labels):
+            quantile = _QUANTILE_PATTERN.match(func)
+            target = grouped if grouped is not None else work
+            if expr == "*":
+                results[label] = grouped.size() if grouped is not None else len(work)
+            elif quantile:
+                results[label] = target[label].quantile(float(quantile.group(1)) / 100)
+            else:
+                results[label] = target[label].agg(_AGG_FUNCS[func])
+        
+        if grouped is None:
+            return pd.DataFrame({label: [value] for label, value in results.items()})
+        
+        result = pd.concat(results, axis=1).reset_index()
+        total_groups = len(result)
+        result = result.sort_values(labels[0], ascending=False)
+        if top_k:
+            result = result.head(top_k)
+        
+        # 按日期粒度分组时按时间先后排列（Period 字符串的字典序即时间顺序），同一时段内仍按指标降序
+        date_keys = [f"{col}:{part}" for col, part in group_specs if part]
+        if date_keys:
+            result = result.sort_values(date_keys, kind="stable")
+        
+        result = result.reset_index(drop=True)
+        result.attrs['total_groups'] = total_groups
+        return result
+    
+    def _register_duckdb_dataset(self, con, table_name: str):
+        """
+        把大文件以 Arrow 数据集注册到 DuckDB（扫描时才读取）
+        
+        分区表为每个文件注册一个数据集，再用 UNION ALL 视图补上分区列
+        """
+        import pyarrow.dataset as ds
+        
+        schema = self.file_schemas[table_name]
+        if not schema.get('partitions'):
+            cached = self.cache.current_path(schema['filepath']) if self.cache else None
+            dataset = ds.dataset(cached, format="ipc") if cached else ds.dataset(schema['filepath'], format="csv")
+            con.register(table_name, dataset)
+            return
+        
+        def ident(name):
+            return '"' + str(name).replace('"', '""') + '"'
+        
+        def literal(value):
+            return "NULL" if value is None else "'" + str(value).replace("'", "''") + "'"
+        
+        selects = []
+        for i, partition in enumerate(schema['partitions']):
+            alias = f"__{table_name}_{i}"
+            con.register(alias, ds.dataset(partition['filepath'], format="csv"))
+            extra = "".join(
+                f", {literal(partition['values'].get(key))} AS {ident(key)}"
+                for key in schema['partition_keys']
+            )
+            selects.append(f"SELECT *{extra} FROM {ident(alias)}")
+        con.execute(f"CREATE VIEW {ident(table_name)} AS " + " UNION ALL BY NAME ".join(selects))
+    
+    @staticmethod
+    def _apply_query(df: pd.DataFrame, conditions: Optional[dict] = None,
+                     columns: Optional[list] = None, limit: Optional[int] = None,
+                     candidates: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """
+        对 DataFrame 应用过滤、选列和行数限制
+        
+        所有条件合并为一个布尔掩码，按块计算并在命中 limit 后停止；
+        最后只按命中的行号和所需列取数，不复制整表。
+        传入 candidates（索引命中的行号）时只在这些行上判断条件
+        """
+        # 选择列（先算出列位置，取数时一次完成）
+        col_positions = slice(None)
+        if columns:
+            col_positions = df.columns.get_indexer(columns)
+            missing = [col for col, pos in zip(columns, col_positions) if pos < 0]
+            if missing:
+                raise KeyError(f"列不存在: {', '.join(map(str, missing))}")
+        
+        # 应用过滤条件
+        if candidates is not None:
+            mask = np.ones(len(candidates), dtype=bool)
+            for col, value in (conditions or {}).items():
+                mask &= column_mask(df[col].iloc[candidates], value)
+            row_positions = candidates[mask]
+        elif conditions:
+            block_rows = max(_get_setting("mask_block_rows") if limit else len(df), 1)
+            hits = []
+            matched = 0
+            for start in range(0, len(df), block_rows):
+                block = df.iloc[start:start + block_rows]
+                mask = np.ones(len(block), dtype=bool)
+                for col, value in conditions.items():
+                    mask &= column_mask(block[col], value)
+                
+                found = np.flatnonzero(mask) + start
+                hits.append(found)
+                matched += len(found)
+                if limit and matched >= limit:
+                    break
+            row_positions = np.concatenate(hits) if hits else np.array([], dtype=np.intp)
+        else:
+            row_positions = np.arange(min(limit, len(df)) if limit else len(df))
         
         # 限制行数
         if limit:
-            df = df.head(limit)
+            row_positions = row_positions[:limit]
         
-        return df
+        return df.iloc[row_positions, col_positions]
 
 
 # 全局 CSV 数据库实例
 _csv_db: Optional[CSVDatabase] = None
+_csv_db_lock = threading.Lock()
 
 
 def get_csv_db() -> CSVDatabase:
-    """获取 CSV 数据库单例"""
+    """获取 CSV 数据库单例（watch_interval 大于 0 时启动后台监听；多个线程同时首次调用时只创建一次）"""
     global _csv_db
     if _csv_db is None:
-        _csv_db = CSVDatabase()
+        with _csv_db_lock:
+            if _csv_db is None:
+                db = CSVDatabase()
+                interval = _get_setting("watch_interval")
+                if interval:
+                    db.start_watching(interval)
+                _csv_db = db
     return _csv_db
 
 
@@ -172,7 +1355,7 @@ def csv_query(table_name: str, limit: int = 100) -> str:
     try:
         db = get_csv_db()
         
-        if table_name not in db.dataframes:
+        if not db.has_table(table_name):
             available = ", ".join(db.get_tables())
             return f"表 '{table_name}' 不存在。\n可用的表: {available}"
         
@@ -181,7 +1364,7 @@ def csv_query(table_name: str, limit: int = 100) -> str:
         if df.empty:
             return f"表 '{table_name}' 为空或查询结果为空"
         
-        markdown_table = df.to_markdown(index=False)
+        markdown_table = _frame_to_markdown(df)
         result = f"查询成功！表 '{table_name}' 共 {len(df)} 行数据：\n\n{markdown_table}"
         
         return result
@@ -214,29 +1397,51 @@ def get_csv_schema(table_name: Optional[str] = None) -> str:
 
 
 @tool("csv_filter")
-def csv_filter(table_name: str, column: str, value: str, limit: int = 50) -> str:
+def csv_filter(table_name: str, column: str, value: str, limit: int = 50, filters: str = "") -> str:
     """
-    根据条件过滤 CSV 数据
+    根据条件过滤 CSV 数据（过滤在本地完成，只返回命中的行）
     
     参数:
         table_name: CSV 表名
         column: 要过滤的列名
-        value: 过滤值
+        value: 过滤条件，可以是：
+               华东（等值）、>=1000 / <2024-02-01 / !=0（比较）、
+               in (华东, 华北)、between 100 and 500、
+               prefix 笔记本 / contains 电脑 / like 笔记本%、
+               2024-01（日期列按整月匹配，2024 为整年）
         limit: 返回的最大行数
+        filters: 其他列的附加条件，格式 "列名 运算符 值"，多个用逗号分隔，
+                 例如 "region=华东, quantity>=2"
     
     返回:
         过滤后的数据（Markdown 格式）
+    
+    示例:
+        csv_filter("sales", "price", ">=1000")
+        csv_filter("sales", "order_date", "between 2024-01-15 and 2024-01-31", filters="region=华东")
     """
     try:
         db = get_csv_db()
         
-        df = db.query(table_name, conditions={column: value}, limit=limit)
+        predicate = parse_predicate(value)
+        conditions = parse_filters(filters) if filters else {}
+        if column in conditions:
+            existing = conditions[column]
+            conditions[column] = (existing if isinstance(existing, list) else [existing]) + [predicate]
+        else:
+            conditions[column] = predicate
+        
+        description = ", ".join(
+            f"{col} {item}" for col, condition in conditions.items()
+            for item in (condition if isinstance(condition, list) else [condition])
+        )
+        df = db.query(table_name, conditions=conditions, limit=limit)
         
         if df.empty:
-            return f"未找到满足条件的数据: {column}={value}"
+            return f"未找到满足条件的数据: {description}"
         
-        markdown_table = df.to_markdown(index=False)
-        result = f"过滤结果（{column}={value}）: {len(df)} 行\n\n{markdown_table}"
+        markdown_table = _frame_to_markdown(df)
+        result = f"过滤结果（{description}）: {len(df)} 行\n\n{markdown_table}"
         
         return result
         
@@ -244,6 +1449,105 @@ def csv_filter(table_name: str, column: str, value: str, limit: int = 50) -> str
         return f"CSV 过滤失败: {str(e)}"
 
 
+@tool("csv_aggregate")
+def csv_aggregate(table_name: str, metrics: str, group_by: str = "",
+                  filters: str = "", top_k: int = 500) -> str:
+    """
+    对 CSV 表做分组汇总，直接返回汇总结果（不需要拉取原始数据行）
+    
+    参数:
+        table_name: CSV 表名
+        metrics: 指标，格式 "函数:列名"，多个用逗号分隔。
+                 函数支持 sum/mean/count/min/max/median/nunique 和分位数 p50/p90 等；
+                 列名处可写表达式（如 quantity*price），count:* 表示计行数
+        group_by: 分组列，多个用逗号分隔；日期列可写 order_date:month（year/quarter/month/week/day）
+        filters: 过滤条件，格式 "列名 运算符 值"，多个用逗号分隔；运算符支持
+                 = != > >= < <=、in (a, b)、between a and b、prefix、contains、like，
+                 日期列写 order_date=2024-01 表示整月
+        top_k: 最多返回的组数，超出时按第一个指标降序保留前 K 组（默认 500，0 表示不限制）
+    
+    返回:
+        Markdown 格式的汇总结果
+    
+    示例:
+        csv_aggregate("sales", "sum:quantity*price", filters="region=华东")
+        csv_aggregate("sales", "sum:quantity*price,count:*", group_by="region")
+        csv_aggregate("sales", "sum:quantity", group_by="product", filters="order_date between 2024-01-15 and 2024-01-31")
+        csv_aggregate("employees", "mean:salary,p90:salary", group_by="department")
+    """
+    try:
+        db = get_csv_db()
+        
+        if not db.has_table(table_name):
+            available = ", ".join(db.get_tables())
+            return f"表 '{table_name}' 不存在。\n可用的表: {available}"
+        
+        metric_list = []
+        for item in metrics.split(","):
+            if ":" not in item:
+                return f"指标格式错误: '{item.strip()}'，应为 \"函数:列名\"，例如 sum:price"
+            func, expr = item.split(":", 1)
+            metric_list.append((func.strip().lower(), expr.strip()))
+        
+        group_list = [col.strip() for col in group_by.split(",") if col.strip()]
+        
+        conditions = parse_filters(filters) if filters else {}
+        
+        df = db.aggregate(table_name, metric_list, group_list, conditions or None, top_k)
+        
+        if df.empty:
+            return "汇总结果为空，未找到满足条件的数据。"
+        
+        markdown_table = _frame_to_markdown(df)
+        total_groups = df.attrs.get('total_groups', len(df))
+        if total_groups > len(df):
+            summary = (f"显示前 {len(df)} 组，共 {total_groups} 组"
+                       f"（按 {df.columns[len(group_list)]} 降序截断，可调大 top_k 查看全部）")
+        else:
+            summary = f"{len(df)} 行"
+        return f"汇总结果（{table_name}）: {summary}\n\n{markdown_table}"
+        
+    except Exception as e:
+        return f"CSV 汇总失败: {str(e)}"
+
+
+@tool("csv_sql")
+def csv_sql(query: str) -> str:
+    """
+    用 SQL 查询 CSV 表并返回 Markdown 格式的表格（在本地嵌入式引擎中执行）
+    
+    支持 GROUP BY、JOIN、ORDER BY、窗口函数等，表名即 CSV 文件名（不含扩展名）。
+    统计、汇总类问题请优先使用本工具，直接得到聚合结果，不要拉取原始数据行
+    
+    参数:
+        query: SQL SELECT 查询语句
+    
+    返回:
+        Markdown 格式的查询结果表格
+    
+    示例:
+        SELECT region, SUM(quantity * price) AS 销售额 FROM sales GROUP BY region ORDER BY 销售额 DESC
+    """
+    try:
+        # 安全性检查
+        is_safe, message = is_safe_query(query)
+        if not is_safe:
+            return f"错误: {message}\n\n请只使用 SELECT 语句查询数据。"
+        
+        df = get_csv_db().sql(query)
+        
+        if df.empty:
+            return "查询结果为空，未找到匹配的数据。"
+        
+        markdown_table = _frame_to_markdown(df)
+        result = f"查询成功！共返回 {len(df)} 行数据：\n\n{markdown_table}"
+        
+        return result
+        
+    except Exception as e:
+        return f"CSV SQL 执行失败: {str(e)}\n\n请检查 SQL 语法和表名是否正确。"
+
+
 # 导出的工具
-__all__ = ['csv_query', 'get_csv_schema', 'csv_filter', 'CSVDatabase', 'get_csv_db']
+__all__ = ['csv_query', 'get_csv_schema', 'csv_filter', 'csv_aggregate', 'csv_sql', 'CSVDatabase', 'get_csv_db']
 
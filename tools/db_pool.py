@@ -0,0 +1,205 @@
+"""
+DB Pool - 共享的数据库连接池
+同一个连接串只创建一个 Engine，供 SQLDatabase、schema_reader 和 API 存储服务共用，
+并记录每次取连接的等待时间和连接池饱和度
+"""
+import time
+import threading
+import importlib.util
+from typing import Optional
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine, URL, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+# 异步引擎依赖 SQLAlchemy asyncio 扩展（需要 greenlet，可选）
+try:
+    from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
+    USE_ASYNC_ENGINE = True
+except ImportError:
+    USE_ASYNC_ENGINE = False
+
+# 同步驱动对应的异步驱动（可选依赖，未安装时异步接口退回线程池执行同步查询）
+_ASYNC_DRIVERS = {"mysql": "aiomysql", "sqlite": "aiosqlite"}
+
+# 尝试从 config.py 导入连接池配置，如果失败则使用默认值
+try:
+    from config import DB_POOL_CONFIG
+except ImportError:
+    DB_POOL_CONFIG = {}
+
+DEFAULT_DB_POOL_CONFIG = {
+    "pool_size": 5,                      # 常驻连接数
+    "max_overflow": 10,                  # 高峰时允许额外创建的连接数
+    "pool_timeout": 30,                  # 连接全部占用时等待空闲连接的秒数，超时报错
+    "pool_recycle": 1800,                # 连接使用超过该秒数后重建，避免被 MySQL wait_timeout 断开
+    "pool_pre_ping": True,               # 取出连接前先探活
+    "slow_checkout_ms": 100,             # 取连接等待超过该毫秒数记为一次慢等待
+}
+
+
+def _get_setting(key: str):
+    """读取连接池配置项，未配置时使用默认值"""
+    return DB_POOL_CONFIG.get(key, DEFAULT_DB_POOL_CONFIG[key])
+
+
+def build_mysql_url(db_config: dict) -> str:
+    """由 DB_CONFIG 格式的配置构建 MySQL 连接串（用户名、密码中的 @ : / 等字符会被转义）"""
+    return URL.create(
+        "mysql+mysqlconnector",
+        username=db_config["user"],
+        password=db_config["password"],
+        host=db_config["host"],
+        port=int(db_config["port"]) if db_config.get("port") else None,
+        database=db_config["database"]
+    ).render_as_string(hide_password=False)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """记录取连接等待时间和占用情况的 QueuePool"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.metrics = {
+            "checkouts": 0,          # 取连接次数
+            "wait_total_ms": 0.0,    # 累计等待时间
+            "wait_max_ms": 0.0,      # 最长一次等待
+            "slow_checkouts": 0,     # 等待超过 slow_checkout_ms 的次数
+            "timeouts": 0,           # 等待超时次数
+            "peak_checked_out": 0,   # 同时占用连接数的峰值
+        }
+    
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            with self._stats_lock:
+                self.metrics["timeouts"] += 1
+            raise
+        
+        waited = (time.perf_counter() - start) * 1000
+        with self._stats_lock:
+            self.metrics["checkouts"] += 1
+            self.metrics["wait_total_ms"] += waited
+            self.metrics["wait_max_ms"] = max(self.metrics["wait_max_ms"], waited)
+            if waited >= _get_setting("slow_checkout_ms"):
+                self.metrics["slow_checkouts"] += 1
+            self.metrics["peak_checked_out"] = max(self.metrics["peak_checked_out"], self.checkedout())
+        return connection
+    
+    def stats(self) -> dict:
+        """返回连接池当前状态和累计等待统计"""
+        capacity = self.size() + max(self._max_overflow, 0)
+        with self._stats_lock:
+            metrics = dict(self.metrics)
+        checkouts = metrics["checkouts"]
+        return {
+            **metrics,
+            "wait_avg_ms": metrics["wait_total_ms"] / checkouts if checkouts else 0.0,
+            "pool_size": self.size(),
+            "max_overflow": self._max_overflow,
+            "checked_out": self.checkedout(),
+            "idle": self.checkedin(),
+            "overflow": max(self.overflow(), 0),
+            "saturation": self.checkedout() / capacity if capacity > 0 else None,
+        }
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    """异步引擎使用的带统计 QueuePool"""
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(url: str) -> Engine:
+    """
+    获取连接串对应的共享 Engine（首次调用时按 DB_POOL_CONFIG 创建连接池）
+    
+    参数:
+        url: SQLAlchemy 连接串
+    """
+    with _engines_lock:
+        engine = _engines.get(url)
+        if engine is None:
+            engine = create_engine(
+                url,
+                poolclass=InstrumentedQueuePool,
+                pool_size=_get_setting("pool_size"),
+                max_overflow=_get_setting("max_overflow"),
+                pool_timeout=_get_setting("pool_timeout"),
+                pool_recycle=_get_setting("pool_recycle"),
+                pool_pre_ping=_get_setting("pool_pre_ping"),
+            )
+            _engines[url] = engine
+        return engine
+
+
+def to_async_url(url: str) -> Optional[str]:
+    """把同步连接串换成异步驱动（mysql -> aiomysql），驱动未安装时返回 None"""
+    parsed = make_url(url)
+    driver = _ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if not USE_ASYNC_ENGINE or driver is None or importlib.util.find_spec(driver) is None:
+        return None
+    return parsed.set(drivername=f"{parsed.get_backend_name()}+{driver}").render_as_string(hide_password=False)
+
+
+def get_async_engine(url: str) -> Optional["AsyncEngine"]:
+    """
+    获取连接串对应的共享异步 Engine（连接池配置与同步 Engine 相同）
+    
+    参数:
+        url: 同步驱动的 SQLAlchemy 连接串，自动换成对应的异步驱动
+    
+    返回:
+        AsyncEngine；异步驱动未安装时返回 None
+    """
+    async_url = to_async_url(url)
+    if async_url is None:
+        return None
+    
+    with _engines_lock:
+        engine = _engines.get(async_url)
+        if engine is None:
+            engine = create_async_engine(
+                async_url,
+                poolclass=InstrumentedAsyncQueuePool,
+                pool_size=_get_setting("pool_size"),
+                max_overflow=_get_setting("max_overflow"),
+                pool_timeout=_get_setting("pool_timeout"),
+                pool_recycle=_get_setting("pool_recycle"),
+                pool_pre_ping=_get_setting("pool_pre_ping"),
+            )
+            _engines[async_url] = engine
+        return engine
+
+
+def get_pool_stats() -> dict:
+    """返回所有共享连接池（含异步）的统计信息 {连接串（隐藏密码）: 统计}"""
+    with _engines_lock:
+        engines = list(_engines.items())
+    pools = ((url, getattr(engine, "sync_engine", engine).pool) for url, engine in engines)
+    return {
+        make_url(url).render_as_string(hide_password=True): pool.stats()
+        for url, pool in pools
+        if isinstance(pool, InstrumentedQueuePool)
+    }
+
+
+def dispose_all():
+    """关闭所有共享连接池（进程退出或测试时调用）"""
+    with _engines_lock:
+        for engine in _engines.values():
+            if hasattr(engine, "sync_engine"):
+                # 异步连接只能在事件循环中关闭，这里只丢弃连接池
+                engine.sync_engine.dispose(close=False)
+            else:
+                engine.dispose()
+        _engines.clear()
+
+
+__all__ = ['get_engine', 'get_async_engine', 'get_pool_stats', 'dispose_all',
+           'build_mysql_url', 'to_async_url', 'InstrumentedQueuePool', 'USE_ASYNC_ENGINE']
@@ -0,0 +1,198 @@
+"""
+Join Graph - 按外键建立的表关联图
+求连接一组表所需的最少关联（近似 Steiner 树），生成给 LLM 的关联路径说明，
+并检查生成的 SQL 中的 JOIN 条件是否与外键一致
+"""
+from collections import deque
+from typing import Optional
+
+from tools.sql_cache import tokenize_sql
+
+# JOIN 条件之后出现这些关键字时，ON 子句结束
+_CLAUSE_END_WORDS = {"JOIN", "INNER", "LEFT", "RIGHT", "CROSS", "FULL", "NATURAL", "STRAIGHT_JOIN",
+                     "WHERE", "GROUP", "HAVING", "ORDER", "LIMIT", "UNION", "WINDOW"}
+# 表名后面出现这些单词时不是别名
+_NOT_ALIAS_WORDS = _CLAUSE_END_WORDS | {"ON", "USING", "AS", "SELECT", "FROM", "OUTER", "FORCE", "USE", "IGNORE"}
+
+
+class JoinGraph:
+    """外键关联图（无向，边上保存关联列）"""
+    
+    def __init__(self, schema: dict):
+        """
+        由 reflect_schema 的结果建立关联图
+        
+        参数:
+            schema: {表名: {"foreign_keys": [{"constrained_columns", "referred_table", "referred_columns"}], ...}}
+        """
+        self.tables = list(schema)
+        self._names = {table.lower(): table for table in schema}
+        # 表 -> {相邻表: [(本表列, 相邻表列), ...]}
+        self.adjacency = {table: {} for table in schema}
+        # 外键列对，用于校验 JOIN 条件：{frozenset({(表, 列), (表, 列)})}（小写）
+        self.key_pairs = set()
+        # 主键和外键两端的列：{(表, 列)}（小写），只有两边都是键列的错误关联才报告
+        self.key_columns = set()
+        
+        for table, info in schema.items():
+            self.key_columns.update((table.lower(), column.lower()) for column in info.get("primary_keys", []))
+            for fk in info.get("foreign_keys", []):
+                referred = fk["referred_table"]
+                pairs = list(zip(fk["constrained_columns"], fk["referred_columns"]))
+                for column, referred_column in pairs:
+                    left, right = (table.lower(), column.lower()), (referred.lower(), referred_column.lower())
+                    self.key_pairs.add(frozenset({left, right}))
+                    self.key_columns.update((left, right))
+                if referred not in self.adjacency or referred == table:
+                    continue
+                self.adjacency[table].setdefault(referred, pairs)
+                self.adjacency[referred].setdefault(table, [(b, a) for a, b in pairs])
+    
+    def resolve(self, name: str) -> Optional[str]:
+        """按不区分大小写的表名找到图中的表，去掉库名前缀和反引号"""
+        name = name.strip("`").split(".")[-1].strip("`")
+        return self._names.get(name.lower())
+    
+    def join_tree(self, tables: list) -> list:
+        """
+        求连接给定表的最少关联边（近似 Steiner 树）
+        
+        从第一张表出发，每次用多源 BFS 找到离当前树最近的未连接表，把路径上的表和边并入树中；
+        外键图上不连通的表忽略
+        
+        返回:
+            [(已在树中的表, 新加入的表, [(左表列, 右表列), ...]), ...]，按加入顺序
+        """
+        terminals = [table for table in dict.fromkeys(self.resolve(t) for t in tables) if table]
+        if not terminals:
+            return []
+        
+        tree = [terminals[0]]
+        remaining = set(terminals[1:])
+        edges = []
+        while remaining:
+            previous = {table: None for table in tree}
+            queue = deque(tree)
+            found = None
+            while queue:
+                table = queue.popleft()
+                if table in remaining:
+                    found = table
+                    break
+                for neighbor in self.adjacency[table]:
+                    if neighbor not in previous:
+                        previous[neighbor] = table
+                        queue.append(neighbor)
+            if found is None:
+                break
+            
+            path = []
+            while previous[found] is not None:
+                path.append((previous[found], found))
+                found = previous[found]
+            for parent, child in reversed(path):
+                edges.append((parent, child, self.adjacency[parent][child]))
+                tree.append(child)
+                remaining.discard(child)
+        return edges
+    
+    def describe(self, tables: list) -> str:
+        """
+        生成连接给定表的关联路径说明（放入 NL2SQL 提示词）
+        
+        返回:
+            多行文本，每条边一行，例如 "- Customer → Invoice: Customer.CustomerId = Invoice.CustomerId"；
+            不需要关联时返回空字符串
+        """
+        edges = self.join_tree(tables)
+        if not edges:
+            return ""
+        
+        lines = ["表关联路径（按外键，JOIN 时使用这些条件）："]
+        for parent, child, pairs in edges:
+            conditions = " AND ".join(f"{parent}.{a} = {child}.{b}" for a, b in pairs)
+            lines.append(f"- {parent} → {child}: {conditions}")
+        return "\n".join(lines)
+    
+    def validate_joins(self, sql: str) -> list:
+        """
+        检查 SQL 中的 JOIN 是否与外键一致
+        
+        - JOIN 后没有 ON / USING 条件（笛卡尔积）；显式的 CROSS JOIN 和 NATURAL JOIN 不算
+        - ON 中比较的两张表之间有外键，两边都是键列（主键或外键列），但不是这条外键的列对，
+          例如 Invoice.InvoiceId = Customer.CustomerId；比较普通列（如国家）的关联和
+          没有外键的两张表之间的关联都不检查
+        
+        返回:
+            问题描述列表，没有问题时为空列表
+        """
+        tokens = tokenize_sql(sql)
+        aliases = {}
+        joins = []        # [(表名, 是否有 ON/USING)]
+        conditions = []   # [((限定名, 列), (限定名, 列))]
+        
+        i = 0
+        in_on = False
+        while i < len(tokens):
+            kind, value = tokens[i]
+            upper = value.upper() if kind == "word" else value
+            if upper in ("FROM", "JOIN") and i + 1 < len(tokens) and tokens[i + 1][0] in ("word", "quoted"):
+                in_on = False
+                explicit = i > 0 and tokens[i - 1][0] == "word" and tokens[i - 1][1].upper() in ("CROSS", "NATURAL")
+                i, table, alias = self._read_table(tokens, i + 1)
+                aliases[(alias or table).lower()] = table
+                aliases.setdefault(table.lower(), table)
+                if upper == "JOIN":
+                    joins.append([table, explicit])
+                continue
+            if upper in ("ON", "USING") and joins:
+                joins[-1][1] = True
+                in_on = upper == "ON"
+            elif upper in _CLAUSE_END_WORDS:
+                in_on = False
+            elif in_on and value == "=" and i >= 3 and i + 3 < len(tokens):
+                left, right = tokens[i - 3:i], tokens[i + 1:i + 4]
+                if left[1][1] == "." and right[1][1] == ".":
+                    conditions.append(((left[0][1], left[2][1]), (right[0][1], right[2][1])))
+            i += 1
+        
+        issues = []
+        for table, has_condition in joins:
+            if not has_condition:
+                issues.append(f"JOIN {table} 缺少 ON 关联条件，会产生笛卡尔积")
+        
+        for (left_name, left_column), (right_name, right_column) in conditions:
+            left = self.resolve(aliases.get(left_name.strip("`").lower(), left_name))
+            right = self.resolve(aliases.get(right_name.strip("`").lower(), right_name))
+            if not left or not right or left == right or right not in self.adjacency[left]:
+                continue
+            left_key = (left.lower(), left_column.strip("`").lower())
+            right_key = (right.lower(), right_column.strip("`").lower())
+            if frozenset({left_key, right_key}) in self.key_pairs:
+                continue
+            if left_key not in self.key_columns or right_key not in self.key_columns:
+                continue
+            
+            expected = " AND ".join(f"{left}.{a} = {right}.{b}" for a, b in self.adjacency[left][right])
+            issues.append(f"{left}.{left_column} = {right}.{right_column} 不是外键关联，应为：\n- {expected}")
+        return issues
+    
+    @staticmethod
+    def _read_table(tokens: list, i: int) -> tuple:
+        """读取 FROM / JOIN 后的表名（含库名前缀）和可选别名，返回 (下一个位置, 表名, 别名)"""
+        name = tokens[i][1].strip("`")
+        i += 1
+        while i + 1 < len(tokens) and tokens[i][1] == "." and tokens[i + 1][0] in ("word", "quoted"):
+            name = tokens[i + 1][1].strip("`")
+            i += 2
+        
+        alias = None
+        if i < len(tokens) and tokens[i][0] == "word" and tokens[i][1].upper() == "AS":
+            i += 1
+        if i < len(tokens) and tokens[i][0] in ("word", "quoted") and tokens[i][1].upper() not in _NOT_ALIAS_WORDS:
+            alias = tokens[i][1].strip("`")
+            i += 1
+        return i, name, alias
+
+
+__all__ = ['JoinGraph']
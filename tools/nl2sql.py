@@ -21,7 +21,9 @@ client = OpenAI()
 
 # 导入动态 Schema 读取器
 try:
-    from tools.schema_reader import get_cached_schema, get_cached_smart_schema
+    from tools.schema_reader import (
+        get_cached_schema, get_cached_smart_schema, get_relevant_schema, validate_sql_joins
+    )
     USE_DYNAMIC_SCHEMA = True
 except ImportError:
     USE_DYNAMIC_SCHEMA = False
@@ -35,6 +37,21 @@ FALLBACK_SCHEMA = """
 """
 
 
+def _complete_sql(messages: list) -> str:
+    """调用 LLM 生成 SQL，并清理可能的 markdown 格式"""
+    response = client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=messages,
+        temperature=0.0,  # 使用确定性输出
+        max_tokens=500
+    )
+    
+    sql = response.choices[0].message.content.strip()
+    
+    # 清理可能的 markdown 格式
+    return sql.replace("```sql", "").replace("```", "").strip()
+
+
 def generate_sql_with_llm(question: str, schema: str = None, use_dynamic: bool = True) -> str:
     """
     使用 LLM 将自然语言问题转换为 SQL 查询
@@ -50,10 +67,10 @@ def generate_sql_with_llm(question: str, schema: str = None, use_dynamic: bool =
     # 决定使用哪个 schema
     if schema is None:
         if use_dynamic and USE_DYNAMIC_SCHEMA:
-            # 使用动态读取的 schema（推荐）
+            # 使用动态读取的 schema（推荐），只包含与问题相关的表
             try:
-                schema = get_cached_schema()
-                print("[NL2SQL] ✅ 使用动态读取的数据库 Schema")
+                schema = get_relevant_schema(question)
+                print("[NL2SQL] ✅ 使用动态读取的数据库 Schema（按问题筛选相关表）")
             except Exception as e:
                 print(f"[NL2SQL] ❌ 动态读取失败: {e}")
                 schema = FALLBACK_SCHEMA
@@ -71,7 +88,7 @@ def generate_sql_with_llm(question: str, schema: str = None, use_dynamic: bool =
 要求：
 1. 只生成 SELECT 查询语句（禁止 INSERT/UPDATE/DELETE）
 2. 使用标准 MySQL 语法
-3. 适当使用 JOIN 关联表
+3. 适当使用 JOIN 关联表，关联条件按表结构后给出的外键关联路径
 4. 添加 LIMIT 限制结果数量（除非明确要求所有数据）
 5. 使用中文别名（AS）使结果易读
 6. 只返回 SQL 语句，不要任何解释
@@ -85,20 +102,23 @@ SQL: SELECT Name AS 音轨名称, UnitPrice AS 价格 FROM Track ORDER BY UnitPr
 """
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": question}
-            ],
-            temperature=0.0,  # 使用确定性输出
-            max_tokens=500
-        )
-        
-        sql = response.choices[0].message.content.strip()
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": question}
+        ]
+        sql = _complete_sql(messages)
         
-        # 清理可能的 markdown 格式
-        sql = sql.replace("```sql", "").replace("```", "").strip()
+        # JOIN 条件与外键不一致时，把问题反馈给 LLM 重新生成一次
+        if use_dynamic and USE_DYNAMIC_SCHEMA:
+            issues = validate_sql_joins(sql)
+            if issues:
+                print(f"[NL2SQL] ⚠️ JOIN 条件与外键不一致，重新生成: {issues}")
+                feedback = "\n".join(f"- {issue}" for issue in issues)
+                messages += [
+                    {"role": "assistant", "content": sql},
+                    {"role": "user", "content": f"SQL 中的 JOIN 条件有误：\n{feedback}\n\n请按外键关联修正，只返回 SQL 语句。"}
+                ]
+                sql = _complete_sql(messages)
         
         return sql
         
@@ -0,0 +1,114 @@
+"""
+Schema Cache - 数据库 Schema 的本地磁盘缓存
+按数据库标识（host:port/database）保存生成好的 Schema 文本，并记录生成时的表结构指纹，
+启动时直接加载，表结构变化后由指纹检查发现并重建
+"""
+import os
+import json
+import time
+import hashlib
+from typing import Optional
+from sqlalchemy import text
+
+# 对表注释、列定义（含列注释）和键约束分别求 CRC32 的异或和与行数：与行顺序无关，
+# 只读 information_schema 的元数据（注释会进入 Schema 文本和检索索引，变化时同样需要重建）
+_FINGERPRINT_SQL = """
+    SELECT
+        (SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE()),
+        (SELECT COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', TABLE_NAME, TABLE_COMMENT))), 0)
+           FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE()),
+        (SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE()),
+        (SELECT COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', TABLE_NAME, COLUMN_NAME, ORDINAL_POSITION,
+                                                 COLUMN_TYPE, IS_NULLABLE, COLUMN_KEY, COLUMN_COMMENT))), 0)
+           FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE()),
+        (SELECT COUNT(*) FROM information_schema.KEY_COLUMN_USAGE WHERE TABLE_SCHEMA = DATABASE()),
+        (SELECT COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', TABLE_NAME, CONSTRAINT_NAME, COLUMN_NAME,
+                                                 REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME))), 0)
+           FROM information_schema.KEY_COLUMN_USAGE WHERE TABLE_SCHEMA = DATABASE())
+"""
+
+
+def database_identity(engine) -> str:
+    """数据库标识：驱动类型、主机、端口和库名（不含用户名和密码）"""
+    url = engine.url
+    return f"{url.get_backend_name()}://{url.host or ''}:{url.port or ''}/{url.database or ''}"
+
+
+def schema_fingerprint(engine) -> str:
+    """
+    计算当前表结构的指纹，表、列、类型、注释、主键或外键变化时指纹随之变化
+    
+    MySQL 只执行一条 information_schema 聚合查询；其他数据库对完整反射结果求哈希
+    """
+    if engine.dialect.name == "mysql":
+        with engine.connect() as conn:
+            row = conn.execute(text(_FINGERPRINT_SQL)).one()
+        return ":".join(str(value) for value in row)
+    
+    from tools.schema_reader import reflect_schema
+    payload = json.dumps(reflect_schema(engine), sort_keys=True, default=str)
+    return hashlib.md5(payload.encode("utf-8")).hexdigest()
+
+
+class SchemaCache:
+    """Schema 磁盘缓存（一个数据库一个 JSON 文件）"""
+    
+    CACHE_VERSION = 2  # 2: 记录每项的生成时间
+    
+    def __init__(self, cache_dir: str, identity: str):
+        """
+        初始化 Schema 缓存
+        
+        参数:
+            cache_dir: 缓存文件目录
+            identity: 数据库标识（见 database_identity）
+        """
+        self.cache_dir = cache_dir
+        self.identity = identity
+        os.makedirs(cache_dir, exist_ok=True)
+        key = hashlib.md5(identity.encode("utf-8")).hexdigest()[:16]
+        self.path = os.path.join(cache_dir, f"schema_{key}.json")
+    
+    def load(self) -> Optional[dict]:
+        """
+        读取缓存
+        
+        返回:
+            {"fingerprint": 生成时的表结构指纹, "entries": {名称: Schema 文本},
+             "built_at": {名称: 生成时间戳}, "saved_at": 时间戳}；
+            缓存不存在、版本或数据库标识不符时返回 None
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        
+        if data.get("version") != self.CACHE_VERSION or data.get("identity") != self.identity:
+            return None
+        return data
+    
+    def save(self, fingerprint: str, entries: dict, built_at: dict):
+        """写入缓存（先写临时文件再原子替换），built_at 为各项的生成时间戳"""
+        data = {
+            "version": self.CACHE_VERSION,
+            "identity": self.identity,
+            "fingerprint": fingerprint,
+            "saved_at": time.time(),
+            "entries": entries,
+            "built_at": built_at
+        }
+        try:
+            with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(self.path + ".tmp", self.path)
+        except Exception as e:
+            print(f"⚠️  写入 Schema 缓存失败: {e}")
+    
+    def invalidate(self):
+        """删除缓存文件"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+__all__ = ['SchemaCache', 'schema_fingerprint', 'database_identity']
@@ -0,0 +1,165 @@
+"""
+Schema Index - 按问题检索相关表的本地索引
+对表名、列名、注释和示例值建立 BM25 索引（英文按单词和字符 3-gram，中文按单字和双字切分），
+并用中英文术语表把中文问题映射到英文表名/列名，选出最相关的表后沿外键补全关联路径
+"""
+import re
+import math
+from collections import Counter
+from typing import Optional
+
+from tools.join_graph import JoinGraph
+
+# 中文业务术语 -> 表名/列名中常见的英文单词（可通过 SCHEMA_CONFIG["glossary"] 扩展）
+DEFAULT_GLOSSARY = {
+    "客户": "customer", "顾客": "customer", "用户": "customer user",
+    "员工": "employee", "雇员": "employee", "销售代表": "employee support rep",
+    "经理": "employee reports manager", "上级": "reports manager",
+    "发票": "invoice", "订单": "invoice order", "账单": "invoice billing",
+    "明细": "line item detail", "音轨": "track", "歌曲": "track song", "曲目": "track",
+    "专辑": "album", "艺人": "artist", "歌手": "artist", "艺术家": "artist", "乐队": "artist",
+    "流派": "genre", "风格": "genre", "类型": "genre type", "播放列表": "playlist",
+    "歌单": "playlist", "媒体": "media", "格式": "media type format",
+    "销售": "invoice total sales", "销售额": "invoice total unitprice quantity",
+    "收入": "invoice total", "消费": "invoice total", "金额": "total amount price",
+    "总额": "total", "价格": "price unitprice", "单价": "unitprice price", "数量": "quantity",
+    "时长": "milliseconds duration", "大小": "bytes size", "作曲": "composer",
+    "国家": "country", "城市": "city", "州": "state", "地址": "address", "邮编": "postalcode",
+    "电话": "phone", "邮箱": "email", "公司": "company", "职位": "title",
+    "名称": "name title", "名字": "name firstname lastname", "姓名": "firstname lastname name",
+    "日期": "date", "时间": "date time", "年": "date year", "月": "date month",
+    "入职": "hiredate", "生日": "birthdate",
+}
+
+_WORD_PATTERN = re.compile(r"[A-Za-z]+|\d+|[一-鿿]+")
+_CAMEL_PATTERN = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def tokenize(text: str) -> list:
+    """
+    切分检索词
+    
+    英文：按驼峰和下划线拆词，小写并去掉复数 s，再加上整词和字符 3-gram（匹配部分拼写）；
+    中文：单字和相邻双字
+    """
+    tokens = []
+    for chunk in _WORD_PATTERN.findall(str(text)):
+        if chunk[0] >= "一":
+            tokens.extend(chunk)
+            tokens.extend(chunk[i:i + 2] for i in range(len(chunk) - 1))
+            continue
+        
+        parts = [part.lower() for part in _CAMEL_PATTERN.findall(chunk)]
+        words = parts + ([chunk.lower()] if len(parts) > 1 else [])
+        for word in words:
+            if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+                word = word[:-1]
+            tokens.append(word)
+            if len(word) > 3:
+                tokens.extend(f"#{word[i:i + 3]}" for i in range(len(word) - 2))
+    return tokens
+
+
+class SchemaIndex:
+    """表级 BM25 检索索引"""
+    
+    K1 = 1.5
+    B = 0.75
+    MIN_SCORE_RATIO = 0.2  # 得分低于最高分该比例的表视为噪声匹配（如字符 3-gram 偶然重合）
+    
+    def __init__(self, schema: dict, sample_values: Optional[dict] = None,
+                 glossary: Optional[dict] = None, join_graph: Optional[JoinGraph] = None):
+        """
+        建立索引
+        
+        参数:
+            schema: reflect_schema 的返回值
+            sample_values: {表名: {列名: [示例值]}}，可选
+            glossary: 中文术语 -> 英文单词，与 DEFAULT_GLOSSARY 合并
+            join_graph: 外键关联图，默认由 schema 建立
+        """
+        self.schema = schema
+        self.glossary = {**DEFAULT_GLOSSARY, **(glossary or {})}
+        sample_values = sample_values or {}
+        
+        self.documents = {}
+        for table, info in schema.items():
+            # 表名权重最高，其次是列名和注释，示例值最低
+            tokens = tokenize(table) * 3
+            if info.get("comment"):
+                tokens += tokenize(info["comment"]) * 2
+            for col in info["columns"]:
+                tokens += tokenize(col["name"])
+                if col.get("comment"):
+                    tokens += tokenize(col["comment"])
+            for values in sample_values.get(table, {}).values():
+                for value in values:
+                    tokens += tokenize(value)
+            self.documents[table] = Counter(tokens)
+        
+        self.lengths = {table: sum(doc.values()) for table, doc in self.documents.items()}
+        self.avg_length = (sum(self.lengths.values()) / len(self.lengths)) if self.lengths else 0.0
+        document_frequency = Counter(token for doc in self.documents.values() for token in doc)
+        total = len(self.documents)
+        self.idf = {
+            token: math.log(1 + (total - df + 0.5) / (df + 0.5))
+            for token, df in document_frequency.items()
+        }
+        
+        # 外键关联图，用于补全关联路径
+        self.join_graph = join_graph or JoinGraph(schema)
+    
+    def _query_tokens(self, question: str) -> list:
+        """问题的检索词，包括术语表中出现的中文词对应的英文单词"""
+        tokens = tokenize(question)
+        for term, expansion in self.glossary.items():
+            if term in question:
+                tokens += tokenize(expansion)
+        return tokens
+    
+    def search(self, question: str, top_k: int = 5) -> list:
+        """
+        按 BM25 得分检索相关表
+        
+        返回:
+            [(表名, 得分), ...]，按得分从高到低，不含得分为 0 的表
+        """
+        query = Counter(self._query_tokens(question))
+        scores = []
+        for table, doc in self.documents.items():
+            norm = self.K1 * (1 - self.B + self.B * self.lengths[table] / (self.avg_length or 1))
+            score = 0.0
+            for token, count in query.items():
+                tf = doc.get(token)
+                if tf:
+                    score += count * self.idf[token] * tf * (self.K1 + 1) / (tf + norm)
+            if score > 0:
+                scores.append((table, score))
+        scores.sort(key=lambda item: item[1], reverse=True)
+        return scores[:top_k]
+    
+    def select_tables(self, question: str, top_k: int = 5, max_tables: Optional[int] = None) -> list:
+        """
+        选出与问题相关的表：BM25 得分前 top_k 的表，再补上把它们连接起来的最少关联树上的中间表
+        
+        参数:
+            question: 用户问题
+            top_k: 按得分选取的表数
+            max_tables: 补全路径后的表数上限，None 表示不限制
+        
+        返回:
+            表名列表（得分高的在前，补全的中间表在后）；没有任何匹配时返回空列表
+        """
+        scores = self.search(question, top_k)
+        if not scores:
+            return []
+        hits = [table for table, score in scores if score >= scores[0][1] * self.MIN_SCORE_RATIO]
+        
+        selected = list(hits)
+        for _, table, _ in self.join_graph.join_tree(hits):
+            if table not in selected and (not max_tables or len(selected) < max_tables):
+                selected.append(table)
+        return selected
+
+
+__all__ = ['SchemaIndex', 'tokenize', 'DEFAULT_GLOSSARY']
@@ -2,8 +2,221 @@
 Schema Reader - 动态数据库结构读取工具
 自动从数据库中读取表结构，无需手动维护
 """
+import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 from sqlalchemy import inspect, MetaData, text
 from tools.sql_tool import get_db
+from tools.schema_cache import SchemaCache, schema_fingerprint, database_identity
+from tools.schema_index import SchemaIndex
+from tools.join_graph import JoinGraph
+
+# 尝试从 config.py 导入 Schema 缓存配置，如果失败则使用默认值
+try:
+    from config import SCHEMA_CONFIG
+except ImportError:
+    SCHEMA_CONFIG = {}
+
+DEFAULT_SCHEMA_CONFIG = {
+    "cache_enabled": True,               # 是否把生成的 Schema 缓存到磁盘，重启后直接加载
+    "cache_dir": "data/.cache/schema",   # 缓存目录（按数据库 host:port/库名 分文件保存）
+    "verify_interval": 300,              # 后台检查表结构指纹的间隔（秒），变化时重建缓存；None 表示只在启动时检查一次
+    "data_ttl": 3600,                    # 行数、示例值等随数据变化的缓存项的有效期（秒），None 表示只在表结构变化时重建
+    "relevant_tables": 5,                # NL2SQL 提示词中按问题检索选取的表数（另加外键路径上的中间表）
+    "full_schema_max_tables": 15,        # 表数不超过该值时直接使用完整 Schema
+    "index_sample_values": False,        # 检索索引是否包含各表的示例值（真实数据，可能含个人信息，会写入磁盘缓存）
+    "glossary": {},                      # 额外的中文术语 -> 英文表名/列名单词，补充内置术语表
+}
+
+
+def _get_setting(key: str):
+    """读取 Schema 缓存配置项，未配置时使用默认值"""
+    return SCHEMA_CONFIG.get(key, DEFAULT_SCHEMA_CONFIG[key])
+
+
+
+# information_schema 批量读取：每类信息一条查询，而不是每张表 3 次 Inspector 调用
+_COLUMNS_SQL = """
+    SELECT c.TABLE_NAME, c.COLUMN_NAME, c.COLUMN_TYPE, c.IS_NULLABLE, c.COLUMN_COMMENT, t.TABLE_COMMENT
+    FROM information_schema.COLUMNS c
+    JOIN information_schema.TABLES t
+      ON t.TABLE_SCHEMA = c.TABLE_SCHEMA AND t.TABLE_NAME = c.TABLE_NAME
+    WHERE c.TABLE_SCHEMA = DATABASE() AND t.TABLE_TYPE = 'BASE TABLE'
+    ORDER BY c.TABLE_NAME, c.ORDINAL_POSITION
+"""
+
+_KEYS_SQL = """
+    SELECT TABLE_NAME, CONSTRAINT_NAME, COLUMN_NAME,
+           REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME
+    FROM information_schema.KEY_COLUMN_USAGE
+    WHERE TABLE_SCHEMA = DATABASE()
+      AND (CONSTRAINT_NAME = 'PRIMARY' OR REFERENCED_TABLE_NAME IS NOT NULL)
+    ORDER BY TABLE_NAME, CONSTRAINT_NAME, ORDINAL_POSITION
+"""
+
+# 不带参数显示的整数类型（int(11) 的显示宽度没有意义）
+_INTEGER_TYPES = {"TINYINT", "SMALLINT", "MEDIUMINT", "INT", "INTEGER", "BIGINT"}
+
+
+def _as_text(value) -> str:
+    """部分 mysql-connector 版本以 bytes 返回 information_schema 的文本列"""
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode()
+    return value
+
+
+def _format_column_type(column_type: str) -> str:
+    """把 information_schema 的 COLUMN_TYPE 转成与 Inspector 相同的写法（如 varchar(40) -> VARCHAR(40)）"""
+    column_type = _as_text(column_type)
+    match = re.match(r"(\w+)(?:\((.*)\))?(.*)", column_type.strip())
+    if not match:
+        return column_type.upper()
+    name, args, modifiers = match.groups()
+    name = name.upper()
+    if name == "INT":
+        name = "INTEGER"
+    
+    if args and name not in _INTEGER_TYPES:
+        if name not in ("ENUM", "SET"):
+            args = ", ".join(arg.strip() for arg in args.split(","))
+        name = f"{name}({args})"
+    modifiers = modifiers.strip().upper()
+    return f"{name} {modifiers}" if modifiers else name
+
+
+def _reflect_with_information_schema(engine) -> dict:
+    """MySQL：用两条 information_schema 查询读取所有表的列、主键和外键"""
+    schema = {}
+    with engine.connect() as conn:
+        rows = conn.execute(text(_COLUMNS_SQL))
+        for table, column, column_type, nullable, column_comment, table_comment in rows:
+            table_info = schema.setdefault(table, {
+                "columns": [], "primary_keys": [], "foreign_keys": [],
+                "comment": _as_text(table_comment) or None,
+            })
+            table_info["columns"].append({
+                "name": column,
+                "type": _format_column_type(column_type),
+                "nullable": nullable == "YES",
+                "comment": _as_text(column_comment) or None,
+            })
+        
+        foreign_keys = {}
+        for table, constraint, column, referred_table, referred_column in conn.execute(text(_KEYS_SQL)):
+            if table not in schema:
+                continue
+            if constraint == "PRIMARY":
+                schema[table]["primary_keys"].append(column)
+                continue
+            fk = foreign_keys.get((table, constraint))
+            if fk is None:
+                fk = {"constrained_columns": [], "referred_table": referred_table, "referred_columns": []}
+                foreign_keys[(table, constraint)] = fk
+                schema[table]["foreign_keys"].append(fk)
+            fk["constrained_columns"].append(column)
+            fk["referred_columns"].append(referred_column)
+    return schema
+
+
+def _table_comment(inspector, table: str) -> Optional[str]:
+    """读取表注释，数据库不支持时返回 None"""
+    try:
+        return inspector.get_table_comment(table).get("text")
+    except NotImplementedError:
+        return None
+
+
+def _reflect_with_inspector(engine) -> dict:
+    """其他数据库：逐表用 Inspector 读取（没有 MySQL information_schema 时使用）"""
+    inspector = inspect(engine)
+    schema = {}
+    for table in inspector.get_table_names():
+        schema[table] = {
+            "columns": [
+                {"name": col["name"], "type": str(col["type"]),
+                 "nullable": col.get("nullable", True), "comment": col.get("comment")}
+                for col in inspector.get_columns(table)
+            ],
+            "primary_keys": inspector.get_pk_constraint(table).get("constrained_columns", []),
+            "foreign_keys": [
+                {key: fk[key] for key in ("constrained_columns", "referred_table", "referred_columns")}
+                for fk in inspector.get_foreign_keys(table)
+            ],
+            "comment": _table_comment(inspector, table),
+        }
+    return schema
+
+
+def reflect_schema(engine) -> dict:
+    """
+    批量读取所有表的结构
+    
+    MySQL 通过 information_schema 一次读取全部表（2 次查询），其他数据库退回逐表 Inspector
+    
+    返回:
+        {表名: {"columns": [{"name", "type", "nullable", "comment"}],
+                "primary_keys": [列名],
+                "foreign_keys": [{"constrained_columns", "referred_table", "referred_columns"}],
+                "comment": 表注释}}
+    """
+    if engine.dialect.name == "mysql":
+        return _reflect_with_information_schema(engine)
+    return _reflect_with_inspector(engine)
+
+
+def format_schema(schema: dict, detailed: bool = True) -> str:
+    """
+    把 reflect_schema 的结果格式化为给 LLM 的表结构描述
+    
+    参数:
+        schema: reflect_schema 的返回值
+        detailed: 是否包含详细的列信息（类型、主键、外键等）
+    """
+    if not schema:
+        return "数据库中没有表"
+    
+    schema_lines = []
+    schema_lines.append("数据库表结构（自动读取）：\n")
+    
+    # 遍历每个表
+    for idx, (table_name, table_info) in enumerate(schema.items(), 1):
+        schema_lines.append(f"{idx}. {table_name} (表)")
+        
+        if detailed:
+            primary_keys = table_info["primary_keys"]
+            fk_columns = {fk['constrained_columns'][0]: fk['referred_table']
+                          for fk in table_info["foreign_keys"] if fk['constrained_columns']}
+            
+            # 格式化列信息
+            for col in table_info["columns"]:
+                col_name = col['name']
+                
+                # 构建列描述
+                col_desc = f"   - {col_name} ({col['type']}"
+                
+                # 添加约束信息
+                constraints = []
+                if col_name in primary_keys:
+                    constraints.append("PRIMARY KEY")
+                if col_name in fk_columns:
+                    constraints.append(f"FOREIGN KEY -> {fk_columns[col_name]}")
+                if not col.get('nullable', True):
+                    constraints.append("NOT NULL")
+                
+                if constraints:
+                    col_desc += f", {', '.join(constraints)}"
+                
+                col_desc += ")"
+                schema_lines.append(col_desc)
+        
+        schema_lines.append("")  # 空行分隔
+    
+    # 添加表数量统计
+    schema_lines.insert(1, f"共 {len(schema)} 个表\n")
+    
+    return "\n".join(schema_lines)
 
 
 def get_dynamic_schema(detailed: bool = True) -> str:
@@ -18,68 +231,36 @@ def get_dynamic_schema(detailed: bool = True) -> str:
     """
     try:
         db = get_db()
-        inspector = inspect(db.engine)
-        
-        schema_lines = []
-        schema_lines.append("数据库表结构（自动读取）：\n")
-        
-        # 获取所有表名
-        table_names = inspector.get_table_names()
-        
-        if not table_names:
-            return "数据库中没有表"
-        
-        # 遍历每个表
-        for idx, table_name in enumerate(table_names, 1):
-            schema_lines.append(f"{idx}. {table_name} (表)")
-            
-            if detailed:
-                # 获取列信息
-                columns = inspector.get_columns(table_name)
-                
-                # 获取主键
-                pk_constraint = inspector.get_pk_constraint(table_name)
-                primary_keys = pk_constraint.get('constrained_columns', [])
-                
-                # 获取外键
-                foreign_keys = inspector.get_foreign_keys(table_name)
-                fk_columns = {fk['constrained_columns'][0]: fk['referred_table'] 
-                             for fk in foreign_keys if fk['constrained_columns']}
-                
-                # 格式化列信息
-                for col in columns:
-                    col_name = col['name']
-                    col_type = str(col['type'])
-                    
-                    # 构建列描述
-                    col_desc = f"   - {col_name} ({col_type}"
-                    
-                    # 添加约束信息
-                    constraints = []
-                    if col_name in primary_keys:
-                        constraints.append("PRIMARY KEY")
-                    if col_name in fk_columns:
-                        constraints.append(f"FOREIGN KEY -> {fk_columns[col_name]}")
-                    if not col.get('nullable', True):
-                        constraints.append("NOT NULL")
-                    
-                    if constraints:
-                        col_desc += f", {', '.join(constraints)}"
-                    
-                    col_desc += ")"
-                    schema_lines.append(col_desc)
-            
-            schema_lines.append("")  # 空行分隔
-        
-        # 添加表数量统计
-        schema_lines.insert(1, f"共 {len(table_names)} 个表\n")
-        
-        return "\n".join(schema_lines)
+        return format_schema(reflect_schema(db.engine), detailed)
         
     except Exception as e:
         return f"读取数据库结构失败: {str(e)}"
 
 
+def _fetch_sample_data(conn, table_name: str, limit: int) -> str:
+    """在给定连接上读取一张表的示例数据并格式化"""
+    quoted = conn.dialect.identifier_preparer.quote_identifier(table_name)
+    result = conn.execute(text(f"SELECT * FROM {quoted} LIMIT {int(limit)}"))
+    rows = result.fetchall()
+    
+    if not rows:
+        return f"表 {table_name} 为空"
+    
+    # 获取列名
+    columns = list(result.keys())
+    
+    # 格式化示例数据
+    lines = [f"表 {table_name} 的示例数据（前 {len(rows)} 行）："]
+    lines.append(f"列: {', '.join(columns)}")
+    lines.append("")
+    
+    for i, row in enumerate(rows, 1):
+        row_data = [f"{col}={value}" for col, value in zip(columns, row)]
+        lines.append(f"行{i}: {', '.join(row_data)}")
+    
+    return "\n".join(lines)
+
+
 def get_table_sample_data(table_name: str, limit: int = 3) -> str:
     """
     获取表的示例数据，帮助 LLM 理解表内容
@@ -93,94 +274,409 @@ def get_table_sample_data(table_name: str, limit: int = 3) -> str:
     """
     try:
         db = get_db()
-        query = f"SELECT * FROM {table_name} LIMIT {limit}"
-        
         with db.engine.connect() as conn:
-            result = conn.execute(text(query))
-            rows = result.fetchall()
-            
-            if not rows:
-                return f"表 {table_name} 为空"
-            
-            # 获取列名
-            columns = result.keys()
-            
-            # 格式化示例数据
-            lines = [f"表 {table_name} 的示例数据（前 {len(rows)} 行）："]
-            lines.append(f"列: {', '.join(columns)}")
-            lines.append("")
-            
-            for i, row in enumerate(rows, 1):
-                row_data = [f"{col}={row[col]}" for col in columns]
-                lines.append(f"行{i}: {', '.join(row_data)}")
-            
-            return "\n".join(lines)
+            return _fetch_sample_data(conn, table_name, limit)
             
     except Exception as e:
         return f"获取示例数据失败: {str(e)}"
 
 
-def get_smart_schema(include_samples: bool = False) -> str:
+def _run_batches(engine, items: list, batch_size: int, work) -> dict:
+    """
+    把 items 分批，每批在一个连接上执行 work(conn, item)，各批通过共享连接池并发执行
+    
+    并发数不超过连接池常驻连接数，避免挤占 SQL 工具和 API 的连接
+    
+    返回:
+        {item: work 的结果}
+    """
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    if not batches:
+        return {}
+    
+    def run_batch(batch):
+        with engine.connect() as conn:
+            return [(item, work(conn, item)) for item in batch]
+    
+    pool_size = engine.pool.size() if hasattr(engine.pool, "size") else 1
+    workers = max(min(len(batches), pool_size), 1)
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for batch_result in executor.map(run_batch, batches):
+            results.update(batch_result)
+    return results
+
+
+def get_table_samples(table_names: list, limit: int = 3, batch_size: int = 10) -> dict:
+    """
+    批量获取多张表的示例数据（每批表共用一个连接，各批并发）
+    
+    参数:
+        table_names: 表名列表
+        limit: 每张表返回的样本行数
+        batch_size: 每个连接读取的表数
+    
+    返回:
+        {表名: 示例数据的文本描述}
+    """
+    db = get_db()
+    
+    def sample(conn, table_name):
+        try:
+            return _fetch_sample_data(conn, table_name, limit)
+        except Exception as e:
+            return f"获取示例数据失败: {str(e)}"
+    
+    return _run_batches(db.engine, list(table_names), batch_size, sample)
+
+
+def get_sample_values(engine, table_names: list, limit: int = 3, batch_size: int = 10) -> dict:
+    """
+    批量读取各表文本列的示例值（用于按问题检索相关表）
+    
+    示例值是表中的真实数据（可能包含姓名、邮箱等个人信息），会随 Schema 缓存写入磁盘，
+    因此只在 index_sample_values 开启时读取
+    
+    返回:
+        {表名: {列名: [不重复的示例值]}}，只保留不超过 50 个字符的字符串；读取失败的表为空字典
+    """
+    def fetch(conn, table_name):
+        quoted = conn.dialect.identifier_preparer.quote_identifier(table_name)
+        try:
+            result = conn.execute(text(f"SELECT * FROM {quoted} LIMIT {int(limit)}"))
+        except Exception as e:
+            print(f"⚠️  读取示例值失败 {table_name}: {e}")
+            conn.rollback()
+            return {}
+        columns = list(result.keys())
+        values = {}
+        for row in result:
+            for col, value in zip(columns, row):
+                if isinstance(value, str) and value.strip() and len(value) <= 50:
+                    column_values = values.setdefault(col, [])
+                    if value not in column_values:
+                        column_values.append(value)
+        return values
+    
+    return _run_batches(engine, list(table_names), batch_size, fetch)
+
+
+def estimate_row_counts(engine) -> dict:
+    """
+    从 information_schema.TABLES 读取估算行数（只读统计信息，不扫描表）
+    
+    InnoDB 的 TABLE_ROWS 是采样估算值，误差可能达到 40%，并按 information_schema_stats_expiry 缓存；
+    非 MySQL 数据库没有该统计，返回空字典
+    
+    返回:
+        {表名: 估算行数}
+    """
+    if engine.dialect.name != "mysql":
+        return {}
+    
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT TABLE_NAME, TABLE_ROWS FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_TYPE = 'BASE TABLE'
+        """))
+        return {table: count for table, count in rows}
+
+
+def exact_row_counts(engine, table_names: list, batch_size: int = 5) -> dict:
+    """
+    用 COUNT(*) 统计精确行数，通过共享连接池并发执行
+    
+    返回:
+        {表名: 行数}
+    """
+    def count(conn, table_name):
+        quoted = conn.dialect.identifier_preparer.quote_identifier(table_name)
+        return conn.execute(text(f"SELECT COUNT(*) as cnt FROM {quoted}")).scalar()
+    
+    return _run_batches(engine, list(table_names), batch_size, count)
+
+
+def get_smart_schema(include_samples: bool = False, exact_counts: bool = False) -> str:
     """
     获取智能 Schema（推荐用于 LLM）
     结合表结构和统计信息，提供更好的上下文
     
     参数:
         include_samples: 是否包含示例数据
+        exact_counts: 是否用 COUNT(*) 统计精确行数（大表上代价高）；默认使用 information_schema 的估算值
     
     返回:
         智能 Schema 描述
     """
     try:
         db = get_db()
-        inspector = inspect(db.engine)
+        return _build_smart_schema(db.engine, include_samples, exact_counts)
         
-        schema_lines = []
-        schema_lines.append("=== 数据库结构（智能分析） ===\n")
+    except Exception as e:
+        return f"生成智能 Schema 失败: {str(e)}"
+
+
+def _build_smart_schema(engine, include_samples: bool = False, exact_counts: bool = False) -> str:
+    """生成智能 Schema 文本（出错时抛出异常，不缓存错误信息）"""
+    schema = reflect_schema(engine)
+    
+    schema_lines = []
+    schema_lines.append("=== 数据库结构（智能分析） ===\n")
+    
+    table_names = list(schema)
+    
+    # 默认只读统计信息中的估算行数；没有估算值（非 MySQL）时才逐表 COUNT
+    estimates = {} if exact_counts else estimate_row_counts(engine)
+    counted = [table_name for table_name in table_names if table_name not in estimates]
+    row_counts = exact_row_counts(engine, counted)
+    
+    # 示例数据分批读取（估算行数为 0 的表也可能有数据，同样读取）
+    samples = {}
+    if include_samples:
+        sample_tables = [table_name for table_name in table_names if row_counts.get(table_name) != 0]
+        samples = get_table_samples(sample_tables, limit=2)
+    
+    for table_name in table_names:
+        schema_lines.append(f"## {table_name}")
+        if table_name in row_counts:
+            schema_lines.append(f"行数: {row_counts[table_name]}")
+        elif estimates[table_name] is not None:
+            schema_lines.append(f"行数: 约 {estimates[table_name]}（估算）")
+        else:
+            schema_lines.append("行数: 未知")
+        schema_lines.append("")
         
-        table_names = inspector.get_table_names()
+        # 列信息
+        columns = schema[table_name]["columns"]
+        primary_keys = schema[table_name]["primary_keys"]
         
-        for table_name in table_names:
-            # 获取表的行数
-            with db.engine.connect() as conn:
-                count_query = f"SELECT COUNT(*) as cnt FROM {table_name}"
-                result = conn.execute(text(count_query))
-                row_count = result.fetchone()[0]
+        schema_lines.append("字段:")
+        for col in columns:
+            col_name = col['name']
+            col_type = col['type']
             
-            schema_lines.append(f"## {table_name}")
-            schema_lines.append(f"行数: {row_count}")
+            marker = "🔑" if col_name in primary_keys else "  "
+            schema_lines.append(f"{marker} {col_name}: {col_type}")
+        
+        # 可选：添加示例数据
+        if table_name in samples:
             schema_lines.append("")
-            
-            # 列信息
-            columns = inspector.get_columns(table_name)
-            pk_constraint = inspector.get_pk_constraint(table_name)
-            primary_keys = pk_constraint.get('constrained_columns', [])
-            
-            schema_lines.append("字段:")
-            for col in columns:
-                col_name = col['name']
-                col_type = str(col['type'])
-                
-                marker = "🔑" if col_name in primary_keys else "  "
-                schema_lines.append(f"{marker} {col_name}: {col_type}")
-            
-            # 可选：添加示例数据
-            if include_samples and row_count > 0:
-                schema_lines.append("")
-                sample = get_table_sample_data(table_name, limit=2)
-                schema_lines.append(sample)
-            
-            schema_lines.append("\n" + "-" * 50 + "\n")
+            schema_lines.append(samples[table_name])
         
-        return "\n".join(schema_lines)
+        schema_lines.append("\n" + "-" * 50 + "\n")
+    
+    return "\n".join(schema_lines)
+
+
+# Schema 缓存：内存中一份，并按数据库标识持久化到磁盘，重启后直接加载
+_SCHEMA_BUILDERS = {
+    "schema": lambda engine: format_schema(reflect_schema(engine), detailed=True),
+    "smart_schema": lambda engine: _build_smart_schema(engine, include_samples=False),
+    "reflection": reflect_schema,
+    "sample_values": lambda engine: get_sample_values(engine, list(_cached_entry("reflection", False))),
+}
+# 内容来自表数据（行数、示例值）的缓存项：表结构不变时也会过期，超过 data_ttl 后重建
+_DATA_ENTRIES = {"smart_schema", "sample_values"}
+
+_cache_lock = threading.RLock()
+_schema_entries = {}           # 名称 -> Schema 文本
+_entry_built_at = {}           # 名称 -> 生成时间戳
+_schema_fingerprint = None     # 生成缓存时的表结构指纹
+_disk_cache = None             # SchemaCache，首次使用时按数据库标识创建
+_cache_loaded = False
+_verifier = None
+_schema_index = None           # ((表结构指纹, 示例值生成时间), SchemaIndex)
+_join_graph = None             # (表结构指纹, JoinGraph)
+
+
+def _ensure_cache_loaded():
+    """首次使用时读取磁盘缓存并启动后台指纹检查（不访问数据库）"""
+    global _disk_cache, _schema_fingerprint, _cache_loaded
+    if _cache_loaded:
+        return
+    _cache_loaded = True
+    if not _get_setting("cache_enabled"):
+        return
+    
+    try:
+        engine = get_db().engine
+        _disk_cache = SchemaCache(_get_setting("cache_dir"), database_identity(engine))
+        stored = _disk_cache.load()
+        if stored:
+            _schema_entries.update(stored["entries"])
+            _entry_built_at.update(stored["built_at"])
+            _schema_fingerprint = stored["fingerprint"]
+            print(f"✅ 已加载 Schema 缓存（{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(stored['saved_at']))}）")
+    except Exception as e:
+        print(f"⚠️  读取 Schema 缓存失败: {e}")
+    
+    # 磁盘缓存可能是旧结构，立即在后台检查一次，之后按间隔定期检查
+    _start_verifier(_get_setting("verify_interval"))
+
+
+def _rebuild_entries(names: list, fingerprint: Optional[str] = None):
+    """
+    重新生成指定的 Schema 并写入磁盘缓存（调用方持有 _cache_lock）
+    
+    先计算指纹再生成 Schema：生成期间表结构变化时，下次检查会发现指纹不一致并再次重建
+    """
+    global _schema_fingerprint
+    engine = get_db().engine
+    if fingerprint is None:
+        fingerprint = schema_fingerprint(engine)
+    if fingerprint != _schema_fingerprint:
+        # 表结构已变化，其余缓存内容同样过期
+        _schema_entries.clear()
+        _entry_built_at.clear()
+    
+    entries = {name: _SCHEMA_BUILDERS[name](engine) for name in names}
+    _schema_entries.update(entries)
+    _entry_built_at.update({name: time.time() for name in names})
+    _schema_fingerprint = fingerprint
+    if _disk_cache is not None:
+        _disk_cache.save(fingerprint, dict(_schema_entries), dict(_entry_built_at))
+
+
+def _is_expired(name: str) -> bool:
+    """数据相关的缓存项是否已超过 data_ttl"""
+    ttl = _get_setting("data_ttl")
+    return bool(ttl) and name in _DATA_ENTRIES and time.time() - _entry_built_at.get(name, 0) > ttl
+
+
+def _cached_entry(name: str, force_refresh: bool) -> str:
+    """读取缓存的 Schema，没有、已过期或要求刷新时重新生成"""
+    with _cache_lock:
+        _ensure_cache_loaded()
+        if force_refresh or name not in _schema_entries or _is_expired(name):
+            _rebuild_entries([name])
+        return _schema_entries[name]
+
+
+def verify_schema_cache() -> bool:
+    """
+    检查表结构指纹，与缓存生成时不同则重建已缓存的 Schema；
+    表结构未变时在后台重建超过 data_ttl 的数据相关缓存项，查询时不必等待
+    
+    返回:
+        是否发生了重建
+    """
+    with _cache_lock:
+        _ensure_cache_loaded()
+        if not _schema_entries:
+            return False
+    
+    # 计算指纹时不持有锁，检查期间读取缓存不受影响
+    fingerprint = schema_fingerprint(get_db().engine)
+    with _cache_lock:
+        if not _schema_entries:
+            return False
+        if fingerprint == _schema_fingerprint:
+            expired = [name for name in _schema_entries if _is_expired(name)]
+            if not expired:
+                return False
+            _rebuild_entries(expired, fingerprint)
+            return True
         
+        print("🔄 数据库结构已变化，重建 Schema 缓存")
+        _rebuild_entries(list(_schema_entries), fingerprint)
+        return True
+
+
+def _start_verifier(interval: Optional[float]):
+    """启动后台线程：立即检查一次指纹，之后每 interval 秒检查一次（None 表示只检查一次）"""
+    global _verifier
+    if _verifier is not None:
+        return
+    
+    def verify():
+        while True:
+            try:
+                verify_schema_cache()
+            except Exception as e:
+                print(f"⚠️  检查数据库结构变化失败: {e}")
+            if not interval:
+                return
+            time.sleep(interval)
+    
+    _verifier = threading.Thread(target=verify, name="schema-verifier", daemon=True)
+    _verifier.start()
+
+
+def get_join_graph() -> JoinGraph:
+    """按当前缓存的表结构建立外键关联图，表结构指纹变化后重建"""
+    global _join_graph
+    with _cache_lock:
+        schema = _cached_entry("reflection", False)
+        if _join_graph is None or _join_graph[0] != _schema_fingerprint:
+            _join_graph = (_schema_fingerprint, JoinGraph(schema))
+        return _join_graph[1]
+
+
+def _get_schema_index() -> SchemaIndex:
+    """按当前缓存的表结构建立检索索引，表结构指纹变化后重建"""
+    global _schema_index
+    with _cache_lock:
+        schema = _cached_entry("reflection", False)
+        sample_values = _cached_entry("sample_values", False) if _get_setting("index_sample_values") else None
+        # 示例值按 data_ttl 重建后，索引也随之重建
+        version = (_schema_fingerprint, _entry_built_at.get("sample_values") if sample_values is not None else None)
+        if _schema_index is None or _schema_index[0] != version:
+            index = SchemaIndex(schema, sample_values, _get_setting("glossary"), get_join_graph())
+            _schema_index = (version, index)
+        return _schema_index[1]
+
+
+def validate_sql_joins(sql: str) -> list:
+    """
+    检查生成的 SQL 中的 JOIN 条件是否与外键一致
+    
+    返回:
+        问题描述列表；没有问题或无法读取表结构时为空列表
+    """
+    try:
+        return get_join_graph().validate_joins(sql)
     except Exception as e:
-        return f"生成智能 Schema 失败: {str(e)}"
+        print(f"⚠️  检查 JOIN 条件失败: {e}")
+        return []
 
 
-# 缓存 schema，避免重复查询
-_schema_cache = None
-_smart_schema_cache = None
+def get_relevant_schema(question: str, top_k: Optional[int] = None) -> str:
+    """
+    只返回与问题相关的表的结构（格式与 get_cached_schema 相同），并附上连接这些表的外键关联路径，
+    用于缩短 NL2SQL 提示词
+    
+    表数不超过 full_schema_max_tables 或问题与任何表都不匹配时返回完整结构
+    
+    参数:
+        question: 用户问题
+        top_k: 按检索得分选取的表数，默认读取 relevant_tables 配置
+    
+    返回:
+        Schema 描述
+    """
+    try:
+        schema = _cached_entry("reflection", False)
+        if len(schema) <= _get_setting("full_schema_max_tables"):
+            return get_cached_schema()
+        
+        top_k = top_k or _get_setting("relevant_tables")
+        selected = _get_schema_index().select_tables(question, top_k, max_tables=top_k * 2)
+        tables = set(selected)
+        if not tables:
+            return get_cached_schema()
+        
+        relevant = {name: info for name, info in schema.items() if name in tables}
+        schema_text = format_schema(relevant).replace(
+            f"共 {len(relevant)} 个表\n",
+            f"共 {len(relevant)} 个表（根据问题从 {len(schema)} 个表中选出，其他表可用 get_schema_info 查看）\n",
+            1
+        )
+        join_paths = get_join_graph().describe(selected)
+        return f"{schema_text}\n{join_paths}" if join_paths else schema_text
+        
+    except Exception as e:
+        print(f"⚠️  筛选相关表失败，使用完整 Schema: {e}")
+        return get_cached_schema()
 
 
 def get_cached_schema(force_refresh: bool = False) -> str:
@@ -193,12 +689,10 @@ def get_cached_schema(force_refresh: bool = False) -> str:
     返回:
         Schema 描述
     """
-    global _schema_cache
-    
-    if _schema_cache is None or force_refresh:
-        _schema_cache = get_dynamic_schema(detailed=True)
-    
-    return _schema_cache
+    try:
+        return _cached_entry("schema", force_refresh)
+    except Exception as e:
+        return f"读取数据库结构失败: {str(e)}"
 
 
 def get_cached_smart_schema(force_refresh: bool = False) -> str:
@@ -211,20 +705,28 @@ def get_cached_smart_schema(force_refresh: bool = False) -> str:
     返回:
         智能 Schema 描述
     """
-    global _smart_schema_cache
-    
-    if _smart_schema_cache is None or force_refresh:
-        _smart_schema_cache = get_smart_schema(include_samples=False)
-    
-    return _smart_schema_cache
+    try:
+        return _cached_entry("smart_schema", force_refresh)
+    except Exception as e:
+        return f"生成智能 Schema 失败: {str(e)}"
 
 
 # 导出
 __all__ = [
+    'reflect_schema',
+    'format_schema',
     'get_dynamic_schema',
     'get_table_sample_data', 
+    'get_table_samples',
+    'get_sample_values',
+    'estimate_row_counts',
+    'exact_row_counts',
     'get_smart_schema',
     'get_cached_schema',
-    'get_cached_smart_schema'
+    'get_cached_smart_schema',
+    'get_relevant_schema',
+    'get_join_graph',
+    'validate_sql_joins',
+    'verify_schema_cache'
 ]
 
@@ -0,0 +1,271 @@
+"""
+SQL Cache - SQL 查询结果缓存
+以规范化后的 SQL 文本为键缓存查询结果，支持过期时间、LRU 淘汰和按表失效
+"""
+import re
+import time
+import threading
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+from typing import Optional
+import pandas as pd
+
+# SQL 词法单元：注释、字符串、带引号的标识符、数字、单词、其余符号
+_TOKEN_PATTERN = re.compile(r"""
+    (?P<comment>--(?=\s|$)[^\n]*|\#[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+  | (?P<quoted>`(?:[^`]|``)*`)
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?)
+  | (?P<word>[A-Za-z_一-鿿][\w$一-鿿]*)
+  | (?P<symbol><=|>=|<>|!=|\S)
+""", re.VERBOSE | re.DOTALL)
+
+# 结果随执行时间变化的函数，包含它们的查询不缓存
+_VOLATILE_FUNCTIONS = {
+    "NOW", "SYSDATE", "CURDATE", "CURTIME", "CURRENT_DATE", "CURRENT_TIME",
+    "CURRENT_TIMESTAMP", "LOCALTIME", "LOCALTIMESTAMP", "UTC_DATE", "UTC_TIME",
+    "UTC_TIMESTAMP", "UNIX_TIMESTAMP", "RAND", "UUID", "UUID_SHORT", "CONNECTION_ID",
+    "LAST_INSERT_ID", "FOUND_ROWS", "ROW_COUNT", "SLEEP"
+}
+
+# 规范化时统一为大写的关键字（表名、列名、别名和函数名保持原样）
+_KEYWORDS = {
+    "SELECT", "FROM", "WHERE", "AND", "OR", "NOT", "XOR", "IN", "IS", "NULL", "LIKE", "REGEXP", "BETWEEN",
+    "EXISTS", "AS", "ON", "USING", "JOIN", "INNER", "LEFT", "RIGHT", "OUTER", "CROSS", "NATURAL",
+    "STRAIGHT_JOIN", "GROUP", "BY", "ORDER", "ASC", "DESC", "HAVING", "LIMIT", "OFFSET", "UNION", "ALL",
+    "DISTINCT", "ANY", "SOME", "CASE", "WHEN", "THEN", "ELSE", "END", "WITH", "RECURSIVE", "TRUE", "FALSE",
+    "INTERVAL", "ROLLUP", "WINDOW", "OVER", "PARTITION", "ROWS", "RANGE", "FORCE", "USE", "IGNORE", "INDEX",
+}
+
+
+def iter_sql_tokens(query: str):
+    """逐个返回 SQL 词法单元 (类型, 文本, 起始位置, 结束位置)，包括注释"""
+    for match in _TOKEN_PATTERN.finditer(query):
+        yield match.lastgroup, match.group(), match.start(), match.end()
+
+
+def tokenize_sql(query: str) -> list:
+    """切分 SQL 词法单元（丢弃注释），返回 [(类型, 文本), ...]"""
+    return [(kind, text) for kind, text, _, _ in iter_sql_tokens(query) if kind != "comment"]
+
+
+def _normalize_string(literal: str) -> str:
+    """字符串字面量统一为单引号形式（'a' 与 "a" 视为同一个值）"""
+    quote, body = literal[0], literal[1:-1]
+    body = body.replace(quote * 2, quote).replace("\\" + quote, quote)
+    return "'" + body.replace("'", "''") + "'"
+
+
+def _normalize_number(literal: str) -> str:
+    """数字字面量统一格式（010 / 10.0 / 1e1 视为同一个值）"""
+    try:
+        value = Decimal(literal).normalize()
+    except InvalidOperation:
+        return literal
+    return format(value, "f")
+
+
+def normalize_sql(query: str) -> str:
+    """
+    规范化 SQL 文本，作为结果缓存的键
+    
+    去掉注释和多余空白、末尾分号，关键字统一为大写，字符串和数字字面量统一格式。
+    标识符和别名保持原样（AS n 与 AS N 的结果列名不同）；最外层 SELECT 的输出列表整体保持原样，
+    因为没有别名的列以表达式原文作为列名（count(*) 与 COUNT(*) 的列名不同）
+    """
+    parts = []
+    depth = 0
+    in_select_list = False
+    for kind, text in tokenize_sql(query):
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth = max(depth - 1, 0)
+        elif depth == 0 and kind == "word" and text.upper() in ("SELECT", "FROM"):
+            in_select_list = text.upper() == "SELECT"
+            parts.append(text.upper())
+            continue
+        
+        if in_select_list:
+            parts.append(text)
+        elif kind == "word":
+            parts.append(text.upper() if text.upper() in _KEYWORDS else text)
+        elif kind == "string":
+            parts.append(_normalize_string(text))
+        elif kind == "number":
+            parts.append(_normalize_number(text))
+        else:
+            parts.append(text)
+    
+    while parts and parts[-1] == ";":
+        parts.pop()
+    return " ".join(parts)
+
+
+def referenced_tables(query: str) -> set:
+    """
+    提取查询引用的表名（FROM / JOIN 之后的表，小写，去掉库名前缀和反引号）
+    
+    只做词法层面的近似解析，多识别出的名字只会导致多失效一些缓存
+    """
+    tokens = tokenize_sql(query)
+    tables = set()
+    expecting = False  # 下一个标识符是表名
+    from_depths = []   # 尚未结束的 FROM 子句所在的括号深度（同一深度的逗号后面还是表名）
+    depth = 0
+    for i, (kind, text) in enumerate(tokens):
+        upper = text.upper() if kind == "word" else text
+        if text == "(":
+            depth += 1
+            expecting = False
+        elif text == ")":
+            depth = max(depth - 1, 0)
+            while from_depths and from_depths[-1] > depth:
+                from_depths.pop()
+            expecting = False
+        elif upper in ("FROM", "JOIN"):
+            expecting = True
+            if not from_depths or from_depths[-1] != depth:
+                from_depths.append(depth)
+        elif expecting and kind in ("word", "quoted"):
+            if i + 1 < len(tokens) and tokens[i + 1][1] == ".":
+                continue  # db.table 只取表名
+            tables.add(text.strip("`").replace("``", "`").lower())
+            expecting = False
+        elif expecting and text == ".":
+            continue
+        elif text == "," and from_depths and from_depths[-1] == depth:
+            expecting = True
+        elif upper in ("WHERE", "GROUP", "HAVING", "ORDER", "LIMIT", "UNION") and from_depths and from_depths[-1] == depth:
+            from_depths.pop()
+            expecting = False
+        else:
+            expecting = False
+    return tables
+
+
+def is_cacheable(query: str) -> bool:
+    """包含 NOW()、RAND() 等结果随时间变化的函数时不缓存"""
+    return not any(
+        kind == "word" and text.upper() in _VOLATILE_FUNCTIONS
+        for kind, text in tokenize_sql(query)
+    )
+
+
+class QueryResultCache:
+    """SQL 查询结果缓存（线程安全）"""
+    
+    def __init__(self, max_entries: int = 256, ttl: Optional[float] = 300,
+                 max_bytes: Optional[int] = None):
+        """
+        初始化结果缓存
+        
+        参数:
+            max_entries: 最多缓存的查询数，超出时淘汰最久未使用的结果
+            ttl: 结果有效期（秒），None 表示不过期
+            max_bytes: 缓存结果的总内存上限，None 表示不限制
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # 键 -> (DataFrame, 写入时间, 字节数, 引用的表)
+        self._table_keys = {}  # 表名 -> 引用该表的缓存键
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "invalidated": 0}
+    
+    def get(self, query: str) -> Optional[pd.DataFrame]:
+        """读取缓存结果，未命中或已过期时返回 None"""
+        key = normalize_sql(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            
+            df, stored_at, _, _ = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                self._remove(key)
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+        return df.copy()
+    
+    def contains(self, query: str) -> bool:
+        """判断查询是否有未过期的缓存结果（不计入命中统计）"""
+        key = normalize_sql(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and (self.ttl is None or time.monotonic() - entry[1] <= self.ttl)
+    
+    def put(self, query: str, df: pd.DataFrame):
+        """写入查询结果（包含易变函数或超出内存上限的结果不缓存）"""
+        if not is_cacheable(query):
+            return
+        
+        size = int(df.memory_usage(deep=True).sum())
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        
+        key = normalize_sql(query)
+        tables = referenced_tables(query)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (df.copy(), time.monotonic(), size, tables)
+            self._bytes += size
+            for table in tables:
+                self._table_keys.setdefault(table, set()).add(key)
+            
+            while self._entries and (
+                len(self._entries) > self.max_entries
+                or (self.max_bytes is not None and self._bytes > self.max_bytes)
+            ):
+                self._remove(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+    
+    def invalidate(self, tables: Optional[list] = None) -> int:
+        """
+        让缓存结果失效
+        
+        参数:
+            tables: 发生变化的表名；None 表示清空全部缓存
+        
+        返回:
+            失效的缓存条目数
+        """
+        with self._lock:
+            if tables is None:
+                keys = list(self._entries)
+            else:
+                keys = set()
+                for table in tables:
+                    keys |= self._table_keys.get(table.lower(), set())
+            for key in keys:
+                self._remove(key)
+            self.stats["invalidated"] += len(keys)
+            return len(keys)
+    
+    def _remove(self, key: str):
+        """删除一个缓存条目并更新表索引（调用方持有锁）"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry[2]
+        for table in entry[3]:
+            keys = self._table_keys.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._table_keys[table]
+    
+    def info(self) -> dict:
+        """返回命中、未命中、淘汰次数以及当前条目数和内存占用"""
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries), "bytes": self._bytes}
+
+
+__all__ = ['QueryResultCache', 'iter_sql_tokens', 'tokenize_sql', 'normalize_sql', 'referenced_tables', 'is_cacheable']
@@ -0,0 +1,204 @@
+"""
+SQL Guard - 执行 LLM 生成的 SQL 之前的代价检查
+自动补 LIMIT、加单语句超时提示，并用 EXPLAIN 估算扫描行数，拒绝代价过高的查询
+"""
+import json
+from typing import Optional
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from tools.sql_cache import tokenize_sql, iter_sql_tokens
+
+# 出现这些关键字或函数时，LIMIT 无法让 MySQL 提前结束扫描
+_FULL_RESULT_WORDS = {"GROUP", "ORDER", "DISTINCT", "UNION", "HAVING"}
+_AGGREGATE_FUNCTIONS = {"COUNT", "SUM", "AVG", "MIN", "MAX", "GROUP_CONCAT", "STD", "STDDEV", "VARIANCE"}
+
+
+def needs_full_scan(query: str) -> bool:
+    """判断查询是否需要先读完全部匹配行（聚合、排序、去重），此时 LIMIT 不能减少扫描量"""
+    tokens = tokenize_sql(query)
+    for i, (kind, value) in enumerate(tokens):
+        if kind != "word":
+            continue
+        word = value.upper()
+        if word in _FULL_RESULT_WORDS:
+            return True
+        if word in _AGGREGATE_FUNCTIONS and i + 1 < len(tokens) and tokens[i + 1][1] == "(":
+            return True
+    return False
+
+
+def strip_trailing(query: str) -> str:
+    """去掉查询末尾的分号和注释（之后再追加 LIMIT，避免落在分号之后或注释里）"""
+    end = 0
+    for kind, value, _, stop in iter_sql_tokens(query):
+        if kind != "comment" and value != ";":
+            end = stop
+    return query[:end]
+
+
+def _limit_token(query: str) -> tuple[bool, Optional[tuple]]:
+    """
+    找到最外层 LIMIT 的行数
+    
+    支持 LIMIT n、LIMIT offset, n 和 LIMIT n OFFSET m
+    
+    返回:
+        (是否有 LIMIT, 行数 token (kind, value, start, end)；行数不是数字字面量时为 None)
+    """
+    tokens = [token for token in iter_sql_tokens(query) if token[0] != "comment"]
+    depth = 0
+    for i, (kind, value, _, _) in enumerate(tokens):
+        if value == "(":
+            depth += 1
+        elif value == ")":
+            depth = max(depth - 1, 0)
+        elif depth == 0 and kind == "word" and value.upper() == "LIMIT":
+            args = tokens[i + 1:i + 4]
+            # LIMIT offset, n 的行数是逗号后的数字
+            count = args[2] if len(args) == 3 and args[1][1] == "," else (args[0] if args else None)
+            return True, count if count is not None and count[0] == "number" else None
+    return False, None
+
+
+def limit_rows(query: str) -> Optional[int]:
+    """返回最外层 LIMIT 的行数，没有 LIMIT 或行数不是数字字面量时返回 None"""
+    _, count = _limit_token(query)
+    return int(float(count[1])) if count else None
+
+
+def cap_limit(query: str, limit: int) -> tuple[str, bool]:
+    """
+    保证最外层 LIMIT 的行数不超过 limit：没有 LIMIT 时补上，行数更大时改小
+    
+    支持 LIMIT n、LIMIT offset, n 和 LIMIT n OFFSET m；行数不是数字字面量时不改写
+    
+    返回:
+        (改写后的查询, 是否改写)
+    """
+    found, count = _limit_token(query)
+    if not found:
+        return f"{strip_trailing(query)}\nLIMIT {int(limit)}", True
+    if count is None or float(count[1]) <= limit:
+        return query, False
+    return query[:count[2]] + str(int(limit)) + query[count[3]:], True
+
+
+def prepare_query(query: str, limit: Optional[int] = None,
+                  timeout_ms: Optional[int] = None) -> tuple[str, bool]:
+    """
+    改写待执行的查询
+    
+    参数:
+        query: SELECT 查询语句
+        limit: 最外层 LIMIT 的行数上限（没有时补上，更大时改小），None 表示不限制
+        timeout_ms: 单语句执行超时（毫秒），以 MAX_EXECUTION_TIME 优化器提示加入
+    
+    返回:
+        (改写后的查询, 是否补上或改小了 LIMIT)
+    """
+    query = strip_trailing(query)
+    # 去掉开头的空白和注释，优化器提示要紧跟在开头的 SELECT 之后
+    start = next((begin for kind, _, begin, _ in iter_sql_tokens(query) if kind != "comment"), 0)
+    query = query[start:]
+    injected = False
+    if limit:
+        query, injected = cap_limit(query, limit)
+    
+    if timeout_ms and query[:6].upper() == "SELECT" and "MAX_EXECUTION_TIME" not in query.upper():
+        # 优化器提示必须紧跟在 SELECT 关键字之后；不支持的服务器会把它当作注释
+        query = f"{query[:6]} /*+ MAX_EXECUTION_TIME({int(timeout_ms)}) */{query[6:]}"
+    return query, injected
+
+
+def explain_query(conn, query: str) -> dict:
+    """
+    用 EXPLAIN 估算查询代价
+    
+    同一个 select id 内的各表按嵌套循环连接，估算行数相乘；不同 select 之间相加
+    
+    返回:
+        {"rows": 估算扫描行数, "full_scans": 全表扫描的表, "join_buffer": 无索引连接的表,
+         "fanout": 驱动表每读一行、被连接的表平均要读的行数之积（各 select 取最大）}
+    """
+    plan = conn.execute(text(f"EXPLAIN {query}")).mappings().all()
+    
+    per_select = {}
+    fanout = {}
+    full_scans = []
+    join_buffer = []
+    for row in plan:
+        row = {key.lower(): value for key, value in row.items()}
+        rows = row.get("rows")
+        if rows is None:
+            continue
+        select_id = row.get("id")
+        if select_id in per_select:
+            # 每个 select 的第一行是驱动表，之后各表的行数是对驱动表每一行的查找量
+            fanout[select_id] = fanout.get(select_id, 1) * max(int(rows), 1)
+        per_select[select_id] = per_select.get(select_id, 1) * max(int(rows), 1)
+        
+        table = row.get("table")
+        if str(row.get("type")).upper() == "ALL" and table:
+            full_scans.append(f"{table}（约 {int(rows)} 行）")
+        if "join buffer" in str(row.get("extra") or "").lower() and table:
+            join_buffer.append(table)
+    
+    return {"rows": sum(per_select.values()), "full_scans": full_scans, "join_buffer": join_buffer,
+            "fanout": max(fanout.values(), default=1)}
+
+
+def explain_cost(conn, query: str) -> Optional[float]:
+    """用 EXPLAIN FORMAT=JSON 读取优化器估算的总代价，服务器不支持时返回 None"""
+    try:
+        plan = json.loads(conn.execute(text(f"EXPLAIN FORMAT=JSON {query}")).scalar())
+    except (SQLAlchemyError, ValueError, TypeError):
+        return None
+    cost = plan.get("query_block", {}).get("cost_info", {}).get("query_cost")
+    return float(cost) if cost is not None else None
+
+
+def check_cost(conn, query: str, max_rows: Optional[int] = None,
+               max_cost: Optional[float] = None) -> tuple[bool, str]:
+    """
+    检查查询代价是否在允许范围内
+    
+    参数:
+        conn: 数据库连接
+        query: 待执行的查询
+        max_rows: 允许的估算扫描行数上限
+        max_cost: 允许的优化器代价上限（None 表示不检查）
+    
+    返回:
+        (是否允许执行, 拒绝时给 Agent 的修改建议)
+    """
+    plan = explain_query(conn, query)
+    reasons = []
+    # 不需要全量扫描的查询带 LIMIT 时读够行数即可结束，不按估算总行数拒绝；
+    # 但连接没有用到索引（join buffer），或读 LIMIT 行所需的连接查找量（LIMIT × 扇出）已超过上限时，
+    # LIMIT 起不到作用，仍按估算行数检查
+    limit = limit_rows(query)
+    stops_early = (limit is not None and not needs_full_scan(query) and not plan["join_buffer"]
+                   and (not max_rows or limit * plan["fanout"] <= max_rows))
+    if max_rows and plan["rows"] > max_rows and not stops_early:
+        reasons.append(f"预计扫描约 {plan['rows']:,} 行，超过上限 {max_rows:,} 行")
+    
+    if max_cost:
+        cost = explain_cost(conn, query)
+        if cost is not None and cost > max_cost:
+            reasons.append(f"优化器估算代价 {cost:,.0f}，超过上限 {max_cost:,.0f}")
+    
+    if not reasons:
+        return True, ""
+    
+    lines = ["❌ 查询代价过高，已拒绝执行：" + "；".join(reasons)]
+    if plan["join_buffer"]:
+        lines.append(f"- 表 {', '.join(plan['join_buffer'])} 的连接没有用到索引，可能缺少 JOIN ... ON 条件（笛卡尔积）")
+    if plan["full_scans"]:
+        lines.append(f"- 全表扫描: {', '.join(plan['full_scans'])}")
+    lines.append("请修改 SQL 后重试：补全 JOIN 的关联条件（主键 = 外键），添加 WHERE 过滤条件，"
+                 "或先在子查询中聚合/筛选再关联；只需要部分数据时添加 LIMIT。")
+    return False, "\n".join(lines)
+
+
+__all__ = ['limit_rows', 'strip_trailing', 'needs_full_scan', 'cap_limit', 'prepare_query', 'explain_query', 'explain_cost', 'check_cost']
@@ -4,12 +4,17 @@ SQL Tool - 安全的只读 SQL 查询工具
 """
 import os
 import re
+import threading
 from typing import Optional
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 import pandas as pd
 from crewai.tools import tool
 
+from tools.db_pool import get_engine, build_mysql_url
+from tools.sql_cache import QueryResultCache
+from tools.sql_guard import prepare_query, check_cost, cap_limit, strip_trailing, explain_query, limit_rows
+
 # 尝试从 config.py 导入配置，如果失败则从环境变量读取
 try:
     from config import DB_CONFIG
@@ -19,6 +24,60 @@ except ImportError:
     from dotenv import load_dotenv
     load_dotenv()
 
+# 尝试从 config.py 导入 SQL 查询配置，如果失败则使用默认值
+try:
+    from config import SQL_CONFIG
+except ImportError:
+    SQL_CONFIG = {}
+
+DEFAULT_SQL_CONFIG = {
+    "result_cache": True,                # 是否缓存 SELECT 查询结果（按规范化后的 SQL 文本）
+    "result_cache_ttl": 300,             # 缓存结果的有效期（秒），None 表示不过期
+    "result_cache_entries": 256,         # 最多缓存的查询数，超出时淘汰最久未使用的结果
+    "result_cache_mb": 64,               # 缓存结果的总内存上限
+    "max_rows": 1000,                    # 单次查询最多取回的行数，超出部分只计数不保留
+    "max_result_mb": 16,                 # 单次查询取回数据的估算内存上限
+    "fetch_size": 500,                   # 每批从结果集读取的行数
+    "auto_limit": True,                  # 最外层没有 LIMIT 时自动补上（max_rows + 1，用于判断是否截断）
+    "statement_timeout_ms": 30000,       # 单条查询的执行超时（MAX_EXECUTION_TIME 提示），None 表示不限制
+    "cost_guard": True,                  # 执行前用 EXPLAIN 估算代价，超过上限的查询直接拒绝
+    "max_explain_rows": 10_000_000,      # 允许的估算扫描行数（各表估算行数之积）
+    "max_query_cost": None,              # 允许的优化器代价（EXPLAIN FORMAT=JSON 的 query_cost），None 表示不检查
+}
+
+
+def _get_setting(key: str):
+    """读取 SQL 配置项，未配置时使用默认值"""
+    return SQL_CONFIG.get(key, DEFAULT_SQL_CONFIG[key])
+
+
+class _BoundedRows:
+    """收集分批读取的查询结果，超过行数或内存上限后只计数不保留"""
+    
+    def __init__(self, max_rows: int, max_bytes: int):
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.columns = []
+        self.rows = []
+        self.total = 0
+        self.size = 0
+    
+    def add(self, batch):
+        """加入一批行"""
+        self.total += len(batch)
+        for row in batch:
+            if len(self.rows) >= self.max_rows or self.size >= self.max_bytes:
+                break
+            self.rows.append(tuple(row))
+            self.size += sum(len(value) if isinstance(value, (str, bytes)) else 8 for value in row)
+    
+    def to_frame(self) -> pd.DataFrame:
+        """转换为 DataFrame，attrs 中记录 truncated 和 total_rows"""
+        df = pd.DataFrame.from_records(self.rows, columns=self.columns, coerce_float=True)
+        df.attrs['truncated'] = self.total > len(df)
+        df.attrs['total_rows'] = self.total
+        return df
+
 
 class SQLDatabase:
     """MySQL 数据库连接管理类"""
@@ -40,25 +99,130 @@ class SQLDatabase:
             self.password = os.getenv("DB_PASSWORD", "")
             self.database = os.getenv("DB_NAME", "chinook")
         
-        # 构建连接字符串
-        connection_string = (
-            f"mysql+mysqlconnector://{self.user}:{self.password}"
-            f"@{self.host}:{self.port}/{self.database}"
-        )
+        # 构建连接字符串（与 API 存储服务相同，才能共用连接池）
+        connection_string = build_mysql_url({
+            "host": self.host, "port": self.port, "user": self.user,
+            "password": self.password, "database": self.database
+        })
         
         try:
-            self.engine = create_engine(connection_string, pool_pre_ping=True)
+            self.engine = get_engine(connection_string)  # 与 schema_reader、API 存储服务共用连接池
             print(f"✅ 成功连接到数据库: {self.database}")
         except Exception as e:
             print(f"❌ 数据库连接失败: {e}")
             raise
+        
+        # SELECT 结果缓存（相同查询直接返回，不访问数据库）
+        self.result_cache = None
+        if _get_setting("result_cache"):
+            self.result_cache = QueryResultCache(
+                max_entries=_get_setting("result_cache_entries"),
+                ttl=_get_setting("result_cache_ttl"),
+                max_bytes=_get_setting("result_cache_mb") * 1024 * 1024
+            )
     
-    def execute_query(self, query: str) -> pd.DataFrame:
-        """执行 SQL 查询并返回 DataFrame"""
-        with self.engine.connect() as conn:
-            result = pd.read_sql(text(query), conn)
+    def execute_query(self, query: str, use_cache: bool = True,
+                      max_rows: Optional[int] = None) -> pd.DataFrame:
+        """
+        执行 SQL 查询并返回 DataFrame
+        
+        SELECT 查询在数据库端限制为最多返回 max_rows + 1 行（多取一行用于判断是否截断），
+        最多保留 max_rows 行、max_result_mb 的数据。结果的 attrs 中记录：
+            truncated: 是否被截断
+            total_rows: 查询返回的总行数；超过 max_rows 行时总数未知，为 None
+            estimated_rows: 总数未知时 EXPLAIN 估算的行数（无法估算时为 None）
+            cached: 是否来自结果缓存
+        
+        参数:
+            query: SQL 查询语句
+            use_cache: 是否使用结果缓存
+            max_rows: 最多保留的行数，默认读取 max_rows 配置
+        """
+        # 结果与行数上限有关，只缓存按默认上限取回的结果
+        cacheable = (self.result_cache is not None and use_cache and max_rows is None
+                     and query.lstrip().upper().startswith("SELECT"))
+        if cacheable:
+            cached = self.result_cache.get(query)
+            if cached is not None:
+                cached.attrs['cached'] = True
+                return cached
+        
+        result = self._fetch_bounded(query, max_rows or _get_setting("max_rows"))
+        
+        if cacheable:
+            self.result_cache.put(query, result)
         return result
     
+    def _fetch_bounded(self, query: str, max_rows: int) -> pd.DataFrame:
+        """
+        在数据库端限制返回行数后分批读取，超过行数或内存上限后只计数不保留
+        
+        mysql-connector 方言不支持服务端游标（stream_results 会被忽略），驱动会把整个结果集
+        读入客户端内存，所以只能改写最外层 LIMIT，让 MySQL 最多返回 max_rows + 1 行
+        """
+        original = query
+        is_select = query.lstrip()[:6].upper() == "SELECT"
+        if is_select:
+            query, _ = cap_limit(strip_trailing(query), max_rows + 1)
+        
+        bounded = _BoundedRows(max_rows, _get_setting("max_result_mb") * 1024 * 1024)
+        with self.engine.connect() as conn:
+            result = conn.execute(text(query))
+            bounded.columns = list(result.keys())
+            for batch in result.partitions(_get_setting("fetch_size")):
+                bounded.add(batch)
+            
+            df = bounded.to_frame()
+            if bounded.total > max_rows:
+                # 数据库端已截断，真实总行数未知，用 EXPLAIN 的估算行数提示结果规模
+                df.attrs['total_rows'] = None
+                df.attrs['estimated_rows'] = self._estimate_rows(conn, original, max_rows) if is_select else None
+        return df
+    
+    @staticmethod
+    def _estimate_rows(conn, query: str, max_rows: int) -> Optional[int]:
+        """EXPLAIN 估算的行数（不超过查询自身的 LIMIT），EXPLAIN 失败时返回 None"""
+        try:
+            rows = explain_query(conn, strip_trailing(query))["rows"]
+        except SQLAlchemyError:
+            return None
+        # 自动补上的 LIMIT max_rows + 1 只用于判断截断，不代表结果规模
+        limit = limit_rows(query)
+        if limit is not None and limit != max_rows + 1:
+            return min(rows, limit)
+        return rows
+    
+    def prepare_query(self, query: str) -> tuple[str, bool]:
+        """
+        改写 LLM 生成的查询：补 LIMIT、加执行超时提示
+        
+        返回:
+            (改写后的查询, 是否自动补了 LIMIT)
+        """
+        limit = _get_setting("max_rows") + 1 if _get_setting("auto_limit") else None
+        return prepare_query(query, limit, _get_setting("statement_timeout_ms"))
+    
+    def check_cost(self, query: str) -> tuple[bool, str]:
+        """
+        执行前用 EXPLAIN 检查查询代价（结果已缓存的查询不检查）
+        
+        返回:
+            (是否允许执行, 拒绝时给 Agent 的修改建议)
+        """
+        if not _get_setting("cost_guard"):
+            return True, ""
+        if self.result_cache is not None and self.result_cache.contains(query):
+            return True, ""
+        
+        try:
+            with self.engine.connect() as conn:
+                return check_cost(conn, query, _get_setting("max_explain_rows"),
+                                  _get_setting("max_query_cost"))
+        except SQLAlchemyError as e:
+            # EXPLAIN 本身失败（如语法错误）时交给实际执行报告错误
+            print(f"⚠️  EXPLAIN 失败，跳过代价检查: {e}")
+            return True, ""
+    
     def get_tables(self) -> list:
         """获取数据库中所有表名"""
         query = "SHOW TABLES"
@@ -74,13 +238,16 @@ class SQLDatabase:
 
 # 全局数据库实例
 _db_instance: Optional[SQLDatabase] = None
+_db_lock = threading.Lock()
 
 
 def get_db() -> SQLDatabase:
-    """获取数据库单例"""
+    """获取数据库单例（多个请求线程同时首次调用时只创建一次）"""
     global _db_instance
     if _db_instance is None:
-        _db_instance = SQLDatabase()
+        with _db_lock:
+            if _db_instance is None:
+                _db_instance = SQLDatabase()
     return _db_instance
 
 
@@ -108,6 +275,69 @@ def is_safe_query(query: str) -> tuple[bool, str]:
     return True, "✅ 查询安全"
 
 
+def _format_query_result(df: pd.DataFrame, limit_added: bool) -> str:
+    """把查询结果格式化为给 Agent 的 Markdown 文本"""
+    # 如果结果为空
+    if df.empty:
+        return "查询结果为空，未找到匹配的数据。"
+    
+    # 转换为 Markdown 表格
+    markdown_table = df.to_markdown(index=False)
+    source = "（缓存结果）" if df.attrs.get('cached') else ""
+    result = f"查询成功{source}！共返回 {len(df)} 行数据：\n\n{markdown_table}"
+    
+    if df.attrs.get('truncated'):
+        if df.attrs.get('total_rows') is None:
+            total = f"超过 {len(df)} 行"
+            estimated = df.attrs.get('estimated_rows')
+            if estimated and estimated > len(df):
+                total += f"（EXPLAIN 估算约 {int(estimated):,} 行，仅供参考）"
+            if limit_added:
+                total += "（已自动限制 LIMIT）"
+        else:
+            total = f"共 {df.attrs['total_rows']} 行"
+        result = (
+            f"查询成功{source}！结果{total}，已截断，仅显示前 {len(df)} 行：\n\n"
+            f"{markdown_table}\n\n"
+            f"⚠️ 结果过多。如需统计请使用 GROUP BY / COUNT 等聚合查询，或添加 WHERE / LIMIT 缩小范围。"
+        )
+    
+    return result
+
+
+def _format_query_error(e: Exception) -> str:
+    """把查询异常格式化为给 Agent 的提示"""
+    if isinstance(e, SQLAlchemyError):
+        if "maximum statement execution time exceeded" in str(e):
+            return (f"查询超时（超过 {_get_setting('statement_timeout_ms') / 1000:g} 秒），已被数据库中止。\n\n"
+                    f"请缩小查询范围：添加 WHERE 过滤条件、补全 JOIN 关联条件，或先聚合再关联。")
+        return f"SQL 执行错误: {str(e)}\n\n请检查 SQL 语法是否正确。"
+    return f"未知错误: {str(e)}"
+
+
+def run_sql_query_md(query: str) -> str:
+    """执行 SQL 查询并返回 Markdown 结果"""
+    try:
+        # 安全性检查
+        is_safe, message = is_safe_query(query)
+        if not is_safe:
+            return f"错误: {message}\n\n请只使用 SELECT 语句查询数据。"
+        
+        # 补 LIMIT 和超时提示，再用 EXPLAIN 检查代价
+        db = get_db()
+        query, limit_added = db.prepare_query(query)
+        allowed, feedback = db.check_cost(query)
+        if not allowed:
+            return feedback
+        
+        # 执行查询
+        df = db.execute_query(query)
+        return _format_query_result(df, limit_added)
+        
+    except Exception as e:
+        return _format_query_error(e)
+
+
 @tool("sql_query_md")
 def sql_query_md(query: str) -> str:
     """
@@ -122,30 +352,7 @@ def sql_query_md(query: str) -> str:
     示例:
         SELECT * FROM customers LIMIT 10
     """
-    try:
-        # 安全性检查
-        is_safe, message = is_safe_query(query)
-        if not is_safe:
-            return f"错误: {message}\n\n请只使用 SELECT 语句查询数据。"
-        
-        # 执行查询
-        db = get_db()
-        df = db.execute_query(query)
-        
-        # 如果结果为空
-        if df.empty:
-            return "查询结果为空，未找到匹配的数据。"
-        
-        # 转换为 Markdown 表格
-        markdown_table = df.to_markdown(index=False)
-        result = f"查询成功！共返回 {len(df)} 行数据：\n\n{markdown_table}"
-        
-        return result
-        
-    except SQLAlchemyError as e:
-        return f"SQL 执行错误: {str(e)}\n\n请检查 SQL 语法是否正确。"
-    except Exception as e:
-        return f"未知错误: {str(e)}"
+    return run_sql_query_md(query)
 
 
 @tool("get_database_schema")